@@ -0,0 +1,652 @@
+import sys
+import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import threading
+import contextlib
+from engine import Pacer
+from profiler import NULL_PROFILER
+from mobility import ip_to_int
+from traffic import TrafficSource
+import headless
+
+# Asyncio engine for live runs.
+#
+# Every tower and every traffic source is an asyncio task instead of an
+# entry in a loop, and they all share one VirtualClock. Traffic tasks sleep
+# on the clock until their next arrival and put it on the arrivals queue.
+# Tower tasks wait for the start of a round of the tower loop, take in the
+# packets their neighbors forwarded to them (their asyncio.Queue inbox) and
+# transmit one packet. Forwards only reach the neighbor in the next round,
+# like in the engine's deferred mode, so the order the tasks run in doesn't
+# matter: with a deferred Simulation (and realtime off) the results are the
+# same as EventEngine's.
+#
+# Thousands of towers/UEs are fine, tasks are just a few hundred bytes and
+# there are no per-entity threads. Commands (move a UE, take a tower down, change a
+# UE's traffic, ...) can be submitted while it runs, from the same event
+# loop, another thread or over TCP, and are applied between timesteps.
+#
+# Example:
+#   python async_engine.py --scenario city.bin --deferred --speed 10 --port 7000
+#   echo '{"cmd": "outage", "tower": 3, "duration": 20}' | nc localhost 7000
+
+#Parameters
+SPEED = 1.0 # simulated seconds per wall clock second
+
+#Virtual Clock Class
+# Simulated time (in timesteps) shared by the engine's tasks. Tasks await
+# wait_until(t), advance(t) wakes every task due by t and only returns once
+# they have all parked again (awaited the clock) or finished. Clock tasks
+# must not await anything but the clock.
+class VirtualClock:
+    def __init__(self, now=0):
+        self.now = now
+        self.heap = []        # (t, seq, future, task)
+        self._seq = 0
+        self._woken = set()   # tasks running since the last advance()
+        self._settled = None
+
+    # Start a task that waits on the clock. It counts as woken, so the
+    # next advance() lets it run up to its first wait.
+    def spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._wake(task)
+        return task
+
+    def _wake(self, task):
+        self._woken.add(task)
+        task.add_done_callback(self._finished)
+
+    def _park(self, task):
+        if task in self._woken:
+            self._woken.discard(task)
+            task.remove_done_callback(self._finished)
+            if not self._woken and self._settled is not None:
+                self._settled.set()
+
+    def _finished(self, task):
+        self._woken.discard(task)
+        if not self._woken and self._settled is not None:
+            self._settled.set()
+
+    def wait_until(self, t):
+        fut = asyncio.get_running_loop().create_future()
+        if t <= self.now:
+            fut.set_result(None)
+            return fut
+        task = asyncio.current_task()
+        heapq.heappush(self.heap, (t, self._seq, fut, task))
+        self._seq += 1
+        self._park(task)
+        return fut
+
+    # Time of the earliest waiting task (None if nobody waits)
+    def next_time(self):
+        heap = self.heap
+        while heap and heap[0][2].cancelled():
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    async def advance(self, t):
+        self.now = t
+        heap = self.heap
+        while heap and heap[0][0] <= t:
+            _, _, fut, task = heapq.heappop(heap)
+            if fut.cancelled():
+                continue
+            fut.set_result(None)
+            self._wake(task)
+        await self.settle()
+
+    # Let the woken (or just spawned) tasks run until they wait again
+    async def settle(self):
+        if self._woken:
+            self._settled = asyncio.Event()
+            await self._settled.wait()
+            self._settled = None
+
+#Async Engine Class
+class AsyncEngine:
+    def __init__(self, sim, realtime=True, speed=SPEED, skip_idle=True):
+        self.sim = sim
+        self.realtime = realtime
+        self.pacer = Pacer(speed)
+        self.skip_idle = skip_idle
+        self.clock = VirtualClock(sim.t_step - 1)
+        self.n_events = 0      # commands applied
+        self.n_steps = 0
+        self.n_skipped = 0
+        self.tower_by_ip = {t.ip_addr: t for t in sim.towers}
+        self.ue_by_ip = {ue.ip_addr: ue for ue in sim.ues}
+        self.commands = None   # asyncio.Queue of (command, reply future)
+        self.arrivals = None   # asyncio.Queue of (ue, n_bytes, dest_ip)
+        self.inbox = {}        # tower -> asyncio.Queue of forwarded packets
+        self.sources = {}      # ue -> (source, task)
+        self.pending = {}      # ue -> next (t_step, n_bytes, dest_ip) of its source
+        self.outages = []      # (tower, start, duration) waiting for run()
+        self.processes = []    # outage.OutageProcess waiting for run()
+        # With nothing left to happen and no n_steps limit, wait for a
+        # command (True) or end the run (False, nobody can send one)
+        self.wait_for_commands = True
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+        self._stopped = False
+        self._running = False
+        self._busy = 0         # tower tasks still working on this round
+        self._round_tx = 0
+        self._round_done = None
+
+    @property
+    def now(self):
+        return self.sim.t_step
+
+    # ------------------------------------------------------------------
+    # Tasks
+    # ------------------------------------------------------------------
+    async def _traffic_task(self, ue, source, item):
+        clock = self.clock
+        while item is not None:
+            self.pending[ue] = item
+            await clock.wait_until(item[0])
+            self.arrivals.put_nowait((ue, item[1], item[2]))
+            item = source.next_arrival()
+        self.pending.pop(ue, None)
+
+    async def _tower_task(self, tower, inbox, go):
+        simulate_noise = self.sim.simulate_noise
+        while True:
+            await go.wait()
+            go.clear()
+            while not inbox.empty():
+                tower.receive(inbox.get_nowait())
+            if tower.operational and tower.can_transmit():
+                tower.step(simulate_noise)
+                self._round_tx += 1
+            self._busy -= 1
+            if self._busy == 0:
+                self._round_done.set()
+
+    async def _outage_task(self, tower, start, duration):
+        await self.clock.wait_until(start)
+        self.sim.set_tower_status(tower, False)
+        await self.clock.wait_until(start + duration)
+        self.sim.set_tower_status(tower, True)
+
+    async def _outage_process_task(self, process):
+        clock = self.clock
+        while True:
+            t_step = process.next_time()
+            if t_step is None:
+                return
+            await clock.wait_until(t_step)
+            process.apply(self.sim, t_step)
+
+    # Backhaul hook of every tower: queue for the neighbor's next round
+    def _forward(self, tower, neighbor, packet):
+        self.inbox[neighbor].put_nowait(packet)
+
+    def _start(self):
+        sim = self.sim
+        self._loop = asyncio.get_running_loop()
+        self.commands = asyncio.Queue()
+        self.arrivals = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._round_done = asyncio.Event()
+        self._stopped = False
+        self._running = True
+        self.clock.now = sim.t_step - 1
+
+        self._towers = []
+        for tower in sim.towers:
+            inbox = asyncio.Queue()
+            go = asyncio.Event()
+            self.inbox[tower] = inbox
+            tower.backhaul = self._forward
+            self._towers.append((tower, inbox, go))
+            self._tasks.append(self._loop.create_task(self._tower_task(tower, inbox, go)))
+
+        # The traffic sources move out of the scheduler for the run
+        if sim.traffic is not None:
+            for ue in list(sim.traffic.sources):
+                source, item = sim.traffic.take(ue)
+                self._run_source(ue, source, item)
+
+        for tower, start, duration in self.outages:
+            self._tasks.append(self.clock.spawn(self._outage_task(tower, start, duration)))
+        self.outages = []
+        for process in self.processes:
+            self._tasks.append(self.clock.spawn(self._outage_process_task(process)))
+        self.processes = []
+
+    def _run_source(self, ue, source, item):
+        task = self.clock.spawn(self._traffic_task(ue, source, item)) if item is not None else None
+        self.sources[ue] = (source, task)
+
+    async def _stop(self):
+        sim = self.sim
+        self._running = False
+        tasks = [t for t in self._tasks if not t.done()]
+        tasks += [task for _, task in self.sources.values() if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+        for tower in sim.towers:
+            tower.backhaul = sim._defer_forward if sim.deferred else None
+        if sim.traffic is not None:
+            for ue, (source, _) in self.sources.items():
+                sim.traffic.put(ue, source, self.pending.get(ue))
+        self.sources = {}
+        self.pending = {}
+        self._reject_commands()
+
+    # ------------------------------------------------------------------
+    # One timestep (same phases as Simulation.step)
+    # ------------------------------------------------------------------
+    async def _step(self):
+        sim = self.sim
+        prof = sim.profiler or NULL_PROFILER
+        prof.begin()
+        sim.begin_step()
+        await self.clock.advance(sim.t_step)
+        prof.lap("begin", len(sim.ues))
+        n_arrivals = self.arrivals.qsize()
+        self._take_arrivals()
+        prof.lap("traffic", n_arrivals, n_arrivals)
+        sim.step_ues()
+        prof.lap("ues", len(sim.ues), sim.ue_tx_count)
+        sim.tx_count = await self._tower_rounds()
+        prof.lap("towers", sim.tx_count, sim.tx_count)
+        n_attaches = len(sim.attaches)
+        sim.exchange()
+        prof.lap("exchange", n_attaches, 0)
+        sim.end_step()
+        prof.lap("observers", len(sim.observers), 0)
+        sim.move()
+        prof.lap("move", len(sim.moved) if sim.moved else 0, 0)
+        sim.t_step += 1
+        self.n_steps += 1
+        prof.end()
+
+    def _take_arrivals(self):
+        arrivals = self.arrivals
+        traffic = self.sim.traffic
+        while not arrivals.empty():
+            ue, n_bytes, dest_ip = arrivals.get_nowait()
+            ue.set_tx_bytes(n_bytes, dest_ip)
+            if traffic is not None:
+                traffic.n_arrivals += 1
+                traffic.n_bytes += n_bytes
+
+    # Rounds of the tower loop until no tower transmits anymore
+    async def _tower_rounds(self):
+        tx_count = 0
+        while True:
+            kicked = 0
+            for tower, inbox, go in self._towers:
+                if not inbox.empty() or (tower.operational and tower.can_transmit()):
+                    go.set()
+                    kicked += 1
+            if kicked == 0:
+                break
+            self._busy = kicked
+            self._round_tx = 0
+            self._round_done.clear()
+            await self._round_done.wait()
+            if self._round_tx == 0:
+                break
+            tx_count += self._round_tx
+        return tx_count
+
+    def _is_idle(self):
+        return self.arrivals.empty() and self.sim.is_idle()
+
+    # ------------------------------------------------------------------
+    # Waiting between timesteps
+    # ------------------------------------------------------------------
+    # Sleep until the wall clock reaches timestep t_step. With
+    # interruptible, a command ends the wait early.
+    async def _sleep_until(self, t_step, interruptible):
+        if t_step is None:
+            delay = None
+        else:
+            delay = self.pacer.delay(t_step * self.sim.t_delta)
+            if delay <= 0:
+                return
+        if not interruptible:
+            await asyncio.sleep(delay)
+            return
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+
+    # Timestep to run next, or None if the run is over. The first
+    # timestep of a run always executes (like EventEngine).
+    async def _next_step(self, end, first=False):
+        sim = self.sim
+        await self.clock.settle() # new tasks register their first wait
+        t_next = sim.t_step
+        idle = self.skip_idle and not first and self._is_idle() and self.commands.empty()
+        if idle:
+            t_next = self.clock.next_time()
+            if t_next is not None:
+                t_next = max(t_next, sim.t_step)
+        if end is not None and (t_next is None or t_next > end):
+            t_next = end
+        if t_next is None and not self.wait_for_commands and self.commands.empty():
+            return None
+
+        if self.realtime:
+            await self._sleep_until(t_next, idle)
+            if idle and not self.commands.empty():
+                # Woken up by a command: run the timestep that is due now
+                t_now = int(self.pacer.sim_time() / sim.t_delta)
+                t_next = max(sim.t_step, min(t_now, t_next if t_next is not None else t_now))
+        elif t_next is None:
+            # Nothing will ever happen again unless a command comes in
+            await self._wakeup.wait()
+            t_next = sim.t_step
+
+        self.n_skipped += sim.skip_to(t_next)
+        if end is not None and sim.t_step >= end:
+            return None
+        return t_next
+
+    # Run until n_steps timesteps have passed (forever if None) or a stop
+    # command comes in. Without n_steps a run that has nothing left to do
+    # ends too, unless wait_for_commands is set.
+    async def run(self, n_steps=None):
+        sim = self.sim
+        end = None if n_steps is None else sim.t_step + n_steps
+        self._start()
+        self.pacer.reset(sim.now)
+        try:
+            first = True
+            while await self._next_step(end, first) is not None:
+                first = False
+                self._apply_commands()
+                if self._stopped:
+                    break
+                await self._step()
+        finally:
+            await self._stop()
+
+    # ------------------------------------------------------------------
+    # Live commands
+    # ------------------------------------------------------------------
+    # Queue a command (a dict, see apply()) for the next timestep. Returns
+    # a future with the command's result.
+    def submit(self, command):
+        if not self._running:
+            raise RuntimeError("engine is not running")
+        fut = self._loop.create_future()
+        self.commands.put_nowait((command, fut))
+        self._wakeup.set()
+        return fut
+
+    # Same as submit() from another thread (e.g. a GUI). Returns a
+    # concurrent.futures.Future.
+    def submit_threadsafe(self, command):
+        async def submit():
+            return await self.submit(command)
+        return asyncio.run_coroutine_threadsafe(submit(), self._loop)
+
+    def _apply_commands(self):
+        self._wakeup.clear()
+        commands = self.commands
+        while not commands.empty():
+            command, fut = commands.get_nowait()
+            try:
+                result = self.apply(command)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                if not fut.done():
+                    fut.set_result(result)
+            self.n_events += 1
+
+    def _reject_commands(self):
+        while self.commands is not None and not self.commands.empty():
+            _, fut = self.commands.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("engine stopped"))
+
+    def _lookup(self, table, ip, what):
+        if isinstance(ip, str):
+            ip = ip_to_int(ip) if "." in ip else int(ip)
+        if ip not in table:
+            raise ValueError(f"No {what} with IP {ip}")
+        return table[ip]
+
+    # Apply one command right away. Commands are dicts with a "cmd" key:
+    #   {"cmd": "move", "ue": ip, "x": 100.0, "y": 250.0}
+    #   {"cmd": "outage", "tower": ip, "duration": 20}  (timesteps)
+    #   {"cmd": "tower", "tower": ip, "up": false}
+    #   {"cmd": "traffic", "ue": ip, "kind": "cbr", "dest": ip or [ips], "interval": 2}
+    #   {"cmd": "traffic", "ue": ip, "kind": null}  (stop its traffic)
+    #   {"cmd": "status"}
+    #   {"cmd": "stop"}
+    # IPs are ints or dotted strings.
+    def apply(self, command):
+        cmd = command.get("cmd")
+        if cmd == "move":
+            ue = self._lookup(self.ue_by_ip, command["ue"], "UE")
+            self.move_ue(ue, float(command["x"]), float(command["y"]))
+        elif cmd == "outage":
+            tower = self._lookup(self.tower_by_ip, command["tower"], "tower")
+            self.schedule_outage(tower, self.sim.t_step, int(command["duration"]))
+        elif cmd == "tower":
+            tower = self._lookup(self.tower_by_ip, command["tower"], "tower")
+            self.sim.set_tower_status(tower, bool(command["up"]))
+        elif cmd == "traffic":
+            ue = self._lookup(self.ue_by_ip, command["ue"], "UE")
+            params = {k: v for k, v in command.items() if k not in ("cmd", "ue", "kind", "dest", "seed", "start")}
+            source = None
+            if command.get("kind") is not None:
+                dest = command.get("dest")
+                if dest is None:
+                    dest = [ip for ip in self.ue_by_ip if ip != ue.ip_addr]
+                elif isinstance(dest, list):
+                    dest = [self._lookup(self.ue_by_ip, ip, "UE").ip_addr for ip in dest]
+                else:
+                    dest = self._lookup(self.ue_by_ip, dest, "UE").ip_addr
+                start = self.sim.t_step + int(command.get("start", 0))
+                source = TrafficSource(command["kind"], dest, seed=command.get("seed"), start=start, **params)
+            self.set_source(ue, source)
+        elif cmd == "status":
+            return self.status()
+        elif cmd == "stop":
+            self._stopped = True
+        else:
+            raise ValueError(f"Unknown command {cmd!r}")
+        return None
+
+    def move_ue(self, ue, x, y):
+        ue.x_pos = x
+        ue.y_pos = y
+        # Make sure the radio model picks up the jump this step
+        if self.sim.moved is not None and ue not in self.sim.moved:
+            self.sim.moved = list(self.sim.moved) + [ue]
+
+    # Tower outage from start for duration timesteps. Before run() the
+    # outage is kept until the run starts.
+    def schedule_outage(self, tower, start, duration):
+        if not self._running:
+            self.outages.append((tower, start, duration))
+            return
+        self._tasks.append(self.clock.spawn(self._outage_task(tower, start, duration)))
+
+    # Stochastic outages (outage.OutageProcess) from now on. Before run()
+    # the process waits for the run to start.
+    def add_outage_process(self, process):
+        process.start(self.sim.t_step)
+        if not self._running:
+            self.processes.append(process)
+            return
+        self._tasks.append(self.clock.spawn(self._outage_process_task(process)))
+
+    # Replace (or with None remove) the traffic source of a UE
+    def set_source(self, ue, source):
+        old = self.sources.pop(ue, None)
+        if old is not None and old[1] is not None:
+            old[1].cancel()
+        self.pending.pop(ue, None)
+        if source is not None:
+            self._run_source(ue, source, source.next_arrival())
+
+    def status(self):
+        sim = self.sim
+        return {
+            "t_step"       : sim.t_step,
+            "sim_time"     : sim.now,
+            "active_towers": [t.ip_addr for t in sim.active_towers],
+            "tower_buffer" : sum(len(t.buffer) for t in sim.towers),
+            "ue_buffer"    : sum(len(ue.buffer) for ue in sim.ues),
+            "steps_run"    : self.n_steps,
+            "steps_skipped": self.n_skipped,
+        }
+
+# ----------------------------------------------------------------------
+# Command inputs
+# ----------------------------------------------------------------------
+# One JSON command per line, one JSON reply per line
+async def _handle_line(engine, line):
+    try:
+        result = await engine.submit(json.loads(line))
+        return {"ok": True, "result": result}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+# TCP command server (see the example at the top)
+async def serve_commands(engine, host="127.0.0.1", port=7000):
+    async def client(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    reply = await _handle_line(engine, line)
+                    writer.write((json.dumps(reply) + "\n").encode())
+                    await writer.drain()
+        finally:
+            writer.close()
+    return await asyncio.start_server(client, host, port)
+
+# Commands from a text stream (stdin). Reading blocks, so it gets its own
+# daemon thread (which dies with the process, whatever it is blocked on).
+def read_commands(engine, stream, out=sys.stderr):
+    loop = asyncio.get_running_loop()
+    def reader():
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                reply = asyncio.run_coroutine_threadsafe(_handle_line(engine, line), loop).result()
+            except RuntimeError:
+                break # loop closed
+            print(json.dumps(reply), file=out)
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    return thread
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+def make_parser():
+    parser = headless.make_parser()
+    parser.description = "Run the 5G network simulator live on the asyncio engine."
+    parser.set_defaults(steps=None)
+    parser.add_argument("--speed", type=float, default=SPEED, help="simulated seconds per wall clock second")
+    parser.add_argument("--no-realtime", action="store_true", help="run as fast as possible")
+    parser.add_argument("--port", type=int, default=None, help="accept JSON line commands on this TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--stdin", action="store_true", help="read JSON line commands from stdin")
+    return parser
+
+async def run_live(args):
+    sim, outages = headless.build_simulation(args)
+    collector = headless.MetricsCollector(sim)
+    sim.observers.append(collector)
+    engine = AsyncEngine(sim, realtime=not args.no_realtime, speed=args.speed, skip_idle=not args.no_skip_idle)
+    engine.wait_for_commands = args.port is not None or args.stdin
+    for tower, start, duration in outages:
+        engine.schedule_outage(tower, start, duration)
+    process = headless.start_outages(args, sim)
+    if process is not None:
+        engine.add_outage_process(process)
+    capture = headless.start_capture(args, sim)
+    log = headless.start_event_log(args, sim)
+    registry = headless.start_metrics(args, sim)
+    profiler = headless.start_profiler(args, sim)
+    tracker = headless.start_latency(args, sim)
+
+    run = asyncio.get_running_loop().create_task(engine.run(args.steps))
+    await asyncio.sleep(0) # let the engine start before commands come in
+    inputs = []
+    if args.port is not None:
+        server = await serve_commands(engine, args.host, args.port)
+        inputs.append(server)
+        print(f"Listening for commands on {args.host}:{args.port}", file=sys.stderr)
+    if args.stdin:
+        read_commands(engine, sys.stdin)
+
+    start = time.perf_counter()
+    try:
+        await run
+    finally:
+        for server in inputs:
+            server.close()
+        if capture is not None:
+            capture.close()
+        if log is not None:
+            log.close()
+        if tracker is not None:
+            tracker.close()
+    wall = time.perf_counter() - start
+    metrics = headless._metrics(collector, sim, engine, wall)
+    if capture is not None:
+        metrics["capture"] = capture.stats()
+    if log is not None:
+        metrics["event_log"] = log.stats()
+    if registry is not None:
+        metrics["time_series"] = headless.finish_metrics(args, sim, registry)
+    if tracker is not None:
+        metrics["latency"] = tracker.report()
+    if process is not None:
+        metrics["outages"] = process.stats()
+    if profiler is not None:
+        sim.profiler = None
+        metrics["profile"] = profiler.report()
+    return metrics
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    if args.regions > 0 or args.resume is not None or args.checkpoint_out is not None:
+        raise SystemExit("--regions/--resume/--checkpoint-out are not supported by the async engine")
+
+    # The Tower/UE noise model uses the global RNG
+    random.seed(args.seed)
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        metrics = asyncio.run(run_live(args))
+
+    metrics["config"] = vars(args)
+    text = json.dumps(metrics, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import contextlib
+import argparse
+import itertools
+import subprocess
+import multiprocessing
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+import headless
+from engine import Simulation
+
+# Scaling benchmark of the simulation engine. Builds synthetic scenarios
+# (hex grid of towers, UEs uniform over it, every UE sending to a random
+# peer every step like the GUI's fixed/random/max transmit modes), runs a
+# fixed number of steps headless and reports steps/sec, packets/sec
+# (tower transmissions) and peak memory per case. Every case runs in a
+# fresh process so the peak RSS is its own. Results go to a JSON file
+# together with the commit they were measured at; --compare prints the
+# ratios against such a file from an earlier commit.
+#
+# Example:
+#   python benchmark.py --preset quick --out bench.json
+#   python benchmark.py --towers 10,100,1000 --ues 100,10000 --traffic fixed,max --noise off,on \
+#       --steps 50 --budget 60 --out bench_new.json --compare bench.json
+
+#Parameters
+STEPS         = 50
+WARMUP        = 5
+ABORT_GRACE   = 30.0  # seconds past --budget (building the case included) before a case is killed
+FIXED_BYTES   = 512   # GUI default message size of the fixed mode
+RANDOM_BYTES  = 65535 # random mode sends 1..RANDOM_BYTES bytes
+TRAFFIC_MODES = ("fixed", "random", "max")
+PRESETS = {
+    "quick"   : {"towers": [10, 50], "ues": [10, 100], "traffic": ["fixed"], "noise": [False]},
+    "default" : {"towers": [10, 100, 1000], "ues": [10, 1000, 10000], "traffic": list(TRAFFIC_MODES), "noise": [False, True]},
+    "full"    : {"towers": [10, 100, 1000, 5000], "ues": [10, 1000, 10000, 100000], "traffic": list(TRAFFIC_MODES), "noise": [False, True]},
+}
+
+#Step Traffic Class
+# The GUI transmit modes for every UE: each step the UE gets a new message
+# for its peer, FIXED_BYTES long, random length, or as much as its current
+# data rate allows (max). Plugs into Simulation like a TrafficScheduler.
+class StepTraffic:
+    def __init__(self, mode, ues, rng):
+        if mode not in TRAFFIC_MODES:
+            raise ValueError(f"Unknown traffic mode {mode!r}, expected one of {', '.join(TRAFFIC_MODES)}")
+        self.mode = mode
+        self.rng = rng
+        self.flows = []
+        for i, ue in enumerate(ues):
+            j = rng.randrange(len(ues) - 1) if len(ues) > 1 else i
+            if j >= i and len(ues) > 1:
+                j += 1
+            self.flows.append((ue, ues[j].ip_addr))
+        self.n_arrivals = 0
+        self.n_bytes = 0
+
+    def step(self, t_step):
+        mode = self.mode
+        randint = self.rng.randint
+        for ue, dest_ip in self.flows:
+            if mode == "fixed":
+                n_bytes = FIXED_BYTES
+            elif mode == "random":
+                n_bytes = randint(1, RANDOM_BYTES)
+            else:
+                n_bytes = int(ue.max_data_rate * ue.code_rate * ue.t_delta / 8.0)
+                if n_bytes <= 0:
+                    continue # not attached
+            ue.set_tx_bytes(n_bytes, dest_ip)
+            self.n_arrivals += 1
+            self.n_bytes += n_bytes
+
+# Name of a case, used to match results across runs
+def case_key(case):
+    return f"hex-{case['towers']}t-{case['ues']}u-{case['traffic']}-{'noise' if case['noise'] else 'clean'}"
+
+# Every combination of the matrix values
+def make_cases(towers, ues, traffic, noise, seed=0):
+    return [{"towers": t, "ues": u, "traffic": m, "noise": n, "seed": seed}
+            for t, u, m, n in itertools.product(towers, ues, traffic, noise)]
+
+def build_case(case):
+    rng = random.Random(case["seed"])
+    towers, ues = headless.hex_topology(case["towers"], case["ues"], headless.T_DELTA, rng)
+    # Same flood control as headless
+    for tower in towers:
+        tower.tx_attempts = len(towers)
+    traffic = StepTraffic(case["traffic"], ues, rng)
+    return Simulation(towers, ues, headless.T_DELTA, simulate_noise=case["noise"], traffic=traffic)
+
+# Peak resident set size of this process in MB (None where unsupported)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / (1 << 10)
+
+# Worker: build and run one case. Stepping (warmup included) stops early
+# once budget seconds have passed; the rates then cover the timed steps
+# that did run.
+def run_case(case, steps=STEPS, warmup=WARMUP, budget=None):
+    # The towers/UEs print their attaches, like headless we drop stdout
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        return _run_case(case, steps, warmup, budget)
+
+def _run_case(case, steps, warmup, budget):
+    random.seed(case["seed"]) # noise uses the global RNG outside deferred mode
+    start = time.perf_counter()
+    sim = build_case(case)
+    build_time = time.perf_counter() - start
+    rss_built = peak_rss_mb()
+
+    deadline = time.perf_counter() + budget if budget is not None else None
+    for _ in range(warmup):
+        sim.step()
+        if deadline is not None and time.perf_counter() > deadline:
+            steps = 0 # no time left to time anything
+            break
+
+    traffic = sim.traffic
+    arrivals, offered = traffic.n_arrivals, traffic.n_bytes
+    n_steps = 0
+    packets = 0
+    start = time.perf_counter()
+    while n_steps < steps:
+        sim.step()
+        packets += sim.tx_count
+        n_steps += 1
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    wall = time.perf_counter() - start
+
+    return {
+        "key"            : case_key(case),
+        "case"           : case,
+        "build_time"     : build_time,
+        "steps"          : n_steps,
+        "wall_time"      : wall,
+        "steps_per_sec"  : n_steps / wall if n_steps and wall > 0 else None,
+        "packets"        : packets,
+        "packets_per_sec": packets / wall if n_steps and wall > 0 else None,
+        "messages"       : traffic.n_arrivals - arrivals,
+        "offered_bytes"  : traffic.n_bytes - offered,
+        "build_rss_mb"   : rss_built,
+        "peak_rss_mb"    : peak_rss_mb(),
+        "truncated"      : n_steps < steps,
+        "failed"         : None,
+    }
+
+# Result of a case whose worker was killed (a single step ran far past
+# the budget) or raised
+def failed_result(case, reason):
+    return {
+        "key": case_key(case), "case": case, "build_time": None, "steps": 0, "wall_time": None,
+        "steps_per_sec": None, "packets": 0, "packets_per_sec": None, "messages": 0, "offered_bytes": 0,
+        "build_rss_mb": None, "peak_rss_mb": None, "truncated": True, "failed": reason,
+    }
+
+# Run every case in its own fresh process, one after another (so the
+# timings don't compete for CPUs). With a budget, a case that hasn't
+# finished ABORT_GRACE seconds past it (counted from the start of the
+# case, building included) is killed and recorded as failed.
+# on_result(result) after each case.
+def run_benchmark(cases, steps=STEPS, warmup=WARMUP, budget=None, on_result=None):
+    ctx = multiprocessing.get_context("spawn")
+    timeout = budget + ABORT_GRACE if budget is not None else None
+    results = []
+    for case in cases:
+        pool = ctx.Pool(processes=1)
+        try:
+            result = pool.apply_async(run_case, (case, steps, warmup, budget)).get(timeout)
+            pool.close()
+        except multiprocessing.TimeoutError:
+            result = failed_result(case, f"killed after {timeout:.0f} s")
+        except Exception as e:
+            result = failed_result(case, f"{type(e).__name__}: {e}")
+        finally:
+            pool.terminate()
+            pool.join()
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+    return results
+
+# Short hash of the checked out commit (+ "-dirty"), None outside git
+def git_commit():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + "-dirty" if dirty else commit
+
+# Ratios new / old of the rates and memory of the cases both runs have
+def compare(results, baseline):
+    old = {r["key"]: r for r in baseline["results"]}
+    rows = []
+    for r in results:
+        b = old.get(r["key"])
+        if b is None:
+            continue
+        row = {"key": r["key"]}
+        for name in ("steps_per_sec", "packets_per_sec", "peak_rss_mb"):
+            row[name] = r[name] / b[name] if r[name] is not None and b[name] else None
+        rows.append(row)
+    return {"baseline": baseline["meta"].get("commit"), "cases": rows}
+
+def format_comparison(comparison):
+    lines = [f"vs {comparison['baseline']}", f"{'case':<36}{'steps/s':>10}{'pkt/s':>10}{'peak mem':>10}"]
+    for row in comparison["cases"]:
+        cells = [f"{row[n]:.2f}x" if row[n] is not None else "-" for n in ("steps_per_sec", "packets_per_sec", "peak_rss_mb")]
+        lines.append(f"{row['key']:<36}{cells[0]:>10}{cells[1]:>10}{cells[2]:>10}")
+    return "\n".join(lines)
+
+# "10,100" -> [10, 100]
+def parse_ints(text):
+    return [int(v) for v in text.split(",")]
+
+# "off,on" -> [False, True]
+def parse_noise(text):
+    values = []
+    for v in text.split(","):
+        if v not in ("off", "on"):
+            raise ValueError(f"Expected off/on, got {v!r}")
+        values.append(v == "on")
+    return values
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the simulation engine.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="case matrix (overridden per dimension by the options below)")
+    parser.add_argument("--towers", default=None, help="tower counts, e.g. 10,100,1000")
+    parser.add_argument("--ues", default=None, help="UE counts, e.g. 10,1000,100000")
+    parser.add_argument("--traffic", default=None, help=f"transmit modes ({', '.join(TRAFFIC_MODES)})")
+    parser.add_argument("--noise", default=None, help="off, on or off,on")
+    parser.add_argument("--steps", type=int, default=STEPS, help="timed steps per case")
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="untimed steps before timing")
+    parser.add_argument("--budget", type=float, default=None, help="seconds a case may spend stepping, warmup included (rates cover the steps done by then); "
+                             f"a case not finished {ABORT_GRACE:g} s past it, building included, is killed and recorded as failed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="-", help="results JSON file (default: stdout)")
+    parser.add_argument("--compare", default=None, help="results JSON of an earlier run to compare against")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    preset = PRESETS[args.preset]
+    towers = parse_ints(args.towers) if args.towers else preset["towers"]
+    ues = parse_ints(args.ues) if args.ues else preset["ues"]
+    traffic = args.traffic.split(",") if args.traffic else preset["traffic"]
+    noise = parse_noise(args.noise) if args.noise else preset["noise"]
+    for mode in traffic:
+        if mode not in TRAFFIC_MODES:
+            raise SystemExit(f"Unknown traffic mode {mode!r}, expected one of {', '.join(TRAFFIC_MODES)}")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    cases = make_cases(towers, ues, traffic, noise, seed=args.seed)
+    count = [0]
+
+    def on_result(r):
+        count[0] += 1
+        if r["failed"]:
+            print(f"[{count[0]}/{len(cases)}] {r['key']}: FAILED ({r['failed']})", file=sys.stderr)
+            return
+        rss = f"{r['peak_rss_mb']:.1f} MB" if r["peak_rss_mb"] is not None else "n/a"
+        note = " (budget)" if r["truncated"] else ""
+        rates = (f"{r['steps_per_sec']:.2f} steps/s, {r['packets_per_sec']:.0f} pkt/s"
+                 if r["steps_per_sec"] is not None else "no timed steps")
+        print(f"[{count[0]}/{len(cases)}] {r['key']}: {rates}, {rss}{note}", file=sys.stderr)
+
+    results = run_benchmark(cases, steps=args.steps, warmup=args.warmup, budget=args.budget, on_result=on_result)
+    report = {
+        "meta": {
+            "commit" : git_commit(),
+            "date"   : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python" : platform.python_version(),
+            "machine": platform.machine(),
+            "system" : platform.platform(),
+            "steps"  : args.steps,
+            "warmup" : args.warmup,
+            "budget" : args.budget,
+            "seed"   : args.seed,
+        },
+        "results": results,
+    }
+    if baseline is not None:
+        report["comparison"] = compare(results, baseline)
+        print(format_comparison(report["comparison"]), file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import struct
+from mobility import ip_to_int
+
+# Packet capture to pcap files.
+#
+# The packet bytes built by UE.set_cust_data are real IPv4 packets, so they
+# can be written to pcap files (link type IPv4) and opened in Wireshark or
+# tcpdump. A capture target is one UE, one tower or one link:
+#
+#   ue:50       everything UE 50 sends and receives
+#   tower:1     everything tower 1 sends and accepts (UEs and backhaul)
+#   link:0-1    what goes between 0 and 1 (towers or a UE and a tower),
+#               seen from 0
+#
+# Only the entities of a target get a capture hook (Tower/UE .capture), all
+# others keep None and pay one attribute check per packet. The hook of an
+# entity is generated code with the filter expression and the target tests
+# inlined. Records are packed into a buffer and written in big chunks.
+# Timestamps are simulated time.
+#
+# Filter expressions (--capture-filter) combine with and/or/not/():
+#   data, ack, rx, tx, src IP, dst IP, host IP, peer IP, len < N (< > <= >= == !=)
+# e.g. "data and dst 51", "not ack and len > 1000", "rx and peer 0.0.0.2"
+
+#Parameters
+LINKTYPE_IPV4 = 228
+SNAPLEN       = 65535
+BUFFER_SIZE   = 1 << 20 # bytes buffered per file before writing
+
+PCAP_HEADER = struct.Struct("<IHHiIII")
+RECORD      = struct.Struct("<IIII")
+
+#Pcap Writer Class
+class PcapWriter:
+    def __init__(self, path, snaplen=SNAPLEN, buffer_size=BUFFER_SIZE):
+        self.path = path
+        self.snaplen = snaplen
+        self.buffer_size = buffer_size
+        self.n_packets = 0
+        self.n_bytes = 0
+        self.buf = bytearray(PCAP_HEADER.pack(0xA1B2C3D4, 2, 4, 0, 0, snaplen, LINKTYPE_IPV4))
+        self.file = open(path, "wb")
+
+    # t in seconds
+    def write(self, t, data):
+        sec = int(t)
+        usec = int((t - sec) * 1e6 + 0.5)
+        if usec >= 1000000:
+            sec += 1
+            usec -= 1000000
+        n = len(data)
+        incl = n if n <= self.snaplen else self.snaplen
+        buf = self.buf
+        buf += RECORD.pack(sec, usec, incl, n)
+        buf += data if incl == n else data[:incl]
+        self.n_packets += 1
+        self.n_bytes += n
+        if len(buf) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.file.write(self.buf)
+            self.buf = bytearray()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+# ----------------------------------------------------------------------
+# Filters
+# ----------------------------------------------------------------------
+def parse_ip(text):
+    return ip_to_int(text) if "." in text else int(text)
+
+_COMPARE = {"<", ">", "<=", ">=", "==", "!="}
+
+def _tokens(expr):
+    return expr.replace("(", " ( ").replace(")", " ) ").split()
+
+# Translate a filter expression into a Python expression over p (packet),
+# peer_ip and rx. Only the words above are accepted, anything else is a
+# ValueError, so the result is safe to compile.
+def filter_source(expr):
+    toks = _tokens(expr)
+    out = []
+    i = 0
+    try:
+        while i < len(toks):
+            tok = toks[i]
+            if tok in ("and", "or", "not", "(", ")"):
+                out.append(tok)
+            elif tok == "data":
+                out.append("p[2] == 1")
+            elif tok == "ack":
+                out.append("p[2] == 0")
+            elif tok == "rx":
+                out.append("rx")
+            elif tok == "tx":
+                out.append("(not rx)")
+            elif tok in ("src", "dst", "host", "peer"):
+                i += 1
+                ip = parse_ip(toks[i])
+                out.append({
+                    "src"  : f"p[4] == {ip}",
+                    "dst"  : f"p[5] == {ip}",
+                    "host" : f"(p[4] == {ip} or p[5] == {ip})",
+                    "peer" : f"peer_ip == {ip}",
+                }[tok])
+            elif tok == "len":
+                op, n = toks[i + 1], int(toks[i + 2])
+                if op not in _COMPARE:
+                    raise ValueError(f"Bad comparison {op!r}")
+                out.append(f"len(p[3]) {op} {n}")
+                i += 2
+            else:
+                raise ValueError(f"Unknown filter word {tok!r}")
+            i += 1
+    except IndexError:
+        raise ValueError(f"Incomplete filter {expr!r}") from None
+    source = " ".join(out)
+    try:
+        compile(source, "<capture filter>", "eval")
+    except SyntaxError:
+        raise ValueError(f"Bad filter {expr!r}") from None
+    return source
+
+# "ue:50" -> ("ue", 50, None), "link:0-1" -> ("link", 0, 1)
+def parse_target(text):
+    kind, sep, rest = text.partition(":")
+    if not sep or kind not in ("ue", "tower", "link"):
+        raise ValueError(f"Expected ue:IP, tower:IP or link:IP-IP, got {text!r}")
+    if kind == "link":
+        a, sep, b = rest.partition("-")
+        if not sep:
+            raise ValueError(f"Expected link:IP-IP, got {text!r}")
+        return kind, parse_ip(a), parse_ip(b)
+    return kind, parse_ip(rest), None
+
+#Capture Class
+class Capture:
+    def __init__(self, sim, filter_expr=None, snaplen=SNAPLEN, buffer_size=BUFFER_SIZE):
+        self.sim = sim
+        self.filter = filter_source(filter_expr) if filter_expr else None
+        self.snaplen = snaplen
+        self.buffer_size = buffer_size
+        self.targets = [] # (kind, ip, peer ip, writer)
+        self.hooked = []  # entities whose capture hook we set
+
+    # Start writing target ("ue:50", "tower:1", "link:0-1") to path
+    def add(self, target, path):
+        kind, ip, peer = parse_target(target)
+        entities = self.sim.ues if kind == "ue" else self.sim.towers if kind == "tower" else self.sim.ues + self.sim.towers
+        if not any(e.ip_addr == ip for e in entities):
+            raise ValueError(f"Nothing with IP {ip} to capture ({target})")
+        self.targets.append((kind, ip, peer, PcapWriter(path, self.snaplen, self.buffer_size)))
+
+    # Generated hook for one entity and its targets
+    def _hook(self, targets):
+        conds = []
+        env = {"sim": self.sim}
+        need_peer = self.filter is not None and "peer_ip" in self.filter
+        for i, (kind, _, peer, writer) in enumerate(targets):
+            env[f"w{i}"] = writer.write
+            cond = []
+            if self.filter is not None:
+                cond.append(f"({self.filter})")
+            if kind == "link":
+                cond.append(f"peer_ip == {peer}")
+                need_peer = True
+            conds.append((" and ".join(cond) or "True", f"w{i}"))
+
+        lines = ["def hook(peer, p, rx):",
+                 "    t = sim.t_step * sim.t_delta"]
+        if need_peer:
+            # Incoming tower packets carry the previous hop (thru IP, stamped
+            # by Tower.forward) when they come from a tower, otherwise they
+            # come from the source UE
+            lines.append("    peer_ip = peer.ip_addr if peer is not None else (p[9] if len(p) > 9 else p[4])")
+        for cond, w in conds:
+            if cond == "True":
+                lines.append(f"    {w}(t, p[3])")
+            else:
+                lines.append(f"    if {cond}:")
+                lines.append(f"        {w}(t, p[3])")
+        exec(compile("\n".join(lines), "<capture hook>", "exec"), env)
+        return env["hook"]
+
+    # Set the capture hooks of the captured entities
+    def install(self):
+        by_entity = {}
+        ues = set(self.sim.ues)
+        for entity in self.sim.towers + self.sim.ues:
+            for target in self.targets:
+                if target[1] == entity.ip_addr and (target[0] == "link" or (target[0] == "ue") == (entity in ues)):
+                    by_entity.setdefault(entity, []).append(target)
+        for entity, targets in by_entity.items():
+            entity.capture = self._hook(targets)
+            self.hooked.append(entity)
+
+    def stats(self):
+        return [{
+            "target"  : f"{kind}:{ip}" + (f"-{peer}" if peer is not None else ""),
+            "path"    : writer.path,
+            "packets" : writer.n_packets,
+            "bytes"   : writer.n_bytes,
+        } for kind, ip, peer, writer in self.targets]
+
+    # Remove the hooks and finish the files
+    def close(self):
+        for entity in self.hooked:
+            entity.capture = None
+        self.hooked = []
+        for target in self.targets:
+            target[3].close()
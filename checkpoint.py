@@ -0,0 +1,175 @@
+import io
+import sys
+import zlib
+import pickle
+import random
+import struct
+from array import array
+from tower import Tower
+from ue import UE
+
+# Snapshot / restore of a complete simulation: towers, UEs, their buffers
+# and in-flight packets, ARQ/handover counters, the radio, mobility and
+# traffic models, the event queue of an EventEngine and the global RNG
+# state. Restoring gives a run that continues exactly like the original.
+#
+# File layout:
+#   magic, header (version, compression level, blob section size, state size)
+#   blob section: n, n lengths, then the unique byte strings back to back
+#   state section: pickle stream
+#
+# Packet bytes are deduplicated by content: every bytes/bytearray is
+# replaced by an index into the blob table, so a packet sitting in a UE
+# buffer and in three tower buffers (or many identical packets) is stored
+# once. On restore equal packets share one object, which is fine because
+# packet bytes are never modified in place.
+#
+# Towers and UEs are pickled in two passes (empty shells first, then their
+# attributes) so long backhaul chains don't blow the recursion limit.
+
+#Parameters
+CKPT_MAGIC   = b"NETCKPT1"
+CKPT_HEADER  = struct.Struct("<IIQQ")
+CKPT_VERSION = 2 # 2: packets carry their origin timestep
+DEDUPE_MIN   = 16 # byte strings shorter than this are pickled inline
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, f, entities):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.entity_ids = {id(e) for e in entities}
+        self.blob_index = {} # content -> index
+        self.blobs = []
+
+    def persistent_id(self, obj):
+        t = type(obj)
+        if (t is bytes or t is bytearray) and len(obj) >= DEDUPE_MIN:
+            key = bytes(obj) if t is bytearray else obj
+            idx = self.blob_index.get(key)
+            if idx is None:
+                idx = len(self.blobs)
+                self.blob_index[key] = idx
+                self.blobs.append(key)
+            return (idx, t is bytearray)
+        return None
+
+    # Towers/UEs are saved as empty shells, their state follows later
+    def reducer_override(self, obj):
+        if id(obj) in self.entity_ids:
+            return object.__new__, (type(obj),)
+        return NotImplemented
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, f, blobs):
+        super().__init__(f)
+        self.blobs = blobs
+        self.arrays = {} # idx -> shared bytearray
+
+    def persistent_load(self, pid):
+        idx, is_array = pid
+        if not is_array:
+            return self.blobs[idx]
+        arr = self.arrays.get(idx)
+        if arr is None:
+            arr = self.arrays[idx] = bytearray(self.blobs[idx])
+        return arr
+
+def _pack_blobs(blobs):
+    lengths = array('Q', (len(b) for b in blobs))
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    return struct.pack("<Q", len(blobs)) + lengths.tobytes() + b"".join(blobs)
+
+def _unpack_blobs(data):
+    n, = struct.unpack_from("<Q", data)
+    lengths = array('Q')
+    lengths.frombytes(data[8:8 + 8 * n])
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    view = memoryview(data)
+    pos = 8 + 8 * n
+    blobs = []
+    for length in lengths:
+        blobs.append(bytes(view[pos:pos + length]))
+        pos += length
+    return blobs
+
+#Checkpoint Class
+# What restore() hands back
+class Checkpoint:
+    def __init__(self, sim, engine, extra, t_step, info):
+        self.sim = sim
+        self.engine = engine
+        self.extra = extra
+        self.t_step = t_step
+        self.info = info
+
+# Serialize a simulation (and optionally its EventEngine and any extra
+# picklable data) to bytes. level is the zlib level (0 = no compression).
+def snapshot(sim, engine=None, extra=None, level=1):
+    entities = list(sim.towers) + list(sim.ues)
+    f = io.BytesIO()
+    p = _Pickler(f, entities)
+    p.dump(entities)
+    p.dump({
+        "states"  : [e.__dict__ for e in entities],
+        "sim"     : sim,
+        "engine"  : engine,
+        "extra"   : extra,
+        "rng"     : random.getstate(),
+        "t_step"  : sim.t_step,
+    })
+    state = f.getvalue()
+    blobs = _pack_blobs(p.blobs)
+    if level > 0:
+        state = zlib.compress(state, level)
+        blobs = zlib.compress(blobs, level)
+    return CKPT_MAGIC + CKPT_HEADER.pack(CKPT_VERSION, level, len(blobs), len(state)) + blobs + state
+
+# Rebuild a Checkpoint from snapshot() bytes. With restore_rng the global
+# random module is put back in the state it had at snapshot time (needed
+# for an identical continuation since the noise model uses it).
+def restore(data, restore_rng=True):
+    if data[:len(CKPT_MAGIC)] != CKPT_MAGIC:
+        raise ValueError("Not a simulation checkpoint")
+    pos = len(CKPT_MAGIC)
+    version, level, blob_len, state_len = CKPT_HEADER.unpack_from(data, pos)
+    if version != CKPT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {version}")
+    pos += CKPT_HEADER.size
+    blobs = data[pos:pos + blob_len]
+    state = data[pos + blob_len:pos + blob_len + state_len]
+    if level > 0:
+        blobs = zlib.decompress(blobs)
+        state = zlib.decompress(state)
+    blob_list = _unpack_blobs(blobs)
+
+    u = _Unpickler(io.BytesIO(state), blob_list)
+    entities = u.load()
+    payload = u.load()
+    for entity, entity_state in zip(entities, payload["states"]):
+        entity.__dict__.update(entity_state)
+
+    if restore_rng:
+        random.setstate(payload["rng"])
+    info = {
+        "bytes"   : len(data),
+        "blobs"   : len(blob_list),
+        "towers"  : sum(1 for e in entities if isinstance(e, Tower)),
+        "ues"     : sum(1 for e in entities if isinstance(e, UE)),
+    }
+    return Checkpoint(payload["sim"], payload["engine"], payload["extra"], payload["t_step"], info)
+
+def save_checkpoint(path, sim, engine=None, extra=None, level=1):
+    data = snapshot(sim, engine, extra, level)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+def load_checkpoint(path, restore_rng=True):
+    with open(path, "rb") as f:
+        return restore(f.read(), restore_rng)
+
+# Independent copy of a running simulation (warm up once, fork many
+# experiments from that point)
+def fork(sim, engine=None, extra=None):
+    return restore(snapshot(sim, engine, extra, level=0))
@@ -0,0 +1,242 @@
+import sys
+import os
+import copy
+import json
+import shlex
+import random
+import asyncio
+import argparse
+import contextlib
+import headless
+from engine import EventEngine
+from partition import PartitionedSimulation
+from async_engine import AsyncEngine
+from radio import RadioModel
+
+# Differential test of the optimized engines against the reference step.
+#
+# Builds the same seeded headless scenario twice, runs it once through the
+# reference engine and once through the engine under test, and records
+# the per-step counters of every tower and UE (before end_step clears
+# them). The first step where they differ is reported with the fields that
+# differ. Engines:
+#
+#   reference  Simulation.step, forwards and attaches applied right away
+#   deferred   Simulation.step in deferred mode
+#   partition  PartitionedSimulation over --regions worker processes
+#   async      AsyncEngine (realtime off)
+#
+# partition and async are built to match deferred mode, so every engine
+# is checked against a deferred reference by default (--reference). Both
+# runs give every tower/UE its own noise RNG (seed_noise).
+#
+# Deferred mode itself is NOT expected to match the reference step: a
+# forwarded packet reaches its neighbor after the tower round instead of
+# in the middle of it, and handovers wait for the exchange phase, so the
+# two orders drift apart as soon as forwards or handovers of one step
+# interact (most networks beyond a few towers). --engine deferred (with
+# the reference step as its reference) shows where and how, it is not a
+# pass/fail check.
+#
+# Two options check the main optimizations against plain runs:
+#
+#   --skip-idle       the engine under test skips idle steps (the
+#                     reference runs every step)
+#   --uncached-radio  the reference rebuilds every SINR row each step
+#                     instead of using the RadioModel cache (run with
+#                     --link-model sinr in --base)
+#
+# Example:
+#   python difftest.py --engine partition --regions 4 --steps 300 \
+#       --base "--topology grid --towers 9 --ues 40 --noise --mobility random_waypoint"
+#   python difftest.py --engine deferred --skip-idle --steps 300 --base "--topology grid --towers 9 --ues 10 --rate 0.05"
+#   python difftest.py --engine deferred --uncached-radio --steps 200 \
+#       --base "--topology grid --towers 9 --ues 40 --link-model sinr --mobility manhattan"
+
+#Parameters
+ENGINES      = ("reference", "deferred", "partition", "async")
+TOWER_FIELDS = ("n_tx_bytes", "ber", "buffer", "n_rx_bytes", "ues")
+UE_FIELDS    = ("tx_bytes_step", "ber", "buffer", "tower", "n_acked", "n_dropped")
+MAX_DIFFS    = 20 # differing fields listed for the first divergent step
+
+#Step Recorder Class
+# Simulation observer keeping the counters of every step. In a region of a
+# partitioned run (built from the full network, then called with the
+# RegionSimulation) only the towers and UEs the region owns are recorded.
+class StepRecorder:
+    def __init__(self, sim):
+        self.ue_index = {ue: i for i, ue in enumerate(sim.ues)}
+        self.steps = {} # t_step -> ({tower index: values}, {ue index: values})
+
+    def __call__(self, sim):
+        self.steps[sim.t_step] = self._counters(sim)
+
+    # A skipped step would have shown the counters as they are now
+    # (cleared after the last step that ran)
+    def skipped(self, sim, n):
+        counters = self._counters(sim)
+        for t_step in range(sim.t_step, sim.t_step + n):
+            self.steps[t_step] = counters
+
+    def _counters(self, sim):
+        region = getattr(sim, "region", None)
+        towers = {}
+        for i, tower in enumerate(sim.towers):
+            if region is not None and sim.tower_region[i] != region:
+                continue
+            towers[i] = (tower.n_tx_bytes, tower.ber, len(tower.buffer), tower.n_rx_bytes, len(tower.connected_ues))
+        ues = {}
+        for ue in sim.ues:
+            tower = ue.current_tower.ip_addr if ue.current_tower is not None else None
+            ues[self.ue_index[ue]] = (ue.tx_bytes_step, ue.ber, len(ue.buffer), tower, ue.n_acked, ue.n_dropped)
+        return towers, ues
+
+    # Add the steps recorded by another region
+    def merge(self, other):
+        for t_step, (towers, ues) in other.steps.items():
+            mine = self.steps.setdefault(t_step, ({}, {}))
+            mine[0].update(towers)
+            mine[1].update(ues)
+
+#Uncached Radio Class
+# RadioModel without the cache: every step drops all rows and computes
+# them again from the current positions and tower states
+class UncachedRadio(RadioModel):
+    def update(self, ues, moved=None):
+        self.rebuild(self.towers)
+        for ue in ues:
+            self._compute_row(ue)
+
+# Build the scenario of args for engine and run it for n_steps. Returns the
+# StepRecorder and the simulation (with its final state). skip_idle lets
+# the engine jump over idle steps, uncached_radio swaps the SINR model
+# for an UncachedRadio.
+def run_engine(engine, args, n_steps, regions=2, skip_idle=False, uncached_radio=False):
+    args = copy.copy(args)
+    args.deferred = engine != "reference"
+    args.regions = 0
+    random.seed(args.seed)
+    sim, outages = headless.build_simulation(args)
+    sim.seed_noise(args.seed)
+    if uncached_radio and sim.radio is not None:
+        sim.radio = UncachedRadio(sim.towers, path_loss_exp=sim.radio.path_loss_exp)
+        for ue in sim.ues:
+            ue.radio = sim.radio
+    process = headless.start_outages(args, sim)
+
+    if engine == "partition":
+        psim = PartitionedSimulation(sim, regions, observer=StepRecorder)
+        try:
+            driver = EventEngine(psim, skip_idle=skip_idle)
+            for tower, start, duration in outages:
+                driver.schedule_outage(tower, start, duration)
+            if process is not None:
+                process.attach(driver)
+            driver.run(n_steps)
+            recorder = None
+            for region_recorder in psim.collect():
+                if recorder is None:
+                    recorder = region_recorder
+                else:
+                    recorder.merge(region_recorder)
+        finally:
+            psim.close()
+        return recorder, sim
+
+    recorder = StepRecorder(sim)
+    sim.observers.append(recorder)
+    if engine == "async":
+        driver = AsyncEngine(sim, realtime=False, skip_idle=skip_idle)
+        for tower, start, duration in outages:
+            driver.schedule_outage(tower, start, duration)
+        if process is not None:
+            driver.add_outage_process(process)
+        asyncio.run(driver.run(n_steps))
+    else:
+        driver = EventEngine(sim, skip_idle=skip_idle)
+        for tower, start, duration in outages:
+            driver.schedule_outage(tower, start, duration)
+        if process is not None:
+            process.attach(driver)
+        driver.run(n_steps)
+    return recorder, sim
+
+def _values_differ(a, b, rel_tol):
+    if isinstance(a, float) or isinstance(b, float):
+        if a is None or b is None:
+            return a is not b
+        return abs(a - b) > rel_tol * max(abs(a), abs(b))
+    return a != b
+
+# First step where the two recordings differ, as a dict with the step and
+# up to max_diffs differing fields (None if they agree everywhere)
+def first_divergence(ref, test, sim, rel_tol=0.0, max_diffs=MAX_DIFFS):
+    for t_step in sorted(set(ref.steps) | set(test.steps)):
+        if t_step not in ref.steps or t_step not in test.steps:
+            return {"step": t_step, "diffs": [{"what": "step", "reference": t_step in ref.steps, "engine": t_step in test.steps}]}
+        diffs = []
+        for kind, fields, entities, a_side, b_side in (
+                ("tower", TOWER_FIELDS, sim.towers, ref.steps[t_step][0], test.steps[t_step][0]),
+                ("ue", UE_FIELDS, sim.ues, ref.steps[t_step][1], test.steps[t_step][1])):
+            for i in sorted(set(a_side) | set(b_side)):
+                a = a_side.get(i)
+                b = b_side.get(i)
+                if a is None or b is None:
+                    diffs.append({"what": kind, "index": i, "ip": entities[i].ip_addr, "field": "recorded",
+                                  "reference": a is not None, "engine": b is not None})
+                    continue
+                for name, va, vb in zip(fields, a, b):
+                    if _values_differ(va, vb, rel_tol):
+                        diffs.append({"what": kind, "index": i, "ip": entities[i].ip_addr, "field": name,
+                                      "reference": va, "engine": vb})
+        if diffs:
+            return {"step": t_step, "n_diffs": len(diffs), "diffs": diffs[:max_diffs]}
+    return None
+
+def format_divergence(div):
+    lines = [f"first divergence at step {div['step']} ({div.get('n_diffs', len(div['diffs']))} fields differ)"]
+    for d in div["diffs"]:
+        if d["what"] == "step":
+            lines.append(f"  step recorded by reference: {d['reference']}, engine: {d['engine']}")
+        else:
+            lines.append(f"  {d['what']} {d['index']} (ip {d['ip']}) {d['field']}: reference {d['reference']}, engine {d['engine']}")
+    return "\n".join(lines)
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Compare an optimized engine step by step against the reference step.")
+    parser.add_argument("--engine", choices=ENGINES, default="deferred", help="engine under test")
+    parser.add_argument("--reference", choices=("reference", "deferred"), default=None,
+                        help="engine to compare against (default: deferred, reference for --engine deferred without "
+                             "--skip-idle/--uncached-radio)")
+    parser.add_argument("--skip-idle", action="store_true", help="let the engine under test skip idle steps")
+    parser.add_argument("--uncached-radio", action="store_true", help="reference rebuilds every SINR row each step")
+    parser.add_argument("--regions", type=int, default=2, help="worker processes for --engine partition")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--base", default="", help="headless.py arguments describing the scenario (topology, traffic, noise, seed, ...)")
+    parser.add_argument("--rel-tol", type=float, default=0.0, help="relative tolerance for float counters (ber)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    plain = args.engine == "deferred" and not (args.skip_idle or args.uncached_radio)
+    reference = args.reference or ("reference" if plain else "deferred")
+    scenario = headless.make_parser().parse_args(shlex.split(args.base))
+
+    # the towers/UEs print their attaches
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        ref, sim = run_engine(reference, scenario, args.steps, uncached_radio=args.uncached_radio)
+        test, _ = run_engine(args.engine, scenario, args.steps, regions=args.regions, skip_idle=args.skip_idle)
+    div = first_divergence(ref, test, sim, rel_tol=args.rel_tol)
+
+    if args.json:
+        print(json.dumps({"engine": args.engine, "reference": reference, "steps": args.steps, "divergence": div}, indent=2))
+    elif div is None:
+        print(f"{args.engine} matches {reference} for {args.steps} steps "
+              f"({len(sim.towers)} towers, {len(sim.ues)} UEs)")
+    else:
+        print(f"{args.engine} vs {reference}: " + format_divergence(div))
+    return 0 if div is None else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
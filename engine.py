@@ -0,0 +1,362 @@
+import time
+import math
+import heapq
+import random
+from profiler import NULL_PROFILER
+
+# Discrete-event simulation core.
+#
+# Simulation holds the state of one run (towers, UEs and the optional
+# radio/mobility/traffic models) and knows how to run one timestep using
+# the existing Tower/UE logic. EventEngine drives a Simulation from a heap
+# of timestamped events instead of sleeping between steps: timesteps,
+# tower outages/repairs, mobility updates and any user callbacks are all
+# events, and when the network has nothing buffered the engine jumps
+# straight to the next traffic arrival or scheduled event. It runs as fast
+# as the CPU allows unless realtime pacing is switched on.
+#
+# Observers run at the end of every executed step. The idle steps the
+# engine jumps over don't run them; an observer that needs every step (a
+# time series sampling every n steps) can define skipped(sim, n), which
+# Simulation.skip_to() calls with the number of steps jumped.
+#
+# In deferred mode towers don't hand forwarded packets to their neighbors
+# while the other towers are still transmitting, and handovers don't attach
+# the UE to its new tower right away. Forwards are delivered at the end of
+# each round of the tower loop (in tower index order) and attaches at the
+# end of the step (in UE index order). Within a round every tower and UE
+# then only touches itself and the towers/UEs attached to it, which is
+# what lets partition.py split the network over processes and still get
+# the same result.
+
+# Event priorities (lower runs first when two events share a timestep)
+PRIO_OUTAGE   = 0
+PRIO_EXTERNAL = 1
+PRIO_STEP     = 2
+
+#Simulation Class
+class Simulation:
+    def __init__(self, towers, ues, t_delta, simulate_noise=False, radio=None, mobility=None, traffic=None, deferred=False):
+        self.towers = list(towers) # every tower, operational or not
+        self.ues = list(ues)
+        self.t_delta = t_delta
+        self.simulate_noise = simulate_noise
+        self.radio = radio       # radio.RadioModel or None
+        self.mobility = mobility # mobility model or None
+        self.traffic = traffic   # traffic.TrafficScheduler or None
+        self.t_step = 0
+        self.moved = None        # UEs the mobility model moved last step
+        self.tx_count = 0        # tower transmissions in the last step
+        self.ue_tx_count = 0     # UE transmissions in the last step
+        # Callables observer(sim) run at the end of every step, before the
+        # per-step counters are cleared (see skip_to() for skipped steps)
+        self.observers = []
+        # profiler.PhaseProfiler timing the phases of every step (or None)
+        self.profiler = None
+
+        self.deferred = deferred
+        self.forwards = []       # deferred (tower index, neighbor, packet)
+        self.attaches = []       # deferred (ue, tower, band, max_range)
+
+        self.active_towers = [t for t in self.towers if t.operational]
+        for ue in self.ues:
+            ue.radio = radio
+            ue.update_towers(self.active_towers)
+
+        if deferred:
+            self.tower_index = {t: i for i, t in enumerate(self.towers)}
+            for tower in self.towers:
+                tower.backhaul = self._defer_forward
+            for ue in self.ues:
+                ue.defer_attach = self._defer_attach
+
+    # Observers are usually closures/bound to outside objects, so they are
+    # not part of a checkpoint. Re-attach them after restoring.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["observers"] = []
+        state["profiler"] = None
+        return state
+
+    # Current simulated time in seconds
+    @property
+    def now(self):
+        return self.t_step * self.t_delta
+
+    # Give every tower and UE its own noise RNG (seeded from seed and its
+    # IP) so the noise doesn't depend on the order they are stepped in
+    def seed_noise(self, seed):
+        for tower in self.towers:
+            tower.rng = random.Random(f"{seed}:tower:{tower.ip_addr}")
+        for ue in self.ues:
+            ue.rng = random.Random(f"{seed}:ue:{ue.ip_addr}")
+
+    # Jump over idle timesteps up to t_step. The per-step counters are
+    # still cleared from the last step, i.e. what each skipped step would
+    # have shown, so observers with a skipped(sim, n) method get it before
+    # t_step moves. Returns the number of steps skipped.
+    def skip_to(self, t_step):
+        n = t_step - self.t_step
+        if n <= 0:
+            return 0
+        for observer in self.observers:
+            skipped = getattr(observer, "skipped", None)
+            if skipped is not None:
+                skipped(self, n)
+        self.t_step = t_step
+        return n
+
+    # Take a tower down/up and let the UEs re-attach on their next step
+    def set_tower_status(self, tower, operational):
+        self.set_tower_statuses([(tower, operational)])
+
+    # Several (tower, operational) changes at once, the UEs only get the
+    # new tower list once
+    def set_tower_statuses(self, changes):
+        changed = False
+        for tower, operational in changes:
+            if tower.operational != operational:
+                tower.operational = operational
+                changed = True
+        if not changed:
+            return
+        self.active_towers = [t for t in self.towers if t.operational]
+        for ue in self.ues:
+            ue.update_towers(self.active_towers)
+
+    # ------------------------------------------------------------------
+    # Phases of one timestep
+    # ------------------------------------------------------------------
+    def begin_step(self):
+        # Make sure all timesteps are the same (ARQ relies on it)
+        t_step = self.t_step
+        for ue in self.ues:
+            ue.t_step = t_step
+
+    def apply_traffic(self):
+        if self.traffic is not None:
+            self.traffic.step(self.t_step)
+
+    def step_ues(self):
+        if self.radio is not None:
+            self.radio.update(self.ues, self.moved)
+        simulate_noise = self.simulate_noise
+        n = 0
+        for ue in self.ues:
+            if ue.step(simulate_noise):
+                n += 1
+        self.ue_tx_count = n
+
+    # Keep letting towers transmit until none of them can
+    def step_towers(self, towers=None):
+        if towers is None:
+            towers = self.active_towers
+        tx_count = 0
+        while True:
+            n = self.tower_round(towers)
+            if self.forwards:
+                self.deliver_forwards()
+            if n == 0:
+                break
+            tx_count += n
+        self.tx_count = tx_count
+
+    # Every tower that can transmits one packet. Returns how many did.
+    def tower_round(self, towers):
+        simulate_noise = self.simulate_noise
+        n = 0
+        for tower in towers:
+            if tower.can_transmit():
+                tower.step(simulate_noise)
+                n += 1
+        return n
+
+    # Deferred mode hooks (see the top of the file)
+    def _defer_forward(self, tower, neighbor, packet):
+        self.forwards.append((self.tower_index[tower], neighbor, packet))
+
+    def _defer_attach(self, ue, tower, band, max_range):
+        self.attaches.append((ue, tower, band, max_range))
+
+    def deliver_forwards(self):
+        forwards = self.forwards
+        self.forwards = []
+        for _, neighbor, packet in forwards:
+            neighbor.receive(packet)
+
+    # Apply the handover attaches held back during the step
+    def exchange(self):
+        if self.attaches:
+            attaches = self.attaches
+            self.attaches = []
+            for ue, tower, band, max_range in attaches:
+                ue.attach(tower, band, max_range)
+                ue.set_code_rate()
+
+    def end_step(self):
+        for observer in self.observers:
+            observer(self)
+        # Clearing for towers is NECESSARY! This is so that the
+        # tower loop can run until the towers reach the max data rate
+        for tower in self.towers:
+            tower.clear_tx_count()
+        for ue in self.ues:
+            ue.clear_tx_count()
+
+    def move(self):
+        if self.mobility is not None:
+            self.moved = self.mobility.step(self.t_delta, self.t_step)
+
+    # One complete timestep (same order as the original run_env_main loop).
+    # Every phase ends with a lap of the profiler (a no-op one when
+    # profiling is off).
+    def step(self):
+        prof = self.profiler or NULL_PROFILER
+        prof.begin()
+        self.begin_step()
+        prof.lap("begin", len(self.ues))
+        arrivals = self.traffic.n_arrivals if self.traffic is not None else 0
+        self.apply_traffic()
+        arrivals = self.traffic.n_arrivals - arrivals if self.traffic is not None else 0
+        prof.lap("traffic", arrivals, arrivals)
+        self.step_ues()
+        prof.lap("ues", len(self.ues), self.ue_tx_count)
+        self.step_towers()
+        prof.lap("towers", self.tx_count, self.tx_count)
+        n_attaches = len(self.attaches)
+        self.exchange()
+        prof.lap("exchange", n_attaches, 0)
+        self.end_step()
+        prof.lap("observers", len(self.observers), 0)
+        self.move()
+        prof.lap("move", len(self.moved) if self.moved else 0, 0)
+        self.t_step += 1
+        prof.end()
+
+    # True if running a step right now would not change anything: no
+    # packets anywhere, no pending handover and nothing moving
+    def is_idle(self, towers=None):
+        if self.mobility is not None:
+            return False
+        if towers is None:
+            towers = self.active_towers
+        for tower in towers:
+            if tower.buffer:
+                return False
+        for ue in self.ues:
+            if ue.buffer or ue.ho_candidate is not None or ue.ho_interrupt_left > 0:
+                return False
+        return True
+
+#Real-time Pacer Class
+# Sleeps just long enough to keep simulated time in line with the wall
+# clock (times speed). Unlike a fixed sleep per step it doesn't drift when
+# the steps themselves take time.
+class Pacer:
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.reset()
+
+    def reset(self, sim_time=0.0):
+        self.wall_start = time.perf_counter()
+        self.sim_start = sim_time
+
+    # Seconds until the wall clock reaches sim_time (negative if late)
+    def delay(self, sim_time):
+        return self.wall_start + (sim_time - self.sim_start) / self.speed - time.perf_counter()
+
+    # Simulated time the wall clock is at right now
+    def sim_time(self):
+        return self.sim_start + (time.perf_counter() - self.wall_start) * self.speed
+
+    def wait(self, sim_time):
+        delay = self.delay(sim_time)
+        if delay > 0:
+            time.sleep(delay)
+
+#Event Engine Class
+class EventEngine:
+    def __init__(self, sim, realtime=False, speed=1.0, skip_idle=True):
+        self.sim = sim
+        self.queue = []        # (time in timesteps, priority, seq, callback, args)
+        self._seq = 0
+        self.now = float(sim.t_step)
+        self.skip_idle = skip_idle
+        self.pacer = Pacer(speed) if realtime else None
+        self.n_events = 0
+        self.n_steps = 0       # timesteps actually executed
+        self.n_skipped = 0     # idle timesteps jumped over
+        self._step_at = None   # time of the pending step event
+        self._step_token = 0   # bumped to cancel a pending step event
+
+    # Schedule callback(*args) at time t (in timesteps, may be fractional)
+    def schedule(self, t, callback, *args, priority=PRIO_EXTERNAL):
+        heapq.heappush(self.queue, (t, priority, self._seq, callback, args))
+        self._seq += 1
+
+    # Run a callback that changes the network, then make sure a timestep
+    # follows so the UEs react to it
+    def _external(self, callback, *args):
+        callback(*args)
+        self._wake(math.ceil(self.now))
+
+    def schedule_external(self, t, callback, *args, priority=PRIO_EXTERNAL):
+        self.schedule(t, self._external, callback, *args, priority=priority)
+
+    # Tower outage from start for duration timesteps
+    def schedule_outage(self, tower, start, duration):
+        self.schedule(start, self._external, self.sim.set_tower_status, tower, False, priority=PRIO_OUTAGE)
+        self.schedule(start + duration, self._external, self.sim.set_tower_status, tower, True, priority=PRIO_OUTAGE)
+
+    def _wake(self, t_step):
+        t_step = max(t_step, self.sim.t_step)
+        if self._step_at is not None and self._step_at <= t_step:
+            return
+        self._step_token += 1
+        self._step_at = t_step
+        self.schedule(t_step, self._step, self._step_token, priority=PRIO_STEP)
+
+    def _step(self, token):
+        if token != self._step_token:
+            return # superseded by an earlier wake-up
+        sim = self.sim
+        self.n_skipped += sim.skip_to(int(self.now))
+        self._step_at = None
+        sim.step()
+        self.n_steps += 1
+
+        # Next timestep: right away if there is work, otherwise at the
+        # next traffic arrival (other events wake us up themselves)
+        nxt = sim.t_step
+        if self.skip_idle and sim.is_idle():
+            nxt = None
+            if sim.traffic is not None:
+                t_next = sim.traffic.next_time()
+                if t_next is not None:
+                    nxt = max(t_next, sim.t_step)
+        if nxt is not None:
+            self._wake(nxt)
+
+    # Run until there are no events left or n_steps timesteps have passed
+    def run(self, n_steps=None):
+        sim = self.sim
+        end = None if n_steps is None else sim.t_step + n_steps
+        self._wake(sim.t_step)
+        if self.pacer is not None:
+            self.pacer.reset(sim.now)
+
+        queue = self.queue
+        while queue:
+            if end is not None and queue[0][0] >= end:
+                break
+            t, _, _, callback, args = heapq.heappop(queue)
+            if self.pacer is not None:
+                self.pacer.wait(t * sim.t_delta)
+            self.now = t
+            callback(*args)
+            self.n_events += 1
+
+        # Idle until the end: account for the skipped timesteps
+        if end is not None:
+            self.n_skipped += sim.skip_to(end)
+        self.now = float(sim.t_step)
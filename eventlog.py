@@ -0,0 +1,321 @@
+import os
+import sys
+import glob
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from events import (NO_PEER, EV_ENQUEUE, EV_TRANSMIT, EV_TOWER_STEP, EV_DELIVER, EV_DROP_NOISE, EV_DROP_BUFFER,
+                    EV_DROP_TTL, EV_ACK, EV_DROP_RETX, EV_DROP_RATE, EVENT_NAMES, FLAG_ACK, FLAG_TOWER, FLAG_RX)
+
+# Binary packet event log.
+#
+# Every packet event of the UEs (enqueue, transmit, deliver, ACK and the
+# drops) and every packet a tower drops becomes one fixed width 32 byte
+# record. The packets a tower relays (the bulk of a run: one enqueue,
+# transmit and forward per hop) are not logged one by one, that costs
+# as much as the hop itself. Instead each tower that did something gets
+# one EV_TOWER_STEP record at the end of the step, from its counters.
+#
+#
+#   t_step  u32    timestep of the Simulation
+#   event   u8     EV_* of events.py
+#   flags   u8     FLAG_* of events.py (shifted down by 8)
+#   hops    u16    hop count (tx_att) of the packet
+#   node    u32    IP of the tower/UE the event happened at
+#   peer    u32    IP of the other side (NO_PEER if there is none)
+#   src     u32    source IP of the packet
+#   dst     u32    destination IP of the packet
+#   pkt_num u32    packet number (matches the ACK to its data packet)
+#   n_bytes u32    packet size in bytes
+#
+# An EV_TOWER_STEP record has src = packets taken from the buffer, dst =
+# packets left in the buffer and n_bytes = bytes sent in that step (peer
+# is NO_PEER, the rest 0).
+#
+# Records are collected in an array('I') batch (8 words each) and copied
+# into a memory-mapped segment file when the batch is full. Segments have a
+# fixed size and a new one is started when the current one is full
+# (run.evt -> run.0000.evt, run.0001.evt, ...). Each segment starts with a
+# 32 byte header, see HEADER.
+#
+# replay_metrics() recomputes the headless summary from the log alone and
+# iter_steps() hands out the records step by step (the GUI replay uses it).
+#
+# Example:
+#   python headless.py --steps 2000 --topology grid --towers 4 --ues 12 --event-log run.evt
+#   python eventlog.py run.evt
+
+#Parameters
+SEGMENT_SIZE = 64 << 20 # bytes per segment file
+BATCH        = 4096     # records per batch
+MAGIC        = b"5GEV"
+VERSION      = 2
+
+# magic, version, record size, segment index, t_delta, first t_step,
+# last t_step (exclusive), number of records
+HEADER = struct.Struct("<4sHHIdIII")
+RECORD = struct.Struct("<IBBHIIIIII")
+
+# Segment file i of a log
+def segment_path(path, i):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{i:04d}{ext or '.evt'}"
+
+# All segment files of a log (path may also be one segment)
+def segment_paths(path):
+    if os.path.exists(path) and not os.path.exists(segment_path(path, 0)):
+        return [path]
+    root, ext = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(root)}.[0-9][0-9][0-9][0-9]{ext or '.evt'}"))
+
+#Event Log Writer Class
+class EventLogWriter:
+    def __init__(self, path, sim, segment_size=SEGMENT_SIZE, batch=BATCH):
+        self.path = path
+        self.sim = sim
+        self.segment_size = segment_size - (segment_size - HEADER.size) % RECORD.size
+        self.batch_words = batch * 8
+        self.batch = array("I")
+        self.n_records = 0
+        self.paths = []
+        self.hooked = []
+        self.last_buffer = {tower: 0 for tower in sim.towers} # tower -> buffered packets in its last record
+        self._segment = -1
+        self._file = None
+        self._mm = None
+        self._offset = 0
+        self._seg_records = 0
+        self._seg_start = sim.t_step
+        self._open_segment()
+
+    def _open_segment(self):
+        self._segment += 1
+        path = segment_path(self.path, self._segment)
+        self.paths.append(path)
+        self._file = open(path, "w+b")
+        self._file.truncate(self.segment_size)
+        self._mm = mmap.mmap(self._file.fileno(), self.segment_size)
+        self._offset = HEADER.size
+        self._seg_records = 0
+        self._seg_start = self.sim.t_step
+
+    # A full segment ends inside the current step, the last one after the
+    # run (when t_step already points past the last step)
+    def _close_segment(self, final=False):
+        t_end = self.sim.t_step if final else self.sim.t_step + 1
+        self._mm[:HEADER.size] = HEADER.pack(MAGIC, VERSION, RECORD.size, self._segment, self.sim.t_delta,
+                                             self._seg_start, t_end, self._seg_records)
+        self._mm.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        self._mm = None
+        self._file = None
+
+    # Copy the batch into the mapped segment(s)
+    def flush(self):
+        batch = self.batch
+        if not batch:
+            return
+        if sys.byteorder != "little":
+            batch.byteswap()
+        data = batch.tobytes()
+        del batch[:]
+        pos = 0
+        while pos < len(data):
+            room = self.segment_size - self._offset
+            if room == 0:
+                self._close_segment()
+                self._open_segment()
+                continue
+            n = min(room, len(data) - pos)
+            self._mm[self._offset:self._offset + n] = data[pos:pos + n]
+            self._offset += n
+            self._seg_records += n // RECORD.size
+            pos += n
+        self.n_records += len(data) // RECORD.size
+
+    # Hook for one tower/UE: hook(event, packet, peer_ip)
+    def _hook(self, node, is_tower):
+        sim = self.sim
+        batch = self.batch
+        extend = batch.extend
+        limit = self.batch_words
+        flush = self.flush
+        node_flag = FLAG_TOWER if is_tower else 0
+        def hook(event, p, peer):
+            extend((sim.t_step, event | node_flag | (FLAG_ACK if p[2] == 0 else 0) | (p[7] & 0xFFFF) << 16,
+                    node, peer, p[4], p[5], p[1] & 0xFFFFFFFF, len(p[3])))
+            if len(batch) >= limit:
+                flush()
+        return hook
+
+    # Simulation observer: one EV_TOWER_STEP record for every tower that
+    # sent something or whose buffer changed in the step
+    def __call__(self, sim):
+        batch = self.batch
+        last = self.last_buffer
+        t_step = sim.t_step
+        for tower in sim.towers:
+            n_buffered = len(tower.buffer)
+            if tower.n_tx_packets or n_buffered != last[tower]:
+                last[tower] = n_buffered
+                batch.extend((t_step, EV_TOWER_STEP | FLAG_TOWER, tower.ip_addr, NO_PEER,
+                              tower.n_tx_packets, n_buffered, 0, tower.n_tx_bytes))
+        if len(batch) >= self.batch_words:
+            self.flush()
+
+    # Record the events of every tower and UE of the simulation
+    def install(self):
+        for tower in self.sim.towers:
+            tower.trace = self._hook(tower.ip_addr, True)
+            self.hooked.append(tower)
+        for ue in self.sim.ues:
+            ue.trace = self._hook(ue.ip_addr, False)
+            self.hooked.append(ue)
+        self.sim.observers.append(self)
+
+    def stats(self):
+        return {"records": self.n_records, "bytes": self.n_records * RECORD.size, "segments": self.paths}
+
+    def close(self):
+        for entity in self.hooked:
+            entity.trace = None
+        self.hooked = []
+        if self in self.sim.observers:
+            self.sim.observers.remove(self)
+        if self._mm is not None:
+            self.flush()
+            self._close_segment(final=True)
+
+# ----------------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------------
+# (header dict, records as a flat array('I'), 8 words per record) of one
+# segment
+def read_segment(path):
+    with open(path, "rb") as f:
+        head = f.read(HEADER.size)
+        magic, version, rec_size, index, t_delta, t_start, t_end, n = HEADER.unpack(head)
+        if magic != MAGIC or version != VERSION or rec_size != RECORD.size:
+            raise ValueError(f"{path} is not a version {VERSION} event log")
+        words = array("I")
+        words.frombytes(f.read(n * RECORD.size))
+    if sys.byteorder != "little":
+        words.byteswap()
+    return {"segment": index, "t_delta": t_delta, "t_start": t_start, "t_end": t_end, "records": n}, words
+
+# Every record as a tuple (see RECORD), in order, over all segments
+def iter_records(path):
+    for seg in segment_paths(path):
+        _, words = read_segment(seg)
+        for i in range(0, len(words), 8):
+            yield tuple(words[i:i + 8])
+
+# (t_step, [records]) for every timestep that has events
+def iter_steps(path):
+    cur, recs = None, []
+    for rec in iter_records(path):
+        if rec[0] != cur:
+            if recs:
+                yield cur, recs
+            cur, recs = rec[0], []
+        recs.append(rec)
+    if recs:
+        yield cur, recs
+
+# Time span of a log: (t_delta, first t_step, last t_step exclusive)
+def log_span(path):
+    heads = [read_segment(p)[0] for p in segment_paths(path)]
+    if not heads:
+        raise ValueError(f"No event log at {path}")
+    return heads[0]["t_delta"], heads[0]["t_start"], max(h["t_end"] for h in heads)
+
+# Bytes each tower/UE sent in the records of one step: (towers, ues),
+# both ip -> bytes. Same counting as Tower.n_tx_bytes / UE.n_tx_bytes.
+def step_tx_bytes(records):
+    towers, ues = {}, {}
+    for _, code, node, _, _, _, _, n_bytes in records:
+        event = code & 0xFF
+        if code & FLAG_TOWER:
+            if event == EV_TOWER_STEP:
+                towers[node] = n_bytes
+        elif (event == EV_TRANSMIT and not code & FLAG_ACK) or event == EV_DROP_NOISE:
+            ues[node] = ues.get(node, 0) + n_bytes
+    return towers, ues
+
+# Recompute the headless metrics summary (and per tower/UE counters) from
+# a log, without running the simulation
+def replay_metrics(path):
+    t_delta, t_start, t_end = log_span(path)
+    counts = [0] * len(EVENT_NAMES)
+    tower_bytes, ue_bytes = {}, {}
+    acked, dropped, ue_buffer, tower_buffer = {}, {}, {}, {}
+    tower_tx = 0
+    for _, records in iter_steps(path):
+        towers, ues = step_tx_bytes(records)
+        for ip, n in towers.items():
+            tower_bytes[ip] = tower_bytes.get(ip, 0) + n
+        for ip, n in ues.items():
+            ue_bytes[ip] = ue_bytes.get(ip, 0) + n
+        for rec in records:
+            code, node = rec[1], rec[2]
+            event = code & 0xFF
+            counts[event] += 1
+            if code & FLAG_TOWER:
+                if event == EV_TOWER_STEP:
+                    tower_tx += rec[4]
+                    tower_buffer[node] = rec[5]
+            elif event == EV_ENQUEUE:
+                ue_buffer[node] = ue_buffer.get(node, 0) + 1
+            elif event == EV_ACK:
+                acked[node] = acked.get(node, 0) + 1
+                ue_buffer[node] = ue_buffer.get(node, 0) - 1
+            elif event == EV_DROP_RETX:
+                dropped[node] = dropped.get(node, 0) + 1
+                ue_buffer[node] = ue_buffer.get(node, 0) - 1
+
+    sim_time = (t_end - t_start) * t_delta
+    n_acked = sum(acked.values())
+    n_dropped = sum(dropped.values())
+    total_bytes = sum(tower_bytes.values())
+    ue_ips = sorted(set(ue_bytes) | set(acked) | set(dropped) | set(ue_buffer))
+    return {
+        "summary" : {
+            "tower_tx_bytes"     : total_bytes,
+            "tower_rate_mbps"    : total_bytes * 8e-6 / sim_time if sim_time > 0 else 0.0,
+            "ue_tx_bytes"        : sum(ue_bytes.values()),
+            "tower_transmissions": tower_tx,
+            "acked_packets"      : n_acked,
+            "dropped_packets"    : n_dropped,
+            "delivery_ratio"     : n_acked / (n_acked + n_dropped) if n_acked + n_dropped else None,
+            "buffered_packets"   : sum(ue_buffer.values()) + sum(tower_buffer.values()),
+        },
+        "events" : dict(zip(EVENT_NAMES, counts)),
+        "towers" : [{"ip": ip, "tx_bytes": n} for ip, n in sorted(tower_bytes.items())],
+        "ues"    : [{
+            "ip"               : ip,
+            "tx_bytes"         : ue_bytes.get(ip, 0),
+            "acked_packets"    : acked.get(ip, 0),
+            "dropped_packets"  : dropped.get(ip, 0),
+            "buffered_packets" : ue_buffer.get(ip, 0),
+        } for ip in ue_ips],
+        "run" : {"t_start": t_start, "t_end": t_end, "sim_time": sim_time},
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute run metrics from a binary event log.")
+    parser.add_argument("log", help="event log (base path or one segment file)")
+    parser.add_argument("--out", default="-", help="metrics file (default: stdout)")
+    args = parser.parse_args(argv)
+    text = json.dumps(replay_metrics(args.log), indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
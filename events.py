@@ -0,0 +1,29 @@
+# Packet event codes.
+#
+# Towers and UEs report packet events through their trace hook as
+# trace(code, packet, peer): code is one of the EV_* events or-ed with
+# FLAG_* flags, peer the IP of the other side (NO_PEER if there is none).
+# eventlog.py writes them to the binary event log. Kept apart from it so
+# tower.py and ue.py don't pull in the log writer.
+
+NO_PEER = 0xFFFFFFFF
+
+# Events
+EV_ENQUEUE     = 0 # new packet put in a UE buffer
+EV_TRANSMIT    = 1 # UE sent uplink
+EV_TOWER_STEP  = 2 # what a tower sent in one step (see eventlog.py)
+EV_DELIVER     = 3 # UE received a packet from its tower
+EV_DROP_NOISE  = 4 # lost on the air (noisy dropout)
+EV_DROP_BUFFER = 5 # buffer full
+EV_DROP_TTL    = 6 # hop limit (tower tx_attempts) reached
+EV_ACK         = 7 # UE got the ACK of one of its data packets (the data packet is recorded)
+EV_DROP_RETX   = 8 # UE gave up after the max number of retransmissions
+EV_DROP_RATE   = 9 # tower had no per-UE budget left this step
+
+EVENT_NAMES = ["enqueue", "transmit", "tower_step", "deliver", "drop_noise",
+               "drop_buffer", "drop_ttl", "ack", "drop_retx", "drop_rate"]
+
+# Flags (or-ed into the event code passed to the hooks)
+FLAG_ACK   = 0x100 # the packet is an ACK
+FLAG_TOWER = 0x200 # the node is a tower
+FLAG_RX    = 0x400 # event on the receive path (tower: not in its buffer yet)
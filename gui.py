@@ -1,13 +1,21 @@
 import tkinter as tk
-from tkinter import messagebox, ttk
+from tkinter import messagebox, ttk, filedialog
 import math
 import itertools
 import threading
-import time
 import random
+import sys
 
 from tower import Tower
 from ue import UE
+from radio import RadioModel
+from mobility import make_mobility
+from traffic import TrafficSource, TrafficScheduler
+from engine import Pacer
+from scenario import load_scenario
+from eventlog import iter_steps, log_span, step_tx_bytes
+from metrics import MetricsRegistry, default_registry, ConsoleReport
+from profiler import PhaseProfiler
 
 # ----------------------------------------------------------------------
 # GLOBAL simulation lists (shared by GUI and simulation thread)
@@ -24,6 +32,60 @@ class DummyEnv:
 def int_to_ip(x):
     return f"{(x >> 24) & 0xFF}.{(x >> 16) & 0xFF}.{(x >> 8) & 0xFF}.{x & 0xFF}"
 
+# Most canvas redraws per second while the simulation runs
+FRAME_RATE = 30
+
+# Canvas stacking order, bottom to top (see _create_layers)
+CANVAS_LAYERS = (
+    "hexagon_cell", "tower_link", "tower_icon", "tower_ip_text",
+    "ue_connection_line", "user_equipment_body", "user_equipment_part", "ue_label",
+)
+
+# What the canvas shows of one simulation step, copied out by the sim
+# thread so the Tk thread never reads sim objects mid-step.
+#   towers : hex_id -> (status, utilization)
+#   ues    : UE sim object -> (current tower, max_data_rate, code_rate, ber, rate in Mbps)
+#   moved  : UE sim object -> (x, y) canvas pixels, every UE the mobility
+#            model moved since the last frame drawn
+#   status : status bar text, None to leave it
+class FrameSnapshot:
+    def __init__(self, timestep, towers, ues, moved, status=None):
+        self.timestep = timestep
+        self.towers = towers
+        self.ues = ues
+        self.moved = moved
+        self.status = status
+
+# Double buffer between the sim thread and the renderer: the sim thread
+# publishes a new snapshot every step, the renderer takes whichever is
+# newest at its frame rate. A snapshot that was never drawn is replaced,
+# handing its moved UEs and status text on to the newer one. Neither side
+# waits on the other for more than swapping a reference.
+class SnapshotBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = None
+        self.n_published = 0
+        self.n_dropped = 0   # replaced before the renderer got to them
+
+    def publish(self, snap):
+        with self._lock:
+            old = self._latest
+            if old is not None:
+                old.moved.update(snap.moved)
+                snap.moved = old.moved
+                if snap.status is None:
+                    snap.status = old.status
+                self.n_dropped += 1
+            self._latest = snap
+            self.n_published += 1
+
+    # Newest snapshot not drawn yet, or None
+    def take(self):
+        with self._lock:
+            snap, self._latest = self._latest, None
+        return snap
+
 class NetworkSimulationApp:
     def __init__(self, root: tk.Tk):
         self.HEX_SIZE = 60
@@ -55,11 +117,21 @@ class NetworkSimulationApp:
         self.COLOR_WARNING = "#f1c40f"   # used automatically at >= 50% utilization
         self.COLOR_OUTAGE = "#e74c3c"
         self.HEX_OUTLINE = "#000000"
+        self.STATUS_COLORS = {
+            "ACTIVE": self.COLOR_ACTIVE,
+            "WARNING": self.COLOR_WARNING,
+            "OUTAGE": self.COLOR_OUTAGE,
+            "DISABLED": self.COLOR_DISABLED,
+        }
 
         # State
         self.towers = {}              # hex_id -> tower dict
         self.tower_locations = set()  # (row, col)
         self.user_equipment = []      # list of UE dicts
+        # Indexes into the records above, updated on every create/delete
+        self.hex_of_tower = {}        # Tower sim object -> hex_id
+        self.ue_by_sim = {}           # UE sim object -> UE dict
+        self.ue_by_body = {}          # canvas id of a UE body -> UE dict
 
         self.ip_counter = itertools.count(start=0x0A000000)   # unified IPv4 counter
 
@@ -79,8 +151,8 @@ class NetworkSimulationApp:
         self._outage_remaining = 0
         self._outage_prev_status = {}
 
-        # Tower link bookkeeping
-        self._tower_link_ids = []
+        # Tower link bookkeeping: (tower, tower) -> canvas line
+        self._tower_links = {}
 
         # Create noise drop-down
         self.simulate_noise_var = tk.StringVar(value="False")
@@ -88,6 +160,43 @@ class NetworkSimulationApp:
         # Number of steps per second
         self.steps_per_sec_var = tk.StringVar(value="1")   # default: 1 step per second
 
+        # Link model: "distance" (band table) or "sinr" (path loss + interference)
+        self.link_model_var = tk.StringVar(value="distance")
+        self.radio = None   # RadioModel, built lazily by the sim thread
+
+        # Mobility model: "none", one of mobility.MOBILITY_MODELS or "trace:<path>"
+        self.mobility_var = tk.StringVar(value="none")
+        self.mobility = None        # model instance, built lazily by the sim thread
+        self._mobility_name = None  # which model self.mobility was built for
+
+        # Plain copy of the settings above for the sim thread (Tk variables
+        # may only be read on the Tk thread), refreshed on every change
+        self.sim_settings = {}
+        for var in (self.simulate_noise_var, self.steps_per_sec_var, self.link_model_var, self.mobility_var):
+            var.trace_add("write", self._sync_sim_settings)
+        self._sync_sim_settings()
+
+        # Snapshots from the sim thread and the pending renderer root.after id
+        self.frames = SnapshotBuffer()
+        self._render_job = None
+
+        # Generator-based traffic sources (tx_mode poisson/cbr/on_off/video)
+        self.traffic = TrafficScheduler()
+        self.sim_timestep = 0   # current timestep of the sim thread
+
+        # Tower outages from a loaded scenario: timestep -> [(hex_id, status)]
+        self._scheduled_outages = {}
+
+        # Event log replay: pending root.after id
+        self._replay_job = None
+
+        # Time series of the last run (metrics.MetricsRegistry)
+        self.metrics = None
+
+        # Per-phase timing of the sim loop (profiler.PhaseProfiler), only
+        # while the profiler window is open
+        self.profiler = None
+
         # Build UI
         self._setup_ui()
 
@@ -97,6 +206,7 @@ class NetworkSimulationApp:
         self.HEIGHT = self.canvas.winfo_height()
 
         self.start_x, self.start_y, self.grid_center_x, self.grid_center_y = self._calculate_grid_start()
+        self._create_layers()
         self._create_grid()
 
         # Randomly start with 5 active towers in a tree topology
@@ -257,6 +367,15 @@ class NetworkSimulationApp:
         )
         self.reset_ues_button.pack(side=tk.LEFT, padx=5)
 
+        tk.Button(
+            bottom_row,
+            text="Profiler",
+            bg="#7f8c8d",
+            fg="white",
+            relief=tk.FLAT,
+            command=self.open_profiler_window,
+        ).pack(side=tk.LEFT, padx=5)
+
         self.action_var = tk.StringVar(value="Current Action: None")
         tk.Label(
             bottom_row,
@@ -292,6 +411,63 @@ class NetworkSimulationApp:
         )
         self.steps_per_sec_entry.pack(side=tk.LEFT)
 
+        # Link model dropdown
+        tk.Label(
+            top_row, text="Link Model:", bg=self.UI_COLOR
+        ).pack(side=tk.LEFT, padx=(15, 5))
+
+        link_model_box = ttk.Combobox(
+            top_row,
+            textvariable=self.link_model_var,
+            values=["distance", "sinr"],
+            state="readonly",
+            width=9
+        )
+        link_model_box.pack(side=tk.LEFT)
+        link_model_box.current(0)   # default "distance"
+
+        # Mobility dropdown
+        tk.Label(
+            top_row, text="Mobility:", bg=self.UI_COLOR
+        ).pack(side=tk.LEFT, padx=(15, 5))
+
+        mobility_box = ttk.Combobox(
+            top_row,
+            textvariable=self.mobility_var,
+            values=["none", "random_waypoint", "gauss_markov", "manhattan"],
+            state="readonly",
+            width=15
+        )
+        mobility_box.pack(side=tk.LEFT)
+        mobility_box.current(0)   # default "none"
+
+        tk.Button(
+            top_row,
+            text="Load Trace",
+            command=self.load_mobility_trace,
+            bg="#7f8c8d",
+            fg="white",
+            relief=tk.FLAT,
+        ).pack(side=tk.LEFT, padx=5)
+
+        tk.Button(
+            top_row,
+            text="Load Scenario",
+            command=self.load_scenario_file,
+            bg="#7f8c8d",
+            fg="white",
+            relief=tk.FLAT,
+        ).pack(side=tk.LEFT, padx=5)
+
+        tk.Button(
+            top_row,
+            text="Replay Log",
+            command=self.replay_event_log,
+            bg="#7f8c8d",
+            fg="white",
+            relief=tk.FLAT,
+        ).pack(side=tk.LEFT, padx=5)
+
         # Canvas
         self.canvas = tk.Canvas(
             main_frame,
@@ -388,26 +564,33 @@ class NetworkSimulationApp:
             pts.append((cx + size * math.cos(ang), cy + size * math.sin(ang)))
         return pts
 
-    def _draw_hexagon(self, x, y, row, col):
+    def _draw_hexagon(self, x, y, row, col, tower_sim=None):
         """
         Draws a single tower hex, always showing:
         - Hex outline
         - Carrot icon ^
         - Tower IP
         No telemetry here (as requested).
+        tower_sim: existing Tower (e.g. from a scenario), otherwise a new
+        one is created with the next IP.
         """
-        tower_ip = next(self.ip_counter)
-        tower_id = int_to_ip(tower_ip)
-
-        tower_sim = Tower(
-            # env=self.env,
-            # tower_id=f"GridTower_R{row}_C{col}",
-            tower_id=tower_id,
-            x_pos=x * self.METERS_PER_PIXEL,
-            y_pos=y * self.METERS_PER_PIXEL,
-            t_delta=self.t_delta,
-            ip_addr=tower_ip,
-        )
+        if tower_sim is None:
+            tower_ip = next(self.ip_counter)
+            tower_id = int_to_ip(tower_ip)
+
+            tower_sim = Tower(
+                # env=self.env,
+                # tower_id=f"GridTower_R{row}_C{col}",
+                tower_id=tower_id,
+                x_pos=x * self.METERS_PER_PIXEL,
+                y_pos=y * self.METERS_PER_PIXEL,
+                t_delta=self.t_delta,
+                ip_addr=tower_ip,
+            )
+        else:
+            tower_ip = tower_sim.ip_addr
+            tower_id = int_to_ip(tower_ip)
+            tower_sim.tower_id = tower_id
 
         corners = self._hex_corners(x, y, self.HEX_SIZE)
         hex_id = self.canvas.create_polygon(
@@ -447,19 +630,52 @@ class NetworkSimulationApp:
             "ip_text_id": ip_text_id,
             "ip_addr": tower_ip,
             "sim_object": tower_sim,
+            "fill": self.COLOR_DISABLED,
         }
+        self.hex_of_tower[tower_sim] = hex_id
 
         self.tower_locations.add((row, col))
 
+        # New tower column -> rebuild the gain matrix on the next step
+        self.radio = None
+
         # Keep hex at bottom, carrot & IP on top
-        self.canvas.tag_lower(hex_id)
-        self.canvas.tag_raise(icon_id)
-        self.canvas.tag_raise(ip_text_id)
+        self._to_layer(hex_id, "hexagon_cell")
+        self._to_layer(icon_id, "tower_icon")
+        self._to_layer(ip_text_id, "tower_ip_text")
 
         # Bind tower click
         for obj in (hex_id, icon_id, ip_text_id):
             self.canvas.tag_bind(obj, "<Button-1>", lambda e, hid=hex_id: self.on_tower_click(hid))
 
+        return hex_id
+
+    def _create_layers(self):
+        """
+        One hidden marker item per CANVAS_LAYERS entry, created in order
+        before anything else. _to_layer() slots an item in right below the
+        marker of its layer, so new items land in place and nothing has to
+        be re-stacked afterwards.
+        """
+        self._layer_marks = {}
+        for layer in CANVAS_LAYERS:
+            self._layer_marks[layer] = self.canvas.create_line(0, 0, 0, 0, state="hidden", tags=("layer_mark",))
+
+    # Put item (id or tag) on top of everything in layer
+    def _to_layer(self, item, layer):
+        self.canvas.tag_lower(item, self._layer_marks[layer])
+
+    def _set_tower_fill(self, hex_id, color):
+        data = self.towers[hex_id]
+        if data.get("fill") != color:
+            self.canvas.itemconfig(hex_id, fill=color)
+            data["fill"] = color
+
+    def _set_ue_label(self, ue_data, text):
+        if ue_data.get("label_text") != text:
+            self.canvas.itemconfig(ue_data["label_id"], text=text)
+            ue_data["label_text"] = text
+
     def _create_grid(self):
         count = 0
         for r in range(self.GRID_ROWS):
@@ -555,28 +771,35 @@ class NetworkSimulationApp:
     # ------------------------------------------------------------------
     # UEs: create, drag, delete
     # ------------------------------------------------------------------
-    def add_user_equipment(self, x, y):
+    def add_user_equipment(self, x, y, ue_sim=None):
         """
         Draws a UE (rectangle + antenna) and sets up its sim object.
+        ue_sim: existing UE (e.g. from a scenario), otherwise a new one is
+        created with the next IP.
         """
-        ue_ip = next(self.ip_counter)
-        ue_id = int_to_ip(ue_ip)
-
-        ue_sim = UE(
-            # env=self.env,
-            # ue_id=len(self.user_equipment),
-            ue_id=ue_id,
-            x_pos=x * self.METERS_PER_PIXEL,
-            y_pos=y * self.METERS_PER_PIXEL,
-            towers=self.active_towers_list,
-            t_delta=self.t_delta,
-            ip_addr=ue_ip
-        )
+        if ue_sim is None:
+            ue_ip = next(self.ip_counter)
+            ue_id = int_to_ip(ue_ip)
+
+            ue_sim = UE(
+                # env=self.env,
+                # ue_id=len(self.user_equipment),
+                ue_id=ue_id,
+                x_pos=x * self.METERS_PER_PIXEL,
+                y_pos=y * self.METERS_PER_PIXEL,
+                towers=self.active_towers_list,
+                t_delta=self.t_delta,
+                ip_addr=ue_ip
+            )
+        else:
+            ue_ip = ue_sim.ip_addr
+            ue_id = int_to_ip(ue_ip)
+            ue_sim.ue_id = ue_id
 
         ue_sim.tx_target_ip = None
         ue_sim.tx_mode = "fixed"   # fixed, random, max
         ue_sim.tx_n_bytes = 512
-        ue_sim.gui_last_n_tx_bytes = 0
+        ue_sim.tx_source = None    # TrafficSource from a scenario (tx_mode "scenario")
 
         self.active_ues_list.append(ue_sim)
         GLOBAL_UES.append(ue_sim)
@@ -611,26 +834,32 @@ class NetworkSimulationApp:
 
         # UE label
         max_mbps = (ue_sim.max_data_rate * getattr(ue_sim, "code_rate", 1)) * 1e-6
+        label_text = f"IP: {ue_id} | Max: {max_mbps:.1f} Mbps | CR: N/A\nActual: 0.000 Mbps | BER: 0.0"
         label = self.canvas.create_text(
             x, y + 30,
-            text=f"IP: {ue_id} | Max: {max_mbps:.1f} Mbps | CR: N/A\nActual: 0.000 Mbps | BER: 0.0",
+            text=label_text,
             font=("Arial", 9), fill="black",
             tags=("ue_label", f"ue_label_{body}")
         )
 
-        self.user_equipment.append({
+        ue_data = {
             "id": body,
             "parts": [ant, dot, scr],
             "x": x, "y": y,                  # canvas pixels
             "ip_addr": ue_ip,
             "sim_object": ue_sim,
             "conn_line_id": None,
+            "conn_key": None,                # (hex_id, x, y) the line was drawn for
             "label_id": label,
-        })
+            "label_text": label_text,
+        }
+        self.user_equipment.append(ue_data)
+        self.ue_by_sim[ue_sim] = ue_data
+        self.ue_by_body[body] = ue_data
 
-        self.canvas.tag_raise(body)
-        self.canvas.tag_raise(f"part_{body}")
-        self.canvas.tag_raise(label)
+        self._to_layer(body, "user_equipment_body")
+        self._to_layer(f"part_{body}", "user_equipment_part")
+        self._to_layer(label, "ue_label")
 
     def on_user_press(self, event):
         """
@@ -646,10 +875,10 @@ class NetworkSimulationApp:
         self._drag_data["y"] = event.y
         self._drag_data["dragging"] = False
 
-        # Bring UE layers to top
-        self.canvas.tag_raise(item)
-        self.canvas.tag_raise(f"part_{item}")
-        self.canvas.tag_raise("ue_label")
+        # Bring the UE to the top of its layers
+        self._to_layer(item, "user_equipment_body")
+        self._to_layer(f"part_{item}", "user_equipment_part")
+        self._to_layer(f"ue_label_{item}", "ue_label")
 
     def on_user_drag(self, event):
         """
@@ -682,7 +911,7 @@ class NetworkSimulationApp:
         self._drag_data["y"] = event.y
 
         # Update sim + label
-        ue_data = next((u for u in self.user_equipment if u["id"] == item), None)
+        ue_data = self.ue_by_body.get(item)
         if ue_data:
             ue = ue_data["sim_object"]
 
@@ -707,7 +936,7 @@ class NetworkSimulationApp:
         if item is None:
             return
 
-        ue_data = next((u for u in self.user_equipment if u["id"] == item), None)
+        ue_data = self.ue_by_body.get(item)
         if ue_data:
             bbox = self.canvas.bbox(item)
             cx, cy = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
@@ -738,46 +967,162 @@ class NetworkSimulationApp:
         """
         Draws/updates the green UE→Tower line.
         """
-        old = ue_data.get("conn_line_id")
-        if old:
-            self.canvas.delete(old)
-
         ue = ue_data["sim_object"]
-        tower = getattr(ue, "current_tower", None)
-        if tower is None:
-            ue_data["conn_line_id"] = None
+        self._draw_connection_line(ue_data, getattr(ue, "current_tower", None))
+
+    def _draw_connection_line(self, ue_data, tower):
+        """
+        Points the UE→Tower line at tower (None: hides it). The line item
+        is kept and only moved when the tower or the UE position changed.
+        """
+        line = ue_data.get("conn_line_id")
+        hex_id = self.hex_of_tower.get(tower)   # None once the tower is deleted
+        key = (hex_id, ue_data["x"], ue_data["y"])
+        if key == ue_data.get("conn_key") and (line or hex_id is None):
             return
 
-        # Tower coordinates
-        tx = ty = None
-        for hex_id, t in self.towers.items():
-            if t["sim_object"] is tower:
-                tx, ty = t["x"], t["y"]
-                break
-
-        if tx is None:
-            ue_data["conn_line_id"] = None
+        if hex_id is None:
+            if line:
+                self.canvas.itemconfig(line, state="hidden")
+            ue_data["conn_key"] = key
             return
 
+        # Tower coordinates
+        tx, ty = self.towers[hex_id]["x"], self.towers[hex_id]["y"]
         x, y = ue_data["x"], ue_data["y"]
-        line = self.canvas.create_line(
-            x, y, tx, ty,
-            # fill=self.COLOR_ACTIVE,
-            fill="#3498db",
-            width=2,
-            tags=("ue_connection_line",)
+        if not line:
+            line = self.canvas.create_line(
+                x, y, tx, ty,
+                # fill=self.COLOR_ACTIVE,
+                fill="#3498db",
+                width=2,
+                tags=("ue_connection_line",)
+            )
+            self._to_layer(line, "ue_connection_line")
+            ue_data["conn_line_id"] = line
+        else:
+            self.canvas.coords(line, x, y, tx, ty)
+            prev = ue_data.get("conn_key")
+            if prev is None or prev[0] is None:
+                self.canvas.itemconfig(line, state="normal")
+        ue_data["conn_key"] = key
+
+    def load_mobility_trace(self):
+        """
+        Pick a recorded mobility trace (CSV or binary). It is streamed by
+        the sim thread, keyed by UE IP and timestep.
+        """
+        path = filedialog.askopenfilename(
+            title="Load mobility trace",
+            filetypes=[("Mobility traces", "*.csv *.bin"), ("All files", "*.*")],
         )
+        if not path:
+            return
+        self.mobility_var.set(f"trace:{path}")
+        self.status_var.set(f"Mobility trace: {path}")
 
-        # Correct visual stacking
-        self.canvas.tag_lower("hexagon_cell")
-        self.canvas.tag_raise("tower_icon")
-        self.canvas.tag_raise("tower_ip_text")
-        self.canvas.tag_raise(line)
-        self.canvas.tag_raise("user_equipment_body")
-        self.canvas.tag_raise("user_equipment_part")
-        self.canvas.tag_raise("ue_label")
+    def load_scenario_file(self, path=None):
+        """
+        Replace every tower and UE with the ones from a scenario file
+        (JSON or binary, see scenario.py). Positions are in meters.
+        """
+        if self.sim_running:
+            messagebox.showwarning("Simulation running", "Stop the simulation before loading a scenario.")
+            return
+        if path is None:
+            path = filedialog.askopenfilename(
+                title="Load scenario",
+                filetypes=[("Scenarios", "*.json *.bin"), ("All files", "*.*")],
+            )
+            if not path:
+                return
+        try:
+            scn = load_scenario(path)
+            towers, ues = scn.build(self.t_delta)
+            traffic = scn.make_traffic(ues)
+            outages = scn.outage_schedule(towers)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Load scenario", f"Could not load {path}:\n{e}")
+            return
 
-        ue_data["conn_line_id"] = line
+        # Clear the current network
+        for hex_id, data in self.towers.items():
+            self.canvas.delete(hex_id)
+            self.canvas.delete(data["icon_id"])
+            self.canvas.delete(data["ip_text_id"])
+        for ue_data in self.user_equipment:
+            self.canvas.delete(ue_data["id"])
+            for pid in ue_data["parts"]:
+                self.canvas.delete(pid)
+            self.canvas.delete(ue_data["label_id"])
+            if ue_data.get("conn_line_id"):
+                self.canvas.delete(ue_data["conn_line_id"])
+        self.towers.clear()
+        self.tower_locations.clear()
+        self.user_equipment.clear()
+        self.hex_of_tower.clear()
+        self.ue_by_sim.clear()
+        self.ue_by_body.clear()
+        self.active_towers_list.clear()
+        self.active_ues_list.clear()
+        GLOBAL_TOWERS.clear()
+        GLOBAL_UES.clear()
+        self.radio = None
+        self.mobility = None
+        self.traffic = TrafficScheduler()
+
+        # Towers (backhaul links come with the sim objects)
+        mpp = self.METERS_PER_PIXEL
+        hex_of = {}
+        for tower in towers:
+            x = tower.x_pos / mpp
+            y = tower.y_pos / mpp
+            r, c, _, _ = self._snap_to_grid(x, y)
+            hex_id = self._draw_hexagon(x, y, r, c, tower_sim=tower)
+            hex_of[tower] = hex_id
+            if tower.operational:
+                GLOBAL_TOWERS.append(tower)
+                self.active_towers_list.append(tower)
+                self._set_tower_fill(hex_id, self.COLOR_ACTIVE)
+                self.towers[hex_id]["status"] = "ACTIVE"
+
+        # UEs
+        for ue in ues:
+            self.add_user_equipment(ue.x_pos / mpp, ue.y_pos / mpp, ue_sim=ue)
+            ue.update_towers(list(GLOBAL_TOWERS))
+
+        # Traffic: remembered per UE and restarted on every Start SIM
+        if traffic is not None:
+            for ue, src in traffic.sources.items():
+                ue.tx_source = src
+                ue.tx_mode = "scenario"
+                ue.tx_target_ip = src.dest if isinstance(src.dest, int) else None
+
+        # Outages (applied by the sim thread)
+        self._scheduled_outages = {}
+        for tower, start, duration in outages:
+            self._scheduled_outages.setdefault(start, []).append((hex_of[tower], "OUTAGE"))
+            self._scheduled_outages.setdefault(start + duration, []).append((hex_of[tower], "ACTIVE"))
+
+        all_ips = [t.ip_addr for t in towers] + [ue.ip_addr for ue in ues]
+        if all_ips:
+            self.ip_counter = itertools.count(start=max(all_ips) + 1)
+
+        self.draw_tower_links()
+        self.refresh_all_connection_lines()
+        self.status_var.set(f"Scenario {path}: {len(towers)} towers, {len(ues)} UEs, {len(outages)} outages")
+
+    def _move_ue_icon(self, ue_data, new_x, new_y):
+        """
+        Move a UE icon (body, parts, label) to canvas pixels new_x, new_y.
+        Runs on the Tk thread.
+        """
+        dx, dy = new_x - ue_data["x"], new_y - ue_data["y"]
+        body = ue_data["id"]
+        self.canvas.move(body, dx, dy)
+        self.canvas.move(f"part_{body}", dx, dy)
+        self.canvas.coords(ue_data["label_id"], new_x, new_y + 30)
+        ue_data["x"], ue_data["y"] = new_x, new_y
 
     def refresh_all_connection_lines(self):
         for ue_data in self.user_equipment:
@@ -789,60 +1134,45 @@ class NetworkSimulationApp:
     def draw_tower_links(self):
         """
         Always draw ALL tower-to-tower backhaul links.
-        Dotted blue lines remain visible at all times.
+        Dotted blue lines remain visible at all times. Only links that
+        appeared or disappeared since the last call touch the canvas.
         """
-        # Clear previous lines
-        for lid in self._tower_link_ids:
-            self.canvas.delete(lid)
-        self._tower_link_ids.clear()
-
-        # Draw every existing tower connection
-        seen = set()
-
-        for hex_id, data in self.towers.items():
+        # Every existing tower connection
+        links = {}
+        for data in self.towers.values():
             sim = data["sim_object"]
-            x1, y1 = data["x"], data["y"]
-
             for other in getattr(sim, "connected_towers", []):
-                pair = tuple(sorted((id(sim), id(other))))
-                if pair in seen:
-                    continue
-                seen.add(pair)
-
-                # find GUI coords of the connected tower
-                for hid2, d2 in self.towers.items():
-                    if d2["sim_object"] is other:
-                        x2, y2 = d2["x"], d2["y"]
-                        break
-                else:
+                hex_id = self.hex_of_tower.get(other)
+                if hex_id is None:
                     continue
-
-                line = self.canvas.create_line(
-                    x1, y1, x2, y2,
-                    fill="#3498db",
-                    width=2,
-                    dash=(4, 4),
-                    tags=("tower_link",)
-                )
-
-                self._tower_link_ids.append(line)
-
-            # Make them sit BELOW UE→tower lines but ABOVE the hex cells
-            # 1) ensure links are above the hexagon cells
-            self.canvas.tag_raise("tower_link", "hexagon_cell")
-
-            # 2) if UE→tower connection lines exist, put links just below them
-            if self.canvas.find_withtag("ue_connection_line"):
-                self.canvas.tag_lower("tower_link", "ue_connection_line")
-
-
-
+                pair = (sim, other) if id(sim) < id(other) else (other, sim)
+                if pair not in links:
+                    d2 = self.towers[hex_id]
+                    links[pair] = (data["x"], data["y"], d2["x"], d2["y"])
+
+        # Remove lines of links that are gone
+        for pair in [p for p in self._tower_links if p not in links]:
+            self.canvas.delete(self._tower_links.pop(pair))
+
+        # Add lines for new links (below UE→tower lines, above the hex cells)
+        for pair, coords in links.items():
+            if pair in self._tower_links:
+                continue
+            line = self.canvas.create_line(
+                *coords,
+                fill="#3498db",
+                width=2,
+                dash=(4, 4),
+                tags=("tower_link",)
+            )
+            self._to_layer(line, "tower_link")
+            self._tower_links[pair] = line
 
     # ----------------------------------------------------------------------
     # UE Popup + Transmit Config Window
     # ----------------------------------------------------------------------
     def show_ue_popup_by_id(self, body_id):
-        ue_data = next((u for u in self.user_equipment if u["id"] == body_id), None)
+        ue_data = self.ue_by_body.get(body_id)
         if ue_data:
             self._show_ue_popup(ue_data)
 
@@ -868,7 +1198,7 @@ class NetworkSimulationApp:
         tk.Label(top, text=f"Connected Tower: {tower_ip}", bg=self.UI_COLOR).pack()
         tk.Label(top, text=f"Band: {band}, Code Rate: {cr_str}", bg=self.UI_COLOR).pack()
 
-        actual_mbps = ue.gui_last_n_tx_bytes * 8e-6 * int(self.steps_per_sec_var.get())
+        actual_mbps = self._latest_rates()[1].get(ue.ip_addr, 0.0)
         effective_max = ue.max_data_rate * (ue.code_rate or 1)
         max_mbps = effective_max * 1e-6
 
@@ -911,7 +1241,7 @@ class NetworkSimulationApp:
         """
         win = tk.Toplevel(self.root)
         win.title(f"Transmit from UE {int_to_ip(sender_ue.ip_addr)}")
-        win.geometry("380x420")     # Taller so nothing is truncated
+        win.geometry("380x520")     # Taller so nothing is truncated
         win.configure(bg=self.UI_COLOR)
 
         tk.Label(
@@ -998,6 +1328,21 @@ class NetworkSimulationApp:
             bg=self.UI_COLOR,
         ).pack(anchor="w")
 
+        # Generator-based sources (packet size = Number of bytes)
+        for value, text in (
+            ("poisson", "Poisson (1 packet/step avg)"),
+            ("cbr", "CBR (1 packet/step)"),
+            ("on_off", "On/Off bursty"),
+            ("video", "Video-like (I/P frames)"),
+        ):
+            tk.Radiobutton(
+                mode_frame,
+                text=text,
+                variable=mode_var,
+                value=value,
+                bg=self.UI_COLOR,
+            ).pack(anchor="w")
+
         # -----------------------------------
         # FIXED BYTE ENTRY
         # -----------------------------------
@@ -1033,6 +1378,9 @@ class NetworkSimulationApp:
             sender_ue.tx_mode = mode
             sender_ue.tx_n_bytes = nbytes
 
+            # Generator-based modes are driven by the traffic scheduler
+            self._set_traffic_source(sender_ue, start=self.sim_timestep)
+
             if dest_ip is None:
                 self.status_var.set(f"UE {int_to_ip(sender_ue.ip_addr)}: TX disabled.")
             else:
@@ -1040,6 +1388,11 @@ class NetworkSimulationApp:
                     "fixed": f"Fixed {nbytes} bytes",
                     "random": "Random bytes",
                     "max": "Max rate mode",
+                    "poisson": f"Poisson {nbytes}-byte packets",
+                    "cbr": f"CBR {nbytes}-byte packets",
+                    "on_off": f"On/Off {nbytes}-byte packets",
+                    "video": "Video-like traffic",
+                    "scenario": "Scenario traffic",
                 }[mode]
                 self.status_var.set(f"UE {int_to_ip(sender_ue.ip_addr)}: {msg} → IP {int_to_ip(dest_ip)}")
 
@@ -1054,6 +1407,21 @@ class NetworkSimulationApp:
             command=apply_settings,
         ).pack(pady=12, fill=tk.X, padx=20)
 
+    def _set_traffic_source(self, ue, start=0):
+        """
+        (Re)register a UE with the traffic scheduler if its tx_mode is one
+        of the generator-based sources, otherwise drop it.
+        """
+        src = getattr(ue, "tx_source", None)
+        if ue.tx_mode == "scenario" and src is not None:
+            # Fresh copy so a restarted sim replays the scenario from the top
+            self.traffic.set_source(ue, TrafficSource(src.kind, src.dest, seed=src.seed, start=start + src.start, **src.params))
+        elif ue.tx_target_ip is not None and ue.tx_mode in ("poisson", "cbr", "on_off", "video"):
+            params = {"size": ue.tx_n_bytes} if ue.tx_mode != "video" else {}
+            self.traffic.set_source(ue, TrafficSource(ue.tx_mode, ue.tx_target_ip, start=start, **params))
+        else:
+            self.traffic.remove(ue)
+
     # Change the distance based on band representation
     def on_band_change(self, *args):
         band = self.visual_band_var.get()
@@ -1072,6 +1440,11 @@ class NetworkSimulationApp:
             ue.x_pos = ue_data["x"] * self.METERS_PER_PIXEL
             ue.y_pos = ue_data["y"] * self.METERS_PER_PIXEL
 
+        # Tower positions changed -> cached gains are stale
+        self.radio = None
+        # Canvas bounds in meters changed -> rebuild mobility model
+        self.mobility = None
+
         self.status_var.set(f"Band changed to {band.upper()} – coverage updated.")
 
         self.draw_tower_links()
@@ -1080,14 +1453,13 @@ class NetworkSimulationApp:
     # DELETE UE
     # ----------------------------------------------------------------------
     def delete_ue(self, ue_id, top_window):
-        # Find UE index
-        try:
-            idx = next(i for i, d in enumerate(self.user_equipment) if d["id"] == ue_id)
-        except StopIteration:
+        ue_data = self.ue_by_body.pop(ue_id, None)
+        if ue_data is None:
             top_window.destroy()
             return
 
-        ue_data = self.user_equipment.pop(idx)
+        self.user_equipment.remove(ue_data)
+        self.ue_by_sim.pop(ue_data["sim_object"], None)
 
         # Remove line
         if ue_data.get("conn_line_id"):
@@ -1104,6 +1476,9 @@ class NetworkSimulationApp:
             self.active_ues_list.remove(sim_obj)
         if sim_obj in GLOBAL_UES:
             GLOBAL_UES.remove(sim_obj)
+        if self.radio is not None:
+            self.radio.remove_ue(sim_obj)
+        self.traffic.remove(sim_obj)
 
         self.status_var.set(f"UE (IP {ue_data['ip_addr']}) deleted.")
         top_window.destroy()
@@ -1132,7 +1507,7 @@ class NetworkSimulationApp:
 
 
         # GUI color
-        self.canvas.itemconfig(hex_id, fill=self.COLOR_ACTIVE)
+        self._set_tower_fill(hex_id, self.COLOR_ACTIVE)
         data["status"] = "ACTIVE"
 
         # UEs attach in simulation loop only
@@ -1153,7 +1528,7 @@ class NetworkSimulationApp:
             self.active_towers_list.remove(sim)
 
         # GUI color
-        self.canvas.itemconfig(hex_id, fill=self.COLOR_DISABLED)
+        self._set_tower_fill(hex_id, self.COLOR_DISABLED)
         data["status"] = "DISABLED"
 
         # Detach UEs and remove green lines
@@ -1186,7 +1561,9 @@ class NetworkSimulationApp:
             GLOBAL_TOWERS.remove(sim)
 
         del self.towers[hex_id]
+        self.hex_of_tower.pop(sim, None)
         self.tower_locations.discard((data["row"], data["col"]))
+        self.radio = None
 
         self.draw_tower_links()
 
@@ -1198,13 +1575,33 @@ class NetworkSimulationApp:
         Handles ACTIVE / WARNING / OUTAGE / DISABLED logic and tower coloring.
         """
         data = self.towers.get(hex_id)
+        if not data:
+            return
+
+        self._apply_tower_status(hex_id, status)
+        self._set_tower_fill(hex_id, self.STATUS_COLORS.get(status, self.COLOR_DISABLED))
+
+        # -----------------------------
+        # REDRAW LINKS (BLUE + GREEN)
+        # -----------------------------
+        self.draw_tower_links()
+        self.refresh_all_connection_lines()
+
+        self.status_var.set(f"{data['id']} (IP {data['ip_addr']}) → {status}")
+
+    def _apply_tower_status(self, hex_id, status):
+        """
+        The simulation side of set_tower_status: tower lists and UE
+        attachments, no canvas calls, so the sim thread can use it too (the
+        renderer then colors the tower from the next snapshot).
+        """
+        data = self.towers.get(hex_id)
         if not data:
             return
         sim = data["sim_object"]
 
         # ----- Status transitions -----
         if status == "ACTIVE":
-            color = self.COLOR_ACTIVE
             sim.operational = True
             if sim not in GLOBAL_TOWERS:
                 GLOBAL_TOWERS.append(sim)
@@ -1213,7 +1610,6 @@ class NetworkSimulationApp:
 
         elif status == "WARNING":
             # Yellow but still operational
-            color = self.COLOR_WARNING
             sim.operational = True
             # if sim not in GLOBAL_TOWERS:
                 # GLOBAL_TOWERS.append(sim)
@@ -1221,7 +1617,6 @@ class NetworkSimulationApp:
                 self.active_towers_list.append(sim)
 
         elif status == "OUTAGE":
-            color = self.COLOR_OUTAGE
             sim.operational = False
             if sim in GLOBAL_TOWERS:
                 GLOBAL_TOWERS.remove(sim)
@@ -1229,7 +1624,6 @@ class NetworkSimulationApp:
                 self.active_towers_list.remove(sim)
 
         else:  # status == "DISABLED"
-            color = self.COLOR_DISABLED
             sim.operational = False
 
             # Remove from tower lists so UEs don't consider this tower
@@ -1244,17 +1638,12 @@ class NetworkSimulationApp:
                     other.connected_towers.remove(sim)
                 sim.connected_towers.remove(other)
 
-            # Detach any UEs currently attached to this tower and clear their UE→tower line
+            # Detach any UEs currently attached to this tower
             for ue_data in self.user_equipment:
                 ue_sim = ue_data["sim_object"]
                 if getattr(ue_sim, "current_tower", None) is sim:
                     ue_sim.current_tower = None
-                    if ue_data.get("conn_line_id"):
-                        self.canvas.delete(ue_data["conn_line_id"])
-                        ue_data["conn_line_id"] = None
-
 
-        self.canvas.itemconfig(hex_id, fill=color)
         data["status"] = status
 
         # UEs must recompute their internal attachment when tower set changes
@@ -1268,23 +1657,6 @@ class NetworkSimulationApp:
             except Exception as e:
                 print("UE update_towers error in set_tower_status:", e)
 
-            # If UE is no longer attached, remove green line
-            if ue.current_tower is None and ue_data.get("conn_line_id"):
-                self.canvas.delete(ue_data["conn_line_id"])
-                ue_data["conn_line_id"] = None
-
-
-        # -----------------------------
-        # REDRAW LINKS (BLUE + GREEN)
-        # -----------------------------
-        self.draw_tower_links()
-        self.refresh_all_connection_lines()
-
-        self.status_var.set(f"{data['id']} (IP {data['ip_addr']}) → {status}")
-
-
-        self.status_var.set(f"{data['id']} (IP {data['ip_addr']}) → {status}")
-
     # ----------------------------------------------------------------------
     # Tower UI Panel (Connect / Disconnect / Rates)
     # ----------------------------------------------------------------------
@@ -1331,7 +1703,7 @@ class NetworkSimulationApp:
         def update_live_rate():
             if not top.winfo_exists():
                 return
-            cur_mbps = getattr(tower_sim, "gui_last_n_tx_bytes", 0) * 8e-6
+            cur_mbps = self._latest_rates()[0].get(tower_sim.ip_addr, 0.0)
             cur_label.config(text=f"Current Data Rate: {cur_mbps:.3f} Mbps")
             top.after(300, update_live_rate)
 
@@ -1416,6 +1788,7 @@ class NetworkSimulationApp:
                     self.status_var.set(
                         f"Tower {int_to_ip(data['ip_addr'])} connected to Tower {ip_str}."
                     )
+                    self.draw_tower_links()
 
         tk.Button(
             top,
@@ -1439,10 +1812,9 @@ class NetworkSimulationApp:
         # Build list of connected towers
         disc_list = []
         for other in getattr(tower_sim, "connected_towers", []):
-            for h2, d2 in self.towers.items():
-                if d2["sim_object"] is other:
-                    disc_list.append((d2["ip_addr"], other))
-                    break
+            h2 = self.hex_of_tower.get(other)
+            if h2 is not None:
+                disc_list.append((self.towers[h2]["ip_addr"], other))
 
         disc_list.sort(key=lambda x: x[0])
         disc_vals = [str(ip) for ip, _ in disc_list] or ["(no connected towers)"]
@@ -1467,6 +1839,7 @@ class NetworkSimulationApp:
                     self.status_var.set(
                         f"Disconnected Tower {data['ip_addr']} from Tower {ip_str}."
                     )
+                    self.draw_tower_links()
 
 
         tk.Button(
@@ -1555,10 +1928,10 @@ class NetworkSimulationApp:
     def reset_all_ues_tx(self):
         """Reset all UE transmit settings to NONE."""
         for ue in GLOBAL_UES:
+            self.traffic.remove(ue)
             ue.tx_target_ip = None
             ue.tx_mode = "fixed"
             ue.tx_n_bytes = 0
-            ue.gui_last_n_tx_bytes = 0
             ue.clear_buffer()
         self.status_var.set("All UE TX settings reset.")
 
@@ -1585,11 +1958,19 @@ class NetworkSimulationApp:
         for t in GLOBAL_TOWERS:
             t.tx_attempts = len(GLOBAL_TOWERS)+1
 
+        # Timesteps restart at 0, so restart the traffic sources too
+        self.sim_timestep = 0
+        self.traffic = TrafficScheduler()
+        for ue in GLOBAL_UES:
+            self._set_traffic_source(ue)
+
         self.sim_running = True
+        self.frames = SnapshotBuffer()
         self.sim_thread = threading.Thread(
             target=self.simulation_loop, daemon=True
         )
         self.sim_thread.start()
+        self._start_renderer()
         self.status_var.set("Simulation running...")
 
         for ue in GLOBAL_UES:
@@ -1605,45 +1986,264 @@ class NetworkSimulationApp:
     # DYNAMIC UE LABEL UPDATE (IP, Max, CR, Actual)
     # ----------------------------------------------------------------------
     def _update_ue_labels(self):
+        ue_rates = self._latest_rates()[1]
         for ue_data in self.user_equipment:
             ue = ue_data["sim_object"]
-            lbl = ue_data["label_id"]
+            self._set_ue_label(ue_data, self._ue_label_text(
+                ue, ue.max_data_rate, getattr(ue, "code_rate", 1.0),
+                getattr(ue, "ber", 0), ue_rates.get(ue.ip_addr, 0.0),
+            ))
+
+    @staticmethod
+    def _ue_label_text(ue, max_data_rate, cr, ber, actual_mbps):
+        max_mbps = max_data_rate * cr * 1e-6
+        cr_str = f"{cr:.3f}" if isinstance(cr, (int, float)) else "N/A"
+        return (
+            f"IP: {int_to_ip(ue.ip_addr)} | Max: {max_mbps:.1f} Mbps | CR: {cr_str}\n"
+            f"Actual: {actual_mbps:.3f} Mbps | BER: {ber*1e5:.3f}E-5"
+        )
+
+    # ----------------------------------------------------------------------
+    # AUTO WARNING COLOR (>= 50% LOAD) - VISUAL ONLY
+    # ----------------------------------------------------------------------
+    def _update_tower_colors(self):
+        tower_rates = self._latest_rates()[0]
+        for hex_id, data in self.towers.items():
+            sim = data["sim_object"]
 
-            cr = getattr(ue, "code_rate", 1.0)
-            ber = getattr(ue, "ber", 0)
-            max_effective = ue.max_data_rate * cr
-            max_mbps = max_effective * 1e-6
+            if data["status"] not in ("ACTIVE", "WARNING"):
+                continue
+
+            try:
+                # Only adjust COLOR, DO NOT change status or GLOBAL_TOWERS
+                utilization = self._utilization(sim, tower_rates.get(sim.ip_addr, 0.0))
+                self._set_tower_fill(hex_id, self._tower_color(data["status"], utilization))
+            except:
+                pass
 
-            actual_mbps = getattr(ue, "gui_last_n_tx_bytes", 0) * 8e-6
+    # Tower and UE data rates (ip -> Mbps) of the last metrics sample,
+    # empty before the first run
+    def _latest_rates(self):
+        if self.metrics is None:
+            return {}, {}
+        return self.metrics.latest("tower.rate_mbps"), self.metrics.latest("ue.rate_mbps")
 
-            cr_str = f"{cr:.3f}" if isinstance(cr, (int, float)) else "N/A"
+    @staticmethod
+    def _utilization(sim, rate_mbps):
+        max_bps = sim.max_data_rate
+        return rate_mbps * 1e6 / max_bps if max_bps > 0 else 0.0
+
+    def _tower_color(self, status, utilization):
+        if status in ("ACTIVE", "WARNING"):
+            return self.COLOR_WARNING if utilization >= 0.5 else self.COLOR_ACTIVE
+        return self.STATUS_COLORS.get(status, self.COLOR_DISABLED)
 
-            self.canvas.itemconfig(
-                lbl,
-                text=(
-                    f"IP: {int_to_ip(ue.ip_addr)} | Max: {max_mbps:.1f} Mbps | CR: {cr_str}\n"
-                    f"Actual: {actual_mbps:.3f} Mbps | BER: {ber*1e5:.3f}E-5"
-                )
+    # ----------------------------------------------------------------------
+    # RENDERER (draws the newest sim snapshot on the Tk thread)
+    # ----------------------------------------------------------------------
+    def _sync_sim_settings(self, *args):
+        try:
+            n_steps = max(1, int(self.steps_per_sec_var.get()))
+        except ValueError:
+            n_steps = 1
+        self.sim_settings = {
+            "steps_per_sec": n_steps,
+            "simulate_noise": self.simulate_noise_var.get() == "True",
+            "link_model": self.link_model_var.get(),
+            "mobility": self.mobility_var.get(),
+        }
+
+    def _make_snapshot(self, timestep, ues, moved, status=None):
+        """
+        Copy what the canvas shows out of the sim objects. Runs on the sim
+        thread between steps.
+        """
+        tower_rates, ue_rates = self._latest_rates()
+        towers = {}
+        for hex_id, data in list(self.towers.items()):
+            sim = data["sim_object"]
+            towers[hex_id] = (data["status"], self._utilization(sim, tower_rates.get(sim.ip_addr, 0.0)))
+        ue_rows = {}
+        for ue in ues:
+            ue_rows[ue] = (
+                getattr(ue, "current_tower", None), ue.max_data_rate, getattr(ue, "code_rate", 1.0),
+                getattr(ue, "ber", 0), ue_rates.get(ue.ip_addr, 0.0),
             )
+        return FrameSnapshot(timestep, towers, ue_rows, moved, status)
+
+    def _start_renderer(self):
+        if self._render_job is None:
+            self._render_job = self.root.after(0, self._render_frame)
+
+    def _render_frame(self):
+        """
+        Draw the newest snapshot, at most FRAME_RATE times a second. Keeps
+        going until the sim thread has exited and its last snapshot is drawn.
+        """
+        alive = self.sim_thread is not None and self.sim_thread.is_alive()
+        snap = self.frames.take()
+        if snap is not None:
+            self._draw_snapshot(snap)
+        if alive:
+            self._render_job = self.root.after(int(1000 / FRAME_RATE), self._render_frame)
+        else:
+            self._render_job = None
+
+    def _draw_snapshot(self, snap):
+        for hex_id, (status, utilization) in snap.towers.items():
+            if hex_id in self.towers:
+                self._set_tower_fill(hex_id, self._tower_color(status, utilization))
+
+        for ue, pos in snap.moved.items():
+            ue_data = self.ue_by_sim.get(ue)
+            if ue_data is not None:
+                self._move_ue_icon(ue_data, *pos)
+
+        for ue, (tower, max_data_rate, cr, ber, rate_mbps) in snap.ues.items():
+            ue_data = self.ue_by_sim.get(ue)
+            if ue_data is None:
+                continue   # deleted since
+            self._draw_connection_line(ue_data, tower)
+            self._set_ue_label(ue_data, self._ue_label_text(ue, max_data_rate, cr, ber, rate_mbps))
+
+        if snap.status is not None:
+            self.status_var.set(snap.status)
+
+    # ----------------------------------------------------------------------
+    # PROFILER WINDOW (live per-phase table of the sim loop)
+    # ----------------------------------------------------------------------
+    def open_profiler_window(self):
+        if self.profiler is not None:
+            return
+
+        top = tk.Toplevel(self.root)
+        top.title("Step Profiler")
+        top.geometry("640x340")
+        top.configure(bg=self.UI_COLOR)
+
+        columns = ("share", "ms_step", "calls", "us_call", "packets", "us_pkt")
+        headings = ("Share", "ms/step", "Calls", "us/call", "Packets", "us/pkt")
+        tree = ttk.Treeview(top, columns=columns, height=12)
+        tree.heading("#0", text="Phase")
+        tree.column("#0", width=110)
+        for col, text in zip(columns, headings):
+            tree.heading(col, text=text)
+            tree.column(col, width=80, anchor=tk.E)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 4))
+
+        footer = tk.Label(top, text="Waiting for the simulation...", bg=self.UI_COLOR)
+        footer.pack(pady=4)
+
+        prof = PhaseProfiler()
+        tk.Button(
+            top, text="Reset", bg="#7f8c8d", fg="white", relief=tk.FLAT,
+            command=prof.reset,
+        ).pack(pady=(0, 8))
+        self.profiler = prof
+
+        def fmt(x, spec):
+            return format(x, spec) if x is not None else "-"
+
+        def refresh():
+            if not top.winfo_exists():
+                return
+            report = prof.report()
+            tree.delete(*tree.get_children())
+            for p in sorted(report["phases"], key=lambda p: -p["seconds"]):
+                tree.insert("", tk.END, text=p["phase"], values=(
+                    f"{p['share'] * 100:.1f}%",
+                    f"{p['ms_per_step']:.3f}",
+                    p["entity_calls"],
+                    fmt(p["us_per_call"], ".1f"),
+                    p["packets"],
+                    fmt(p["us_per_packet"], ".1f"),
+                ))
+            if report["steps"]:
+                footer.config(text=f"{report['steps']} steps, {report['wall_time'] * 1e3 / report['steps']:.3f} ms/step")
+            top.after(1000, refresh)
+
+        def close():
+            self.profiler = None
+            top.destroy()
+
+        top.protocol("WM_DELETE_WINDOW", close)
+        refresh()
+
+    # ----------------------------------------------------------------------
+    # EVENT LOG REPLAY
+    # ----------------------------------------------------------------------
+    def replay_event_log(self, path=None):
+        """
+        Play back a binary event log (see eventlog.py) on the current
+        network: tower colors and UE rate labels follow the recorded steps
+        at the recorded pace, nothing is simulated. Load the scenario the
+        log was recorded with first so the IPs match.
+        """
+        if self.sim_running:
+            messagebox.showwarning("Simulation running", "Stop the simulation before replaying a log.")
+            return
+        if path is None:
+            path = filedialog.askopenfilename(
+                title="Replay event log",
+                filetypes=[("Event logs", "*.evt"), ("All files", "*.*")],
+            )
+            if not path:
+                return
+        try:
+            t_delta, t_start, t_end = log_span(path)
+            steps = dict(iter_steps(path))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Replay event log", f"Could not read {path}:\n{e}")
+            return
+
+        if self._replay_job is not None:
+            self.root.after_cancel(self._replay_job)
+            self._replay_job = None
+
+        # The labels and colors read the rates of the last metrics sample,
+        # so the replay samples the logged bytes of each step into a
+        # registry of its own
+        current = [{}, {}] # tower and UE ip -> bytes of the step shown
+        registry = MetricsRegistry([d["sim_object"] for d in self.towers.values()],
+                                   [d["sim_object"] for d in self.user_equipment])
+        registry.gauge("rate_mbps", "tower", lambda ts: [current[0].get(t.ip_addr, 0) * 8e-6 / t_delta for t in ts])
+        registry.gauge("rate_mbps", "ue", lambda us: [current[1].get(u.ip_addr, 0) * 8e-6 / t_delta for u in us])
+        self.metrics = registry
+
+        def show(t_step):
+            if self.sim_running or t_step >= t_end:
+                self._replay_job = None
+                self.status_var.set(f"Replay of {path} finished.")
+                return
+            current[:] = step_tx_bytes(steps.get(t_step, ()))
+            registry.sample(t_step, t_step * t_delta)
+            self._update_tower_colors()
+            self._update_ue_labels()
+            self.status_var.set(f"Replay {path}: step {t_step} ({t_step * t_delta:.2f}s)")
+            self._replay_job = self.root.after(int(t_delta * 1000), show, t_step + 1)
+
+        show(t_start)
 
     # ----------------------------------------------------------------------
     # MAIN SIMULATION LOOP
     # ----------------------------------------------------------------------
     def simulation_loop(self):
         timestep = 0
-        last_print_time = time.time()
+        # Per tower/UE/link time series of this run (see metrics.py). The
+        # console printout is one consumer, at most once per real second.
+        self.metrics = default_registry(GLOBAL_TOWERS, GLOBAL_UES)
+        self.metrics.consumers.append(ConsoleReport(interval=1.0, ip_format=int_to_ip))
+        # Real-time pacing against the sim clock (doesn't drift like a
+        # fixed sleep per step)
+        pacer = Pacer()
+        pacer.reset(self.env.now)
 
         while self.sim_running:
 
             # ------------------------------------
             # READ steps per second from the GUI
             # ------------------------------------
-            try:
-                n_steps = int(self.steps_per_sec_var.get())
-                if n_steps < 1:
-                    n_steps = 1
-            except:
-                n_steps = 1
+            n_steps = self.sim_settings["steps_per_sec"]
 
             # ------------------------------------
             # UPDATE t_delta for UE and Tower
@@ -1652,15 +2252,25 @@ class NetworkSimulationApp:
             for ue in GLOBAL_UES:
                 ue.t_delta = new_t_delta
             for tower in GLOBAL_TOWERS:
-                tower.t_delta = new_t_delta
+                if tower.t_delta != new_t_delta:
+                    tower.t_delta = new_t_delta
+                    # Per-UE budgets are in bits per step
+                    tower.set_data_rate()
 
             # ------------------------------------
             # RUN n_steps simulation steps per second
             # ------------------------------------
             for _ in range(n_steps):
 
+                # Per-phase timing while the profiler window is open
+                prof = self.profiler
+                if prof is not None:
+                    prof.begin()
+
+                settings = self.sim_settings
                 towers = list(GLOBAL_TOWERS)
                 ues = list(GLOBAL_UES)
+                status_text = None   # status bar text for this step's snapshot
 
                 # UPDATE ALL UE TIMESTEPS (CRITICAL FOR ARQ)
                 for ue in ues:
@@ -1681,7 +2291,7 @@ class NetworkSimulationApp:
                     # Outage finished
                     if self._outage_remaining == 0:
                         for hex_id, prev_status in self._outage_prev_status.items():
-                            self.set_tower_status(hex_id, prev_status)
+                            self._apply_tower_status(hex_id, prev_status)
 
                         for ue in ues:
                             try:
@@ -1689,7 +2299,16 @@ class NetworkSimulationApp:
                             except:
                                 pass
 
-                        self.status_var.set("Outage simulation complete. Towers restored.")
+                        status_text = "Outage simulation complete. Towers restored."
+
+                # -----------------------------------------------------------
+                # SCENARIO OUTAGE SCHEDULE
+                # -----------------------------------------------------------
+                for hex_id, status in self._scheduled_outages.get(timestep, ()):
+                    if hex_id in self.towers:
+                        self._apply_tower_status(hex_id, status)
+                if prof is not None:
+                    prof.lap("outages", len(ues))
 
                 # -----------------------------------------------------------
                 # APPLY UE TRANSMIT MODES
@@ -1719,21 +2338,53 @@ class NetworkSimulationApp:
 
                     except Exception as e:
                         print("UE TX ERR:", e)
+                if prof is not None:
+                    prof.lap("tx_modes", len(ues))
+                    n_arrivals = self.traffic.n_arrivals
+
+                # Generator sources: only UEs with an arrival this step are touched
+                try:
+                    self.traffic.step(timestep)
+                except Exception as e:
+                    print("TRAFFIC ERR:", e)
+                if prof is not None:
+                    n_arrivals = self.traffic.n_arrivals - n_arrivals
+                    prof.lap("traffic", n_arrivals, n_arrivals)
+
+                # -----------------------------------------------------------
+                # LINK MODEL (SINR gain matrix, moved UEs only)
+                # -----------------------------------------------------------
+                radio = None
+                if settings["link_model"] == "sinr":
+                    radio = self.radio
+                    if radio is None:
+                        radio = RadioModel([d["sim_object"] for d in list(self.towers.values())])
+                        self.radio = radio
+                    radio.update(ues)
+                for ue in ues:
+                    ue.radio = radio
+                if prof is not None:
+                    prof.lap("link_model", len(ues) if radio is not None else 0)
 
                 # -----------------------------------------------------------
                 # UE STEP
                 # -----------------------------------------------------------
-                simulate_noise = (self.simulate_noise_var.get() == "True")
+                simulate_noise = settings["simulate_noise"]
 
+                n_ue_tx = 0
                 for ue in ues:
                     try:
-                        ue.step(simulate_noise)
+                        if ue.step(simulate_noise):
+                            n_ue_tx += 1
                     except Exception as e:
                         print("UE STEP ERR:", e)
+                if prof is not None:
+                    prof.lap("ues", len(ues), n_ue_tx)
 
                 # -----------------------------------------------------------
                 # TOWER TX LOOP
                 # -----------------------------------------------------------
+                n_tower_tx = 0
                 transmitting = True
                 while transmitting:
                     transmitting = False
@@ -1742,84 +2393,56 @@ class NetworkSimulationApp:
                             if tower.can_transmit():
                                 tower.step(simulate_noise)
                                 transmitting = True
+                                n_tower_tx += 1
                         except Exception as e:
                             print("TOWER STEP ERR:", e)
+                if prof is not None:
+                    prof.lap("towers", n_tower_tx, n_tower_tx)
 
                 # -----------------------------------------------------------
-                # RECORD tx_bytes BEFORE CLEARING
+                # MOBILITY (all UEs in one batched step)
                 # -----------------------------------------------------------
-                for tower in towers:
-                    tower.gui_last_n_tx_bytes = getattr(tower, "n_tx_bytes", 0) * float(self.steps_per_sec_var.get())
-
-                for ue in ues:
-                    ue.gui_last_n_tx_bytes = getattr(ue, "tx_bytes_step", 0) * float(self.steps_per_sec_var.get())
-
-                # -----------------------------------------------------------
-                # AUTO WARNING COLOR (>= 50% LOAD) - VISUAL ONLY
-                # -----------------------------------------------------------
-                for hex_id, data in self.towers.items():
-                    sim = data["sim_object"]
-
-                    if data["status"] not in ("ACTIVE", "WARNING"):
-                        continue
-
-                    try:
-                        used_bps = sim.gui_last_n_tx_bytes
-                        max_bps = sim.max_data_rate
-                        utilization = used_bps / max_bps if max_bps > 0 else 0.0
-
-                        # Only adjust COLOR, DO NOT change status or GLOBAL_TOWERS
-                        if utilization >= 0.5:
-                            self.canvas.itemconfig(hex_id, fill=self.COLOR_WARNING)
-                        else:
-                            self.canvas.itemconfig(hex_id, fill=self.COLOR_ACTIVE)
-
-                    except:
-                        pass
+                mobility_name = settings["mobility"]
+                moved = None
+                if mobility_name != "none":
+                    model = self.mobility
+                    if model is None or self._mobility_name != mobility_name:
+                        mpp = self.METERS_PER_PIXEL
+                        bounds = (20 * mpp, 40 * mpp, (self.WIDTH - 20) * mpp, (self.HEIGHT - 40) * mpp)
+                        model = make_mobility(mobility_name, ues, bounds=bounds)
+                        self.mobility = model
+                        self._mobility_name = mobility_name
+                    elif model.ues != ues:
+                        model.set_ues(ues)
+                    moved = model.step(new_t_delta, timestep)
+                if prof is not None:
+                    prof.lap("mobility", len(moved) if moved else 0)
 
                 # -----------------------------------------------------------
                 # ADVANCE SIM TIME
                 # -----------------------------------------------------------
                 self.env.now += new_t_delta
                 timestep += 1
+                self.sim_timestep = timestep
 
                 # -----------------------------------------------------------
-                # GUI REFRESH
+                # METRICS SAMPLE BEFORE CLEARING (the labels and colors
+                # read it; prints once per real second)
                 # -----------------------------------------------------------
-                self.root.after(0, self.refresh_all_connection_lines)
-                self.root.after(0, self.draw_tower_links)
-                self.root.after(0, self._update_ue_labels)
+                self.metrics.bind(towers, ues)
+                self.metrics.tick()
+                self.metrics.sample(timestep, self.env.now)
+                if prof is not None:
+                    prof.lap("metrics", len(towers) + len(ues))
 
                 # -----------------------------------------------------------
-                # PRINT ONCE PER REAL SECOND
+                # GUI SNAPSHOT (drawn by the renderer on the Tk thread)
                 # -----------------------------------------------------------
-                current_time = time.time()
-                if current_time - last_print_time >= 1.0:
-
-                    for tower in towers:
-                        dr = tower.gui_last_n_tx_bytes * 8e-6
-                        mx = tower.max_data_rate * 1e-6
-                        print(
-                            f"{self.env.now:.2f}s: Tower IP_ADDR {int_to_ip(tower.ip_addr)}: "
-                            f"Data rate = {dr:.3f} Mbps, Max = {mx:.3f} Mbps, "
-                            f"Bit-error rate = {tower.ber*1e5:.3f}E-5"
-                        )
-
-                    for ue in ues:
-                        if ue.current_tower:
-                            dr = ue.gui_last_n_tx_bytes * 8e-6
-                            mx = ue.max_data_rate * (ue.code_rate or 1) * 1e-6
-                            print(
-                                f"{self.env.now:.2f}s: UE IP_ADDR {int_to_ip(ue.ip_addr)}: "
-                                f"Tower IP_ADDR = {int_to_ip(ue.current_tower.ip_addr)} "
-                                f"Band = {ue.freq_band}, Code rate = {ue.code_rate}, "
-                                f"Data rate = {dr:.3f} Mbps, Max = {mx:.3f} Mbps, "
-                                f"Bit-error rate = {ue.ber*1e5:.5f}E-5"
-                            )
-
-                    print(f"Timestep {timestep} Completed.")
-                    print("----------------------------------------------------------------------------------------")
-                    last_print_time = current_time
+                mpp = self.METERS_PER_PIXEL
+                moved_px = {ue: (ue.x_pos / mpp, ue.y_pos / mpp) for ue in moved} if moved else {}
+                self.frames.publish(self._make_snapshot(timestep, ues, moved_px, status_text))
+                if prof is not None:
+                    prof.lap("snapshot", len(towers) + len(ues))
 
                 # -----------------------------------------------------------
                 # CLEAR COUNTS
@@ -1828,12 +2451,15 @@ class NetworkSimulationApp:
                     tower.clear_tx_count()
                 for ue in ues:
                     ue.clear_tx_count()
+                if prof is not None:
+                    prof.lap("clear", len(towers) + len(ues))
+                    prof.end()
 
                 # RUN NEXT STEP WITHOUT PAUSING A WHOLE SECOND
-                time.sleep(1.0 / n_steps)
+                pacer.wait(self.env.now)
 
-            # End of while → clean shutdown
-            self.root.after(0, lambda: self.status_var.set("Simulation stopped."))
+        # End of while → clean shutdown
+        self.frames.publish(self._make_snapshot(timestep, list(GLOBAL_UES), {}, "Simulation stopped."))
 
 
 # ----------------------------------------------------------------------
@@ -1842,4 +2468,7 @@ class NetworkSimulationApp:
 if __name__ == "__main__":
     root = tk.Tk()
     app = NetworkSimulationApp(root)
+    # python gui.py <scenario.json|scenario.bin>
+    if len(sys.argv) > 1:
+        app.load_scenario_file(sys.argv[1])
     root.mainloop()
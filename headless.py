@@ -0,0 +1,517 @@
+import sys
+import os
+import json
+import math
+import time
+import random
+import argparse
+import contextlib
+from tower import Tower
+from ue import UE, handover_metrics
+from radio import RadioModel
+from mobility import make_mobility
+from traffic import TrafficSource, TrafficScheduler, TRAFFIC_KINDS
+from engine import Simulation, EventEngine
+from scenario import load_scenario
+from checkpoint import save_checkpoint, load_checkpoint
+from partition import PartitionedSimulation
+from capture import Capture, SNAPLEN
+from eventlog import EventLogWriter, SEGMENT_SIZE
+from metrics import default_registry, CAPACITY
+from latency import LatencyTracker
+from profiler import PhaseProfiler
+from outage import OutageProcess, REPAIR_MODELS
+
+# Headless batch runner. Builds a topology, runs it through the event
+# engine as fast as possible and writes one JSON document of metrics at
+# the end. Nothing in here may import tkinter (this runs on build boxes).
+#
+# Example:
+#   python headless.py --steps 7200 --seed 1 --topology grid --towers 9 --ues 100 \
+#       --traffic poisson --rate 0.5 --noise --out metrics.json
+#   python headless.py --steps 7200 --scenario city.bin --out metrics.json
+#   python headless.py --steps 600 --scenario city.bin --checkpoint-out warm.ckpt
+#   python headless.py --steps 7200 --resume warm.ckpt --out metrics.json
+#   python headless.py --steps 600 --scenario metro.bin --regions 4 --out metrics.json
+#   python headless.py --steps 600 --capture ue:50=ue50.pcap --capture link:0-1=backhaul.pcap \
+#       --capture-filter "data and len > 100"
+#   python headless.py --steps 2000 --scenario city.bin --event-log run.evt
+#   python headless.py --steps 7200 --scenario city.bin --metrics-out series.npz --metrics-every 10
+#   python headless.py --steps 2000 --topology grid --towers 9 --ues 50 --noise --latency
+#   python headless.py --steps 2000 --topology grid --towers 9 --ues 200 --profile
+#   python headless.py --steps 5000 --topology hex --towers 100 --ues 200 --random-outages --outage-prob 0.001
+
+#Parameters
+T_DELTA      = 0.5    # seconds per timestep
+GRID_SPACING = 1000.0 # meters between towers in the grid topology
+UE_IP_BASE   = 50     # same IP plan as run_env_main: towers first, then UEs
+                      # (from n_towers on when there are more than 50 towers)
+
+# ----------------------------------------------------------------------
+# Topologies
+# ----------------------------------------------------------------------
+# The run_env_main demo: towers in a rough line with a ring-ish backhaul
+# and every UE starting at (1000, 1000)
+def line_topology(n_towers, n_ues, t_delta, rng):
+    towers = [Tower(i, rng.uniform(0, 1500), rng.uniform(-100, 100), t_delta=t_delta, ip_addr=i, verbose=False) for i in range(n_towers)]
+    towers[0].x_pos = 0
+    towers[0].y_pos = 0
+    for i in range(1, n_towers):
+        towers[i].connect_tower(towers[i - 1])
+    ues = [UE(i, 1000.0, 1000.0, towers, t_delta=t_delta, ip_addr=i + max(UE_IP_BASE, n_towers), verbose=False) for i in range(n_ues)]
+    return towers, ues
+
+# Towers on a square grid, UEs uniform over the grid. The backhaul is a
+# comb (each row chained, rows joined in the first column) because towers
+# flood packets they can't deliver, and any cycle multiplies every packet.
+def grid_topology(n_towers, n_ues, t_delta, rng):
+    side = int(math.ceil(math.sqrt(n_towers)))
+    towers = []
+    for i in range(n_towers):
+        row, col = divmod(i, side)
+        tower = Tower(i, col * GRID_SPACING, row * GRID_SPACING, t_delta=t_delta, ip_addr=i, verbose=False)
+        if col > 0:
+            tower.connect_tower(towers[i - 1])
+        elif row > 0:
+            tower.connect_tower(towers[i - side])
+        towers.append(tower)
+    width = (side - 1) * GRID_SPACING
+    height = ((n_towers - 1) // side) * GRID_SPACING
+    ues = [UE(i, rng.uniform(0, width), rng.uniform(0, height), towers, t_delta=t_delta, ip_addr=i + max(UE_IP_BASE, n_towers), verbose=False) for i in range(n_ues)]
+    return towers, ues
+
+# Towers on a hexagonal grid (odd rows shifted by half a spacing, rows
+# sqrt(3)/2 spacings apart, so every tower is GRID_SPACING from its six
+# neighbors). Same comb backhaul and UE placement as grid_topology.
+def hex_topology(n_towers, n_ues, t_delta, rng):
+    side = int(math.ceil(math.sqrt(n_towers)))
+    row_spacing = GRID_SPACING * math.sqrt(3) / 2
+    towers = []
+    for i in range(n_towers):
+        row, col = divmod(i, side)
+        x = (col + 0.5 * (row % 2)) * GRID_SPACING
+        tower = Tower(i, x, row * row_spacing, t_delta=t_delta, ip_addr=i, verbose=False)
+        if col > 0:
+            tower.connect_tower(towers[i - 1])
+        elif row > 0:
+            tower.connect_tower(towers[i - side])
+        towers.append(tower)
+    width = (side - 0.5) * GRID_SPACING if n_towers > side else (side - 1) * GRID_SPACING
+    height = ((n_towers - 1) // side) * row_spacing
+    ues = [UE(i, rng.uniform(0, width), rng.uniform(0, height), towers, t_delta=t_delta, ip_addr=i + max(UE_IP_BASE, n_towers), verbose=False) for i in range(n_ues)]
+    return towers, ues
+
+TOPOLOGIES = {
+    "line" : line_topology,
+    "grid" : grid_topology,
+    "hex"  : hex_topology,
+}
+
+#Metrics Collector Class
+# Simulation observer that accumulates the per-step counters before
+# Simulation.end_step clears them. Rates cover the steps since the
+# collector was attached (e.g. after resuming a checkpoint).
+class MetricsCollector:
+    def __init__(self, sim):
+        self.t_start = sim.t_step
+        self.tower_bytes = {t: 0 for t in sim.towers}
+        self.tower_peak  = {t: 0 for t in sim.towers}
+        self.ue_bytes    = {ue: 0 for ue in sim.ues}
+        self.max_buffer  = {ue: 0 for ue in sim.ues}
+        self.tx_count = 0
+
+    def __call__(self, sim):
+        for tower in sim.towers:
+            n = tower.n_tx_bytes
+            self.tower_bytes[tower] += n
+            if n > self.tower_peak[tower]:
+                self.tower_peak[tower] = n
+        for ue in sim.ues:
+            self.ue_bytes[ue] += ue.n_tx_bytes
+            if len(ue.buffer) > self.max_buffer[ue]:
+                self.max_buffer[ue] = len(ue.buffer)
+        self.tx_count += sim.tx_count
+
+    # Add the counts of another collector (the regions of a partitioned run)
+    def merge(self, other):
+        for tower, n in other.tower_bytes.items():
+            self.tower_bytes[tower] += n
+            self.tower_peak[tower] = max(self.tower_peak[tower], other.tower_peak[tower])
+        for ue, n in other.ue_bytes.items():
+            self.ue_bytes[ue] += n
+            self.max_buffer[ue] = max(self.max_buffer[ue], other.max_buffer[ue])
+        self.tx_count += other.tx_count
+
+    # Final metrics as a plain (JSON-ready) dict
+    def report(self, sim):
+        sim_time = (sim.t_step - self.t_start) * sim.t_delta
+        t_delta = sim.t_delta
+        towers = []
+        for tower in sim.towers:
+            total = self.tower_bytes[tower]
+            towers.append({
+                "ip"               : tower.ip_addr,
+                "tx_bytes"         : total,
+                "mean_rate_mbps"   : total * 8e-6 / sim_time if sim_time > 0 else 0.0,
+                "peak_rate_mbps"   : self.tower_peak[tower] * 8e-6 / t_delta,
+                "max_rate_mbps"    : tower.max_data_rate * 1e-6,
+                "buffered_packets" : len(tower.buffer),
+                "operational"      : tower.operational,
+            })
+        ues = []
+        for ue in sim.ues:
+            ues.append({
+                "ip"               : ue.ip_addr,
+                "tower"            : ue.current_tower.ip_addr if ue.current_tower is not None else None,
+                "tx_bytes"         : self.ue_bytes[ue],
+                "acked_packets"    : ue.n_acked,
+                "dropped_packets"  : ue.n_dropped,
+                "buffered_packets" : len(ue.buffer),
+                "max_buffer"       : self.max_buffer[ue],
+                "handovers"        : ue.n_handovers,
+                "ber"              : ue.ber,
+                "sinr"             : ue.sinr,
+            })
+        n_acked = sum(ue.n_acked for ue in sim.ues)
+        n_dropped = sum(ue.n_dropped for ue in sim.ues)
+        total_bytes = sum(self.tower_bytes.values())
+        return {
+            "summary" : {
+                "tower_tx_bytes"     : total_bytes,
+                "tower_rate_mbps"    : total_bytes * 8e-6 / sim_time if sim_time > 0 else 0.0,
+                "ue_tx_bytes"        : sum(self.ue_bytes.values()),
+                "tower_transmissions": self.tx_count,
+                "acked_packets"      : n_acked,
+                "dropped_packets"    : n_dropped,
+                "delivery_ratio"     : n_acked / (n_acked + n_dropped) if n_acked + n_dropped else None,
+                "buffered_packets"   : sum(len(ue.buffer) for ue in sim.ues) + sum(len(t.buffer) for t in sim.towers),
+            },
+            "handover" : handover_metrics(sim.ues, sim.now), # counters are cumulative
+            "towers"   : towers,
+            "ues"      : ues,
+        }
+
+# Parse repeated --param key=value options (values are JSON if they parse)
+def parse_params(items):
+    params = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected key=value, got {item!r}")
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+# Build the Simulation described by the parsed arguments. Returns the
+# simulation and its outage schedule [(tower, start, duration)].
+def build_simulation(args):
+    rng = random.Random(args.seed)
+    traffic = None
+    outages = []
+    if args.scenario is not None:
+        scenario = load_scenario(args.scenario)
+        t_delta = args.t_delta if args.t_delta is not None else scenario.t_delta
+        towers, ues = scenario.build(t_delta)
+        traffic = scenario.make_traffic(ues)
+        outages = scenario.outage_schedule(towers)
+    else:
+        t_delta = args.t_delta if args.t_delta is not None else T_DELTA
+        towers, ues = TOPOLOGIES[args.topology](args.towers, args.ues, t_delta, rng)
+        # Same flood control as run_env_main (we broadcast every message)
+        for tower in towers:
+            tower.tx_attempts = len(towers)
+
+    radio = RadioModel(towers) if args.link_model == "sinr" else None
+    mobility = None
+    if args.mobility != "none":
+        mobility = make_mobility(args.mobility, ues, seed=rng.random())
+
+    # Scenario traffic wins, otherwise every UE gets a --traffic source
+    if traffic is None:
+        traffic = make_traffic(args, ues, rng)
+
+    # ARQ / buffer overrides
+    for ue in ues:
+        if args.arq_timeout is not None:
+            ue.arq_timeout = args.arq_timeout
+        if args.arq_retx is not None:
+            ue.arq_retx = args.arq_retx
+        if args.buff_thresh is not None:
+            ue.buff_thresh = args.buff_thresh
+
+    deferred = args.deferred or args.regions > 0
+    sim = Simulation(towers, ues, t_delta, simulate_noise=args.noise, radio=radio, mobility=mobility, traffic=traffic, deferred=deferred)
+    if deferred:
+        sim.seed_noise(args.seed)
+    return sim, outages
+
+def make_traffic(args, ues, rng):
+    traffic = TrafficScheduler()
+    ue_ips = [ue.ip_addr for ue in ues]
+    params = parse_params(args.param)
+    if args.traffic in ("poisson", "on_off") and args.rate is not None:
+        params["rate"] = args.rate
+    for ue in ues:
+        dest = [ip for ip in ue_ips if ip != ue.ip_addr] or ue_ips
+        traffic.set_source(ue, TrafficSource(args.traffic, dest, seed=rng.random(), **params))
+    return traffic
+
+# Run a simulation for n_steps and return the metrics dict
+# (engine: continue with an existing EventEngine, e.g. from a checkpoint)
+# (outage_process: outage.OutageProcess to drive from the engine)
+def run_headless(sim, n_steps, skip_idle=True, outages=(), engine=None, outage_process=None):
+    collector = MetricsCollector(sim)
+    sim.observers.append(collector)
+    if engine is None:
+        engine = EventEngine(sim, skip_idle=skip_idle)
+    else:
+        engine.skip_idle = skip_idle
+    for tower, start, duration in outages:
+        engine.schedule_outage(tower, start, duration)
+    if outage_process is not None:
+        outage_process.attach(engine)
+    start = time.perf_counter()
+    engine.run(n_steps)
+    wall = time.perf_counter() - start
+    return _metrics(collector, sim, engine, wall)
+
+# Same as run_headless with the network split over n_regions worker
+# processes (sim must be a deferred-mode Simulation, see partition.py)
+def run_partitioned(sim, n_steps, n_regions, skip_idle=True, outages=(), outage_process=None):
+    psim = PartitionedSimulation(sim, n_regions, observer=MetricsCollector)
+    try:
+        engine = EventEngine(psim, skip_idle=skip_idle)
+        for tower, start, duration in outages:
+            engine.schedule_outage(tower, start, duration)
+        if outage_process is not None:
+            outage_process.attach(engine)
+        start = time.perf_counter()
+        engine.run(n_steps)
+        wall = time.perf_counter() - start
+        stats = psim.stats()
+        collectors = psim.collect()
+    finally:
+        psim.close()
+
+    collector = collectors[0]
+    for other in collectors[1:]:
+        collector.merge(other)
+    sim.traffic = psim.traffic
+    metrics = _metrics(collector, sim, engine, wall)
+    metrics["regions"] = [{
+        "ues"              : n_ues,
+        "towers"           : n_towers,
+        "migrated_ues"     : n_migrated,
+        "remote_forwards"  : n_forwards,
+    } for n_ues, n_towers, n_migrated, n_forwards in stats]
+    return metrics
+
+def _metrics(collector, sim, engine, wall):
+    metrics = collector.report(sim)
+    metrics["run"] = {
+        "steps"         : sim.t_step,
+        "sim_time"      : sim.now,
+        "wall_time"     : wall,
+        "steps_run"     : engine.n_steps,
+        "steps_skipped" : engine.n_skipped,
+        "events"        : engine.n_events,
+        "speedup"       : sim.now / wall if wall > 0 else None,
+    }
+    if sim.traffic is not None:
+        metrics["traffic"] = {
+            "arrivals" : sim.traffic.n_arrivals,
+            "bytes"    : sim.traffic.n_bytes,
+        }
+    return metrics
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Run the 5G network simulator without the GUI and write metrics as JSON.")
+    parser.add_argument("--steps", type=int, default=1000, help="duration in timesteps")
+    parser.add_argument("--t-delta", type=float, default=None, help=f"seconds per timestep (default: scenario or {T_DELTA})")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (topology, traffic and noise)")
+    parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="line")
+    parser.add_argument("--scenario", default=None, help="scenario file (JSON or binary), replaces --topology")
+    parser.add_argument("--towers", type=int, default=3, help="number of towers")
+    parser.add_argument("--ues", type=int, default=5, help="number of UEs")
+    parser.add_argument("--traffic", choices=sorted(k for k in TRAFFIC_KINDS if k != "trace"), default="poisson")
+    parser.add_argument("--rate", type=float, default=None, help="packets per timestep for poisson/on_off traffic")
+    parser.add_argument("--param", action="append", metavar="KEY=VALUE", help="extra traffic source parameter (repeatable)")
+    parser.add_argument("--noise", action="store_true", help="simulate noisy dropouts")
+    parser.add_argument("--arq-timeout", type=int, default=None, help="UE ARQ timeout in timesteps")
+    parser.add_argument("--arq-retx", type=int, default=None, help="UE ARQ retransmissions (0 disables ARQ)")
+    parser.add_argument("--buff-thresh", type=float, default=None, help="UE buffer size in bits")
+    parser.add_argument("--link-model", choices=["distance", "sinr"], default="distance")
+    parser.add_argument("--mobility", default="none", help="mobility model name, trace:<path> or none")
+    parser.add_argument("--deferred", action="store_true", help="apply backhaul forwards and handovers at the end of each step (what --regions runs use)")
+    parser.add_argument("--regions", type=int, default=0, help="split the network over this many worker processes (implies --deferred)")
+    parser.add_argument("--random-outages", action="store_true", help="towers fail and get repaired at random (outage_prob per step, outage_duration seconds)")
+    parser.add_argument("--outage-prob", type=float, default=None, help="failure probability per tower and timestep for --random-outages (default: the tower's)")
+    parser.add_argument("--outage-duration", type=float, default=None, help="mean outage length in seconds for --random-outages (default: the tower's)")
+    parser.add_argument("--outage-repair", choices=REPAIR_MODELS, default="fixed", help="outage lengths: always the duration or exponential around it")
+    parser.add_argument("--no-skip-idle", action="store_true", help="execute idle timesteps instead of jumping over them")
+    parser.add_argument("--resume", default=None, help="continue from a checkpoint (ignores the topology/traffic options)")
+    parser.add_argument("--checkpoint-out", default=None, help="write a checkpoint after the run")
+    parser.add_argument("--out", default="-", help="metrics file (default: stdout)")
+    parser.add_argument("--capture", action="append", metavar="TARGET=PATH", help="write the packets of ue:IP, tower:IP or link:IP-IP to a pcap file (repeatable)")
+    parser.add_argument("--capture-filter", default=None, help="only capture packets matching this filter expression (see capture.py)")
+    parser.add_argument("--snaplen", type=int, default=SNAPLEN, help="bytes of each captured packet to keep")
+    parser.add_argument("--event-log", default=None, help="record every packet event to this binary log (see eventlog.py)")
+    parser.add_argument("--event-log-segment", type=int, default=SEGMENT_SIZE >> 20, help="event log segment size in MiB")
+    parser.add_argument("--metrics-out", default=None, help="write per tower/UE/link time series to this .csv or .npz file (see metrics.py)")
+    parser.add_argument("--metrics-every", type=int, default=1, help="timesteps between time series samples")
+    parser.add_argument("--metrics-capacity", type=int, default=CAPACITY, help="time series samples kept (the last ones)")
+    parser.add_argument("--latency", action="store_true", help="report end-to-end packet latency per flow and tower (see latency.py)")
+    parser.add_argument("--profile", action="store_true", help="time every phase of the step and report it (see profiler.py)")
+    parser.add_argument("--verbose", action="store_true", help="keep the per-packet prints of the Tower/UE code")
+    return parser
+
+# Packet capture described by the --capture options (None without any)
+def start_capture(args, sim):
+    if not args.capture:
+        return None
+    capture = Capture(sim, args.capture_filter, snaplen=args.snaplen)
+    try:
+        for item in args.capture:
+            target, sep, path = item.partition("=")
+            if not sep:
+                raise ValueError(f"Expected TARGET=PATH, got {item!r}")
+            capture.add(target, path)
+    except Exception:
+        capture.close()
+        raise
+    capture.install()
+    return capture
+
+# Event log described by the --event-log options (None without)
+def start_event_log(args, sim):
+    if args.event_log is None:
+        return None
+    log = EventLogWriter(args.event_log, sim, segment_size=args.event_log_segment << 20)
+    log.install()
+    return log
+
+# Time series registry described by the --metrics-* options (None without)
+def start_metrics(args, sim):
+    if args.metrics_out is None:
+        return None
+    registry = default_registry(sim.towers, sim.ues, capacity=args.metrics_capacity, every=args.metrics_every)
+    sim.observers.append(registry)
+    return registry
+
+# Detach the registry and export its samples
+def finish_metrics(args, sim, registry):
+    sim.observers.remove(registry)
+    registry.export(args.metrics_out)
+    return {
+        "path"    : args.metrics_out,
+        "samples" : min(registry.n_samples, registry.capacity),
+        "metrics" : list(registry.metrics),
+    }
+
+# Latency tracker if --latency is given (None without)
+def start_latency(args, sim):
+    if not args.latency:
+        return None
+    tracker = LatencyTracker(sim)
+    tracker.install()
+    return tracker
+
+# Phase profiler if --profile is given (None without)
+def start_profiler(args, sim):
+    if not args.profile:
+        return None
+    sim.profiler = PhaseProfiler()
+    return sim.profiler
+
+# Stochastic tower outages if --random-outages is given (None without)
+def start_outages(args, sim):
+    if not args.random_outages:
+        return None
+    return OutageProcess(sim.towers, sim.t_delta, seed=args.seed, prob=args.outage_prob,
+                         duration=args.outage_duration, repair=args.outage_repair)
+
+# Run the simulation described by parsed arguments and return the metrics
+def run_args(args):
+    # The Tower/UE noise model uses the global RNG
+    random.seed(args.seed)
+
+    if args.regions > 0 and (args.resume is not None or args.checkpoint_out is not None or args.capture or args.event_log
+                             or args.metrics_out is not None or args.latency or args.profile):
+        raise ValueError("--regions can't be combined with --resume/--checkpoint-out/--capture/--event-log/--metrics-out/--latency/--profile")
+
+    # Tower/UE print a lot (connections, handovers). Keep stdout clean
+    # for the metrics unless asked for.
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        if args.regions > 0:
+            sim, outages = build_simulation(args)
+            process = start_outages(args, sim)
+            metrics = run_partitioned(sim, args.steps, args.regions, skip_idle=not args.no_skip_idle, outages=outages,
+                                      outage_process=process)
+        else:
+            if args.resume is not None:
+                # Also puts the global RNG back where the checkpoint left it.
+                # The engine's queue holds any outage process already, the
+                # checkpoint keeps it for its stats.
+                ckpt = load_checkpoint(args.resume)
+                sim, engine, outages = ckpt.sim, ckpt.engine, ()
+                process = (ckpt.extra or {}).get("outage_process")
+                if process is not None:
+                    process.reset_stats()
+                attach = None
+            else:
+                sim, outages = build_simulation(args)
+                engine = EventEngine(sim)
+                process = attach = start_outages(args, sim)
+            capture = start_capture(args, sim)
+            log = start_event_log(args, sim)
+            registry = start_metrics(args, sim)
+            tracker = start_latency(args, sim)
+            profiler = start_profiler(args, sim)
+            try:
+                metrics = run_headless(sim, args.steps, skip_idle=not args.no_skip_idle, outages=outages, engine=engine,
+                                       outage_process=attach)
+            finally:
+                if capture is not None:
+                    capture.close()
+                if log is not None:
+                    log.close()
+                if tracker is not None:
+                    tracker.close()
+                sim.profiler = None
+            if capture is not None:
+                metrics["capture"] = capture.stats()
+            if log is not None:
+                metrics["event_log"] = log.stats()
+            if registry is not None:
+                metrics["time_series"] = finish_metrics(args, sim, registry)
+            if tracker is not None:
+                metrics["latency"] = tracker.report()
+            if profiler is not None:
+                metrics["profile"] = profiler.report()
+                print(profiler.table(), file=sys.stderr)
+            if args.checkpoint_out is not None:
+                save_checkpoint(args.checkpoint_out, sim, engine, extra={"outage_process": process})
+
+    if process is not None:
+        metrics["outages"] = process.stats()
+
+    metrics["config"] = vars(args)
+    return metrics
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    metrics = run_args(args)
+    text = json.dumps(metrics, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import math
+from array import array
+
+# End-to-end packet latency.
+#
+# Every packet carries the timestep it was created in (field 8, t_origin,
+# which unlike field 0 is not touched by ARQ retransmissions). The UE
+# latency hook sees every data packet delivered to it and every one of its
+# own packets that got ACKed, so we get
+#
+#   delivery    t_origin -> arrival at the destination UE (buffering at the
+#               source, ARQ retransmissions, tower queues and backhaul hops)
+#   completion  t_origin -> ACK back at the source
+#
+# per flow (source IP, destination IP) and per tower (the tower that
+# delivered the packet), in HDR style histograms of fixed size. Latencies
+# are counted in timesteps and reported in seconds, so t_delta is the
+# resolution.
+#
+# Example:
+#   python headless.py --steps 2000 --topology grid --towers 9 --ues 50 --noise --latency
+
+#Parameters
+SIGNIFICANT_BITS = 7       # exact below 2**7, ~1.6% relative error above
+MAX_VALUE        = 1 << 32 # largest latency (timesteps) a histogram can hold
+PERCENTILES      = (50, 90, 99, 99.9)
+
+#Latency Histogram Class
+# Log-linear buckets like HdrHistogram: values below 2**bits get a bucket
+# each, above that every power of two range is split into 2**(bits - 1)
+# buckets. The bucket array only grows up to the highest bucket used, and
+# never past the one of max_value.
+class LatencyHistogram:
+    def __init__(self, bits=SIGNIFICANT_BITS, max_value=MAX_VALUE):
+        self.bits = bits
+        self.half = 1 << (bits - 1)
+        self.max_value = max_value
+        self.counts = array("Q")
+        self.n = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def index(self, v):
+        if v < (1 << self.bits):
+            return v
+        shift = v.bit_length() - self.bits
+        return (1 << self.bits) + (shift - 1) * self.half + (v >> shift) - self.half
+
+    # Highest value that lands in bucket i
+    def highest(self, i):
+        if i < (1 << self.bits):
+            return i
+        j = i - (1 << self.bits)
+        shift = j // self.half + 1
+        m = j % self.half + self.half
+        return ((m + 1) << shift) - 1
+
+    def record(self, v, count=1):
+        if v < 0:
+            v = 0
+        elif v > self.max_value:
+            v = self.max_value
+        i = self.index(v)
+        counts = self.counts
+        if i >= len(counts):
+            counts.extend([0] * (i + 1 - len(counts)))
+        counts[i] += count
+        self.n += count
+        self.total += v * count
+        if self.min is None or v < self.min:
+            self.min = v
+        if self.max is None or v > self.max:
+            self.max = v
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.n += other.n
+        self.total += other.total
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+
+    # Smallest value with at least q percent of the samples at or below it
+    # (up to the bucket resolution), None when empty
+    def percentile(self, q):
+        if self.n == 0:
+            return None
+        target = max(1, math.ceil(q / 100 * self.n))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self.highest(i), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else None
+
+    # JSON-ready summary, values scaled (timesteps -> seconds)
+    def to_dict(self, scale=1.0):
+        out = {"count": self.n}
+        if self.n == 0:
+            return out
+        out["mean"] = self.mean * scale
+        out["min"] = self.min * scale
+        out["max"] = self.max * scale
+        for q in PERCENTILES:
+            out[f"p{q:g}".replace(".", "")] = self.percentile(q) * scale
+        return out
+
+#Latency Tracker Class
+class LatencyTracker:
+    def __init__(self, sim, bits=SIGNIFICANT_BITS):
+        self.sim = sim
+        self.bits = bits
+        self.delivery = LatencyHistogram(bits)
+        self.completion = LatencyHistogram(bits)
+        self.flows = {}      # (src ip, dst ip) -> [delivery, completion]
+        self.towers = {}     # tower ip -> delivery
+        self.hooked = []
+
+    def _flow(self, key):
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = [LatencyHistogram(self.bits), LatencyHistogram(self.bits)]
+        return flow
+
+    # UE latency hook
+    def _record(self, ue, packet, acked):
+        latency = ue.t_step - packet[8]
+        if acked:
+            self.completion.record(latency)
+            self._flow((ue.ip_addr, packet[5]))[1].record(latency)
+            return
+        self.delivery.record(latency)
+        self._flow((packet[4], ue.ip_addr))[0].record(latency)
+        tower = ue.current_tower
+        if tower is not None:
+            hist = self.towers.get(tower.ip_addr)
+            if hist is None:
+                hist = self.towers[tower.ip_addr] = LatencyHistogram(self.bits)
+            hist.record(latency)
+
+    def install(self):
+        for ue in self.sim.ues:
+            ue.latency = self._record
+            self.hooked.append(ue)
+
+    def close(self):
+        for ue in self.hooked:
+            ue.latency = None
+        self.hooked = []
+
+    # Latency of one flow or tower in seconds: percentile q of deliveries
+    def flow_percentile(self, src, dst, q):
+        flow = self.flows.get((src, dst))
+        p = flow[0].percentile(q) if flow is not None else None
+        return p * self.sim.t_delta if p is not None else None
+
+    def report(self):
+        scale = self.sim.t_delta
+        return {
+            "delivery"   : self.delivery.to_dict(scale),
+            "completion" : self.completion.to_dict(scale),
+            "towers"     : [{"ip": ip, **h.to_dict(scale)} for ip, h in sorted(self.towers.items())],
+            "flows"      : [{
+                "src"        : src,
+                "dst"        : dst,
+                "delivery"   : d.to_dict(scale),
+                "completion" : c.to_dict(scale),
+            } for (src, dst), (d, c) in sorted(self.flows.items())],
+        }
@@ -0,0 +1,340 @@
+import csv
+import sys
+import math
+import time
+import zipfile
+from array import array
+from bisect import bisect_right
+from ue import handover_metrics
+
+# Metrics registry.
+#
+# Counters, gauges and histograms per tower, UE and backhaul link, sampled
+# at the end of a step into preallocated ring buffers: every metric is one
+# array('d') holding `capacity` rows, a row being the value of each of its
+# towers/UEs/links (or the bin counts of a histogram) at one sample. Only
+# the last `capacity` samples are kept. Nothing is formatted while the
+# simulation runs, export_csv()/export_npz() write everything in one go
+# and console output is just another consumer of the samples.
+#
+#   counter    running total (per step values are added up, or the
+#              entity already keeps a cumulative count)
+#   gauge      value at the sample
+#   histogram  how many towers/UEs fell in each bin at the sample
+#              (bins are edges[i-1] <= x < edges[i], the first and last
+#              are open ended)
+#
+# Metric names are "<scope>.<name>" with scope tower, ue or link, e.g.
+# "tower.rate_mbps", "ue.buffer", "link.tx_bytes". A link is one
+# direction of a backhaul connection (tower -> neighbor).
+#
+# Example:
+#   registry = default_registry(sim.towers, sim.ues)
+#   sim.observers.append(registry)
+#   registry.consumers.append(ConsoleReport())
+#   ... run ...
+#   registry.export_csv("metrics.csv")
+
+#Parameters
+CAPACITY = 1024 # samples kept per metric (8 bytes per key and sample)
+
+COUNTER   = "counter"
+GAUGE     = "gauge"
+HISTOGRAM = "histogram"
+
+UE_BUFFER_EDGES   = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+UTILIZATION_EDGES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+
+NAN = float("nan")
+
+#Metric Class
+class Metric:
+    def __init__(self, name, kind, scope, read, keys, capacity, edges=None, accumulate=False):
+        self.name = name
+        self.kind = kind
+        self.scope = scope
+        self.read = read             # read(entities) -> one value per entity
+        self.edges = edges           # histogram bin edges
+        self.accumulate = accumulate # counter read gives per step values
+        self.capacity = capacity
+        self.bind(keys)
+
+    # Start over with a new set of keys (tower/UE IPs or link IP pairs)
+    def bind(self, keys):
+        self.keys = list(keys)
+        self.width = len(self.edges) + 1 if self.kind == HISTOGRAM else len(self.keys)
+        self.ring = array("d", [0.0]) * (self.capacity * self.width)
+        self.total = [0.0] * self.width if self.accumulate else None
+
+    # Add up one step of an accumulating counter
+    def add(self, entities):
+        total = self.total
+        for i, x in enumerate(self.read(entities)):
+            total[i] += x
+
+    def record(self, row, entities):
+        if self.accumulate:
+            values = self.total
+        else:
+            values = self.read(entities)
+            if self.kind == HISTOGRAM:
+                edges = self.edges
+                counts = [0.0] * self.width
+                for x in values:
+                    counts[bisect_right(edges, x)] += 1
+                values = counts
+        w = self.width
+        self.ring[row * w:(row + 1) * w] = array("d", values)
+
+    def row(self, row):
+        w = self.width
+        return self.ring[row * w:(row + 1) * w]
+
+    # Column names of the rows
+    def columns(self):
+        if self.kind != HISTOGRAM:
+            return [f"{k[0]}-{k[1]}" if isinstance(k, tuple) else str(k) for k in self.keys]
+        edges = self.edges
+        return [f"<{edges[0]}"] + [f"{edges[i - 1]}-{edges[i]}" for i in range(1, len(edges))] + [f">={edges[-1]}"]
+
+#Metrics Registry Class
+class MetricsRegistry:
+    def __init__(self, towers, ues, capacity=CAPACITY, every=1):
+        self.capacity = capacity
+        self.every = every   # sample every this many steps
+        self.metrics = {}    # name -> Metric, in registration order
+        self.summed = []     # the accumulating counters
+        self.t_step = array("d", [0.0]) * capacity
+        self.time = array("d", [0.0]) * capacity
+        self.n_samples = 0   # samples taken (only the last capacity are kept)
+        # Callables consumer(registry) run after every sample
+        self.consumers = []
+        self.towers, self.ues, self.links = [], [], []
+        self.bind(towers, ues)
+
+    # Follow a new set of towers/UEs (the GUI adds and removes them while
+    # it runs). Metrics whose keys changed lose their history.
+    def bind(self, towers, ues):
+        links = [(t, n) for t in towers for n in t.connected_towers]
+        if towers == self.towers and ues == self.ues and links == self.links:
+            return
+        self.towers, self.ues, self.links = list(towers), list(ues), links
+        for metric in self.metrics.values():
+            metric.bind(self._keys(metric.scope))
+
+    def _entities(self, scope):
+        return self.towers if scope == "tower" else self.ues if scope == "ue" else self.links
+
+    def _keys(self, scope):
+        if scope == "link":
+            return [(t.ip_addr, n.ip_addr) for t, n in self.links]
+        return [e.ip_addr for e in self._entities(scope)]
+
+    def _add(self, name, kind, scope, read, edges=None, accumulate=False):
+        if scope not in ("tower", "ue", "link"):
+            raise ValueError(f"Unknown metric scope {scope!r}")
+        full = f"{scope}.{name}"
+        if full in self.metrics:
+            raise ValueError(f"Metric {full} already registered")
+        metric = Metric(full, kind, scope, read, self._keys(scope), self.capacity, edges, accumulate)
+        self.metrics[full] = metric
+        if accumulate:
+            self.summed.append(metric)
+        return metric
+
+    # read(entities) returns one number per tower/UE/link. accumulate: the
+    # numbers are per step and get added up (otherwise they already are
+    # running totals).
+    def counter(self, name, scope, read, accumulate=False):
+        return self._add(name, COUNTER, scope, read, accumulate=accumulate)
+
+    def gauge(self, name, scope, read):
+        return self._add(name, GAUGE, scope, read)
+
+    def histogram(self, name, scope, read, edges):
+        return self._add(name, HISTOGRAM, scope, read, edges=sorted(edges))
+
+    # Add up the per step counters. Called on every step, sampled or not,
+    # before the counters are cleared.
+    def tick(self):
+        for metric in self.summed:
+            metric.add(self._entities(metric.scope))
+
+    # Take one sample (after tick() of the same step)
+    def sample(self, t_step, now):
+        row = self.n_samples % self.capacity
+        self.t_step[row] = t_step
+        self.time[row] = now
+        for metric in self.metrics.values():
+            metric.record(row, self._entities(metric.scope))
+        self.n_samples += 1
+        for consumer in self.consumers:
+            consumer(self)
+
+    # Simulation observer
+    def __call__(self, sim):
+        self.tick()
+        if sim.t_step % self.every == 0:
+            self.sample(sim.t_step, sim.now)
+
+    # Simulation observer for the n idle steps the engine jumped over,
+    # starting at sim.t_step. Their per step counters are zero, so nothing
+    # is added up; every sample step among them is taken (only the last
+    # capacity, the older ones would be overwritten anyway).
+    def skipped(self, sim, n):
+        every = self.every
+        last = sim.t_step + n - 1
+        last -= last % every
+        first = max(-(-sim.t_step // every) * every, last - (self.capacity - 1) * every)
+        for t_step in range(first, last + 1, every):
+            self.sample(t_step, t_step * sim.t_delta)
+
+    # Ring rows of the kept samples, oldest first
+    def rows(self):
+        n, cap = self.n_samples, self.capacity
+        if n <= cap:
+            return range(n)
+        start = n % cap
+        return list(range(start, cap)) + list(range(start))
+
+    # (t_steps, rows) of one metric, oldest first
+    def series(self, name):
+        metric = self.metrics[name]
+        rows = self.rows()
+        return [int(self.t_step[r]) for r in rows], [metric.row(r) for r in rows]
+
+    # key (or histogram bin) -> value at the last sample
+    def latest(self, name):
+        metric = self.metrics[name]
+        if not self.n_samples:
+            return {}
+        values = metric.row((self.n_samples - 1) % self.capacity)
+        keys = metric.keys if metric.kind != HISTOGRAM else metric.columns()
+        return dict(zip(keys, values))
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+    # Long format: one line per sample, metric and key
+    def export_csv(self, path):
+        rows = self.rows()
+        with open(path, "w", newline="") as f:
+            out = csv.writer(f)
+            out.writerow(["t_step", "time", "metric", "kind", "key", "value"])
+            for metric in self.metrics.values():
+                columns = metric.columns()
+                for r in rows:
+                    t_step, now = int(self.t_step[r]), self.time[r]
+                    out.writerows([t_step, now, metric.name, metric.kind, c, v]
+                                  for c, v in zip(columns, metric.row(r)))
+
+    # numpy .npz (written without numpy): t_step and time of the samples,
+    # every metric as a samples x keys array, plus "<metric>.keys" (IPs,
+    # link IP pairs) or "<metric>.edges" (histogram bins)
+    def export_npz(self, path):
+        rows = self.rows()
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("t_step.npy", _npy(array("q", (int(self.t_step[r]) for r in rows)), (len(rows),)))
+            z.writestr("time.npy", _npy(array("d", (self.time[r] for r in rows)), (len(rows),)))
+            for metric in self.metrics.values():
+                data = array("d")
+                for r in rows:
+                    data.extend(metric.row(r))
+                z.writestr(f"{metric.name}.npy", _npy(data, (len(rows), metric.width)))
+                if metric.kind == HISTOGRAM:
+                    z.writestr(f"{metric.name}.edges.npy", _npy(array("d", metric.edges), (len(metric.edges),)))
+                elif metric.scope == "link":
+                    keys = array("q", (ip for pair in metric.keys for ip in pair))
+                    z.writestr(f"{metric.name}.keys.npy", _npy(keys, (len(metric.keys), 2)))
+                else:
+                    z.writestr(f"{metric.name}.keys.npy", _npy(array("q", metric.keys), (len(metric.keys),)))
+
+    # Pick the format from the file name (.npz or CSV)
+    def export(self, path):
+        if path.endswith(".npz"):
+            self.export_npz(path)
+        else:
+            self.export_csv(path)
+
+# .npy file (format version 1.0) of a flat little endian array
+def _npy(data, shape):
+    descr = {"d": "<f8", "q": "<i8"}[data.typecode]
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': {shape!r}, }}"
+    header += " " * (63 - (10 + len(header)) % 64) + "\n"
+    if sys.byteorder != "little":
+        data = array(data.typecode, data)
+        data.byteswap()
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1") + data.tobytes()
+
+# ----------------------------------------------------------------------
+# Standard metrics
+# ----------------------------------------------------------------------
+def _ip_or_nan(tower):
+    return tower.ip_addr if tower is not None else NAN
+
+# Registry with the tower/UE/link metrics the simulator used to print
+def default_registry(towers, ues, capacity=CAPACITY, every=1):
+    reg = MetricsRegistry(towers, ues, capacity=capacity, every=every)
+
+    reg.counter("tx_bytes", "tower", lambda ts: [t.n_tx_bytes for t in ts], accumulate=True)
+    reg.gauge("rate_mbps", "tower", lambda ts: [t.n_tx_bytes * 8e-6 / t.t_delta for t in ts])
+    reg.gauge("max_rate_mbps", "tower", lambda ts: [t.max_data_rate * 1e-6 for t in ts])
+    reg.gauge("buffer", "tower", lambda ts: [len(t.buffer) for t in ts])
+    reg.gauge("ber", "tower", lambda ts: [t.ber for t in ts])
+    reg.histogram("utilization", "tower",
+                  lambda ts: [t.n_tx_bytes * 8 / (t.max_data_rate * t.t_delta) for t in ts if t.max_data_rate > 0],
+                  UTILIZATION_EDGES)
+
+    reg.counter("tx_bytes", "ue", lambda us: [u.n_tx_bytes for u in us], accumulate=True)
+    reg.counter("acked", "ue", lambda us: [u.n_acked for u in us])
+    reg.counter("dropped", "ue", lambda us: [u.n_dropped for u in us])
+    reg.counter("handovers", "ue", lambda us: [u.n_handovers for u in us])
+    reg.gauge("rate_mbps", "ue", lambda us: [u.n_tx_bytes * 8e-6 / u.t_delta for u in us])
+    reg.gauge("max_rate_mbps", "ue", lambda us: [u.max_data_rate * (u.code_rate or 1) * 1e-6 for u in us])
+    reg.gauge("code_rate", "ue", lambda us: [u.code_rate if u.code_rate is not None else NAN for u in us])
+    reg.gauge("sinr", "ue", lambda us: [u.sinr if u.sinr is not None else NAN for u in us])
+    reg.gauge("ber", "ue", lambda us: [u.ber for u in us])
+    reg.gauge("buffer", "ue", lambda us: [len(u.buffer) for u in us])
+    reg.gauge("tower", "ue", lambda us: [_ip_or_nan(u.current_tower) for u in us])
+    reg.histogram("buffer_hist", "ue", lambda us: [len(u.buffer) for u in us], UE_BUFFER_EDGES)
+
+    reg.counter("tx_bytes", "link", lambda ls: [t.link_tx_bytes.get(n.ip_addr, 0) for t, n in ls])
+    return reg
+
+#Console Report Class
+# Registry consumer printing the latest sample of the default metrics, at
+# most once per interval seconds of wall time (every sample if None)
+class ConsoleReport:
+    def __init__(self, interval=None, ip_format=str, file=None):
+        self.interval = interval
+        self.ip_format = ip_format
+        self.file = file
+        self._last = None
+
+    def __call__(self, reg):
+        if self.interval is not None:
+            now = time.time()
+            if self._last is not None and now - self._last < self.interval:
+                return
+            self._last = now
+        ip = self.ip_format
+        row = (reg.n_samples - 1) % reg.capacity
+        t = reg.time[row]
+        rate, max_rate, ber = (reg.metrics[f"tower.{n}"].row(row) for n in ("rate_mbps", "max_rate_mbps", "ber"))
+        lines = []
+        for i, tower in enumerate(reg.towers):
+            lines.append(f"{t:.2f}s: Tower IP_ADDR {ip(tower.ip_addr)}: Data rate = {rate[i]:.3f} Mbps, "
+                         f"Max = {max_rate[i]:.3f} Mbps, Bit-error rate = {ber[i] * 1e5:.3f}E-5")
+        rate, max_rate, ber, cr, sinr = (reg.metrics[f"ue.{n}"].row(row) for n in ("rate_mbps", "max_rate_mbps", "ber", "code_rate", "sinr"))
+        for i, ue in enumerate(reg.ues):
+            if ue.current_tower is not None:
+                sinr_str = f"{sinr[i]:.1f} dB" if not math.isnan(sinr[i]) else "N/A"
+                lines.append(f"{t:.2f}s: UE IP_ADDR {ip(ue.ip_addr)}: Tower IP_ADDR = {ip(ue.current_tower.ip_addr)} "
+                             f"Band = {ue.freq_band}, Code rate = {cr[i]:.3f}, SINR = {sinr_str}, "
+                             f"Data rate = {rate[i]:.3f} Mbps, Max = {max_rate[i]:.3f} Mbps, "
+                             f"Bit-error rate = {ber[i] * 1e5:.5f}E-5")
+        ho = handover_metrics(reg.ues, t)
+        lines.append(f"Handovers = {ho['handovers']}, Ping-pongs = {ho['ping_pongs']}, "
+                     f"HO rate = {ho['handover_rate']:.4f} /UE/s, Ping-pong rate = {ho['ping_pong_rate']:.3f}")
+        lines.append(f"Timestep {int(reg.t_step[row])} Completed.")
+        print("\n".join(lines), file=self.file)
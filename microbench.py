@@ -0,0 +1,313 @@
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import contextlib
+from statistics import median
+from tower import Tower
+from ue import (UE, ipv4_checksum, VERSION_IDX, IHL_IDX, TOS_IDX, TOTAL_LEN_IDX, ID_IDX, FLAGS_IDX,
+                FRAG_OFF_IDX, TTL_IDX, PROTOCOL_IDX, CHECKSUM_IDX, SRC_ADDR_IDX, DEST_ADDR_IDX, OPTIONS_IDX)
+from benchmark import git_commit
+
+# Micro-benchmarks of the per-packet hot paths (the whole network
+# benchmark is benchmark.py). Every benchmark times one operation on a
+# small hand-built tower/UE setup. Timing works like timeit: the number of
+# loops is calibrated until one sample takes at least --min-time, then
+# --repeat samples are taken with the GC off and the best (lowest) time
+# per operation is what gets compared. State the operation piles up
+# (buffers, counters) is reset between batches, outside the timed part.
+#
+# Example:
+#   python microbench.py --save micro_base.json
+#   python microbench.py --compare micro_base.json --threshold 0.05
+#   python microbench.py --filter ue_receive_ack
+
+#Parameters
+MIN_TIME   = 0.2   # seconds per sample
+REPEAT     = 7     # samples per benchmark
+THRESHOLD  = 0.10  # --compare flags benchmarks this much slower
+T_DELTA    = 0.5
+MAX_UNFRAG = 65535 - 20 # largest payload set_tx_bytes sends as one packet
+
+# Header dict like the one set_tx_bytes builds
+def make_header(src_ip, dest_ip, packet_num=0, size=0):
+    return {
+        VERSION_IDX:   4,
+        IHL_IDX:       5,
+        TOS_IDX:       0,
+        TOTAL_LEN_IDX: 20 + size,
+        ID_IDX:        packet_num & 0xFFFF,
+        FLAGS_IDX:     0,
+        FRAG_OFF_IDX:  0,
+        TTL_IDX:       64,
+        PROTOCOL_IDX:  99,
+        CHECKSUM_IDX:  0,
+        SRC_ADDR_IDX:  src_ip,
+        DEST_ADDR_IDX: dest_ip,
+        OPTIONS_IDX:   b"",
+    }
+
+# One tower with n_ues attached UEs (all in the high band) and, if
+# neighbors, that many backhaul neighbors. The UEs get IPs 100, 101, ...
+def make_cell(n_ues=2, neighbors=0):
+    tower = Tower(0, 0.0, 0.0, t_delta=T_DELTA, ip_addr=1, verbose=False)
+    for i in range(neighbors):
+        tower.connect_tower(Tower(i + 1, 1000.0 * (i + 1), 0.0, t_delta=T_DELTA, ip_addr=i + 2, verbose=False))
+    ues = []
+    for i in range(n_ues):
+        ue = UE(i, 10.0 + i % 100, 10.0 + i // 100, [tower], t_delta=T_DELTA, ip_addr=100 + i, verbose=False)
+        ue.calculate_dist()
+        ue.connect_to_best_tower()
+        ue.set_code_rate()
+        ue.buff_thresh = float("inf")
+        ues.append(ue)
+    tower.set_data_rate()
+    return tower, ues
+
+# Time loops calls of op in batches of batch, calling reset (untimed)
+# after every batch
+def timed_batches(loops, op, reset=None, batch=None):
+    total = 0.0
+    done = 0
+    batch = batch or loops
+    perf_counter = time.perf_counter
+    while done < loops:
+        n = min(batch, loops - done)
+        t0 = perf_counter()
+        for _ in range(n):
+            op()
+        total += perf_counter() - t0
+        if reset is not None:
+            reset()
+        done += n
+    return total
+
+# ----------------------------------------------------------------------
+# Benchmarks: each factory sets up its state and returns run(loops) ->
+# seconds spent in loops operations
+# ----------------------------------------------------------------------
+def bench_checksum():
+    _, (ue, dest) = make_cell()
+    header = bytes(ue.set_cust_data(make_header(ue.ip_addr, dest.ip_addr), b""))
+    return lambda loops: timed_batches(loops, lambda: ipv4_checksum(header))
+
+# Header packing of one ACK (what receive() does per data packet)
+def bench_cust_data():
+    _, (ue, dest) = make_cell()
+    header = make_header(ue.ip_addr, dest.ip_addr, size=1)
+    return lambda loops: timed_batches(loops, lambda: ue.set_cust_data(header, b"\x00"))
+
+def bench_tx_bytes(n_bytes):
+    _, (ue, dest) = make_cell()
+    dest_ip = dest.ip_addr
+
+    def reset():
+        ue.buffer.clear()
+        ue.n_tx_bits = 0
+    # keep at most ~8 MB of packets around between resets
+    batch = max(1, min(1000, (8 << 20) // n_bytes))
+    return lambda loops: timed_batches(loops, lambda: ue.set_tx_bytes(n_bytes, dest_ip), reset, batch)
+
+# ACK matching with depth packets in the buffer, the ACKed one last (so
+# every ACK scans the whole buffer like the oldest-unacked worst case)
+def bench_receive_ack(depth, batch=200):
+    _, (ue, dest) = make_cell()
+    with_num = lambda num: [0, num, 1, bytes(20), ue.ip_addr, dest.ip_addr, 0, 0, 0]
+    fillers = [with_num(num) for num in range(depth - 1)]
+    targets = [with_num(num) for num in range(depth - 1, depth - 1 + batch)]
+    acks = [[0, p[1], 0, bytes(21), dest.ip_addr, ue.ip_addr, 0, 0, 0] for p in targets]
+    receive = ue.receive
+
+    def fill():
+        ue.buffer.clear()
+        ue.buffer.extend(fillers)
+        ue.buffer.extend(targets)
+        ue.n_tx_bits = 0
+    fill()
+    state = {"i": 0}
+
+    def op():
+        receive(acks[state["i"]])
+        state["i"] += 1
+
+    def reset():
+        state["i"] = 0
+        fill()
+    return lambda loops: timed_batches(loops, op, reset, batch)
+
+def bench_tower_receive(n_bytes=1500, batch=1000):
+    tower, (ue, dest) = make_cell()
+    ue.set_tx_bytes(n_bytes, dest.ip_addr)
+    packet = ue.buffer.popleft()
+    receive = tower.receive
+
+    def reset():
+        tower.buffer.clear()
+        tower.n_rx_bytes = 0
+    return lambda loops: timed_batches(loops, lambda: receive(packet), reset, batch)
+
+# One transmit() of a data packet: delivered to an attached UE (which
+# sends its ACK back into the tower) or, for a UE elsewhere, forwarded to
+# the backhaul neighbors (handed to a no-op backhaul hook, so the
+# neighbors' receive() is not part of it)
+def bench_tower_transmit(deliver, n_bytes=1500, batch=200):
+    tower, (ue, dest) = make_cell(neighbors=0 if deliver else 2)
+    tower.backhaul = lambda tower, neighbor, packet: None
+    dest_ip = dest.ip_addr if deliver else 999
+    ue.set_tx_bytes(n_bytes, dest_ip)
+    tower.receive(ue.buffer.popleft())
+    packet = tower.buffer.pop()
+    packet[9] = 0 # not from a neighbor, forward to all of them
+    tower.ue_rates = {ip: float("inf") for ip in tower.ue_rates}
+
+    def fill():
+        tower.buffer.clear()
+        tower.buffer.extend([packet] * batch)
+        tower.n_rx_bytes = batch * len(packet[3])
+        tower.clear_tx_count()
+    fill()
+    return lambda loops: timed_batches(loops, lambda: tower.transmit(False), fill, batch)
+
+def bench_set_data_rate(n_ues):
+    tower, _ = make_cell(n_ues)
+    return lambda loops: timed_batches(loops, tower.set_data_rate)
+
+# name -> (factory, params)
+MICRO_BENCHMARKS = {
+    "ipv4_checksum"            : (bench_checksum, {}),
+    "set_cust_data"            : (bench_cust_data, {}),
+    "set_tx_bytes/64B"         : (bench_tx_bytes, {"n_bytes": 64}),
+    "set_tx_bytes/1500B"       : (bench_tx_bytes, {"n_bytes": 1500}),
+    "set_tx_bytes/64KB"        : (bench_tx_bytes, {"n_bytes": MAX_UNFRAG}),
+    "ue_receive_ack/depth1"    : (bench_receive_ack, {"depth": 1}),
+    "ue_receive_ack/depth10"   : (bench_receive_ack, {"depth": 10}),
+    "ue_receive_ack/depth100"  : (bench_receive_ack, {"depth": 100}),
+    "ue_receive_ack/depth1000" : (bench_receive_ack, {"depth": 1000}),
+    "tower_receive"            : (bench_tower_receive, {}),
+    "tower_transmit/deliver"   : (bench_tower_transmit, {"deliver": True}),
+    "tower_transmit/forward"   : (bench_tower_transmit, {"deliver": False}),
+    "set_data_rate/10ues"      : (bench_set_data_rate, {"n_ues": 10}),
+    "set_data_rate/100ues"     : (bench_set_data_rate, {"n_ues": 100}),
+    "set_data_rate/1000ues"    : (bench_set_data_rate, {"n_ues": 1000}),
+}
+
+# Calibrate and sample one benchmark. Times are seconds per operation.
+def measure(run, min_time=MIN_TIME, repeat=REPEAT):
+    loops = 1
+    while True:
+        t = run(loops)
+        if t >= min_time:
+            break
+        # aim a bit past min_time, but never more than 10x per round
+        loops = max(loops + 1, min(loops * 10, int(loops * min_time * 1.2 / t) if t > 0 else loops * 10))
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        samples = [run(loops) / loops for _ in range(repeat)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    best = min(samples)
+    return {
+        "loops"  : loops,
+        "best"   : best,
+        "median" : median(samples),
+        "spread" : (max(samples) - best) / best if best > 0 else 0.0,
+    }
+
+def run_micro(names, min_time=MIN_TIME, repeat=REPEAT, on_result=None):
+    results = {}
+    for name in names:
+        factory, params = MICRO_BENCHMARKS[name]
+        # the UEs print their attaches
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            run = factory(**params)
+            result = measure(run, min_time, repeat)
+        results[name] = result
+        if on_result is not None:
+            on_result(name, result)
+    return results
+
+# Ratios new / old of the best times, and the names that got slower
+# than threshold allows
+def compare(results, baseline, threshold=THRESHOLD):
+    rows = []
+    slower = []
+    for name, r in results.items():
+        b = baseline["results"].get(name)
+        if b is None:
+            continue
+        ratio = r["best"] / b["best"]
+        rows.append({"name": name, "old": b["best"], "new": r["best"], "ratio": ratio})
+        if ratio > 1 + threshold:
+            slower.append(name)
+    return {"baseline": baseline["meta"].get("commit"), "threshold": threshold, "benchmarks": rows, "slower": slower}
+
+# Per-op time in a readable unit
+def format_time(seconds):
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.0f} ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+def format_comparison(comparison):
+    lines = [f"vs {comparison['baseline']}", f"{'benchmark':<28}{'old':>12}{'new':>12}{'ratio':>9}"]
+    for row in comparison["benchmarks"]:
+        flag = "  SLOWER" if row["name"] in comparison["slower"] else ""
+        lines.append(f"{row['name']:<28}{format_time(row['old']):>12}{format_time(row['new']):>12}{row['ratio']:>8.2f}x{flag}")
+    return "\n".join(lines)
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the packet hot paths.")
+    parser.add_argument("--filter", action="append", help="only run benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds per sample")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="samples per benchmark")
+    parser.add_argument("--save", default=None, help="write the results JSON here (e.g. as a baseline)")
+    parser.add_argument("--compare", default=None, help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative slowdown that counts as a regression (exit status 1)")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    names = [n for n in MICRO_BENCHMARKS if not args.filter or any(f in n for f in args.filter)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    def on_result(name, r):
+        print(f"{name:<28}{format_time(r['best']):>12}  median {format_time(r['median'])}, "
+              f"spread {r['spread'] * 100:.1f}%, {r['loops']} loops", file=sys.stderr)
+
+    results = run_micro(names, args.min_time, args.repeat, on_result)
+    report = {
+        "meta": {
+            "commit"   : git_commit(),
+            "date"     : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python"   : sys.version.split()[0],
+            "min_time" : args.min_time,
+            "repeat"   : args.repeat,
+        },
+        "results": results,
+    }
+    status = 0
+    if baseline is not None:
+        report["comparison"] = compare(results, baseline, args.threshold)
+        print(format_comparison(report["comparison"]), file=sys.stderr)
+        if report["comparison"]["slower"]:
+            status = 1
+    if args.save:
+        with open(args.save, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,459 @@
+import random
+import math
+import csv
+import struct
+from array import array
+
+# Mobility models that move every UE in one batched call. Per-UE motion
+# state (waypoints, speeds, headings) lives in flat arrays indexed by the
+# UE's slot, so a step is a single loop over the slots with no per-UE
+# method calls.
+#
+# step(t_delta) returns the list of UEs that crossed min_move meters since
+# they were last flagged. Pass that list to RadioModel.update(ues, moved)
+# (or anything else that caches per-position data) so only those UEs are
+# recomputed.
+#
+# TraceMobility has the same interface but replays recorded positions
+# from a CSV/binary trace instead of generating them.
+
+#Parameters
+DEFAULT_BOUNDS = (-3000, -3000, 3000, 3000) # (x_min, y_min, x_max, y_max) meters
+PEDESTRIAN_SPEED = (0.5, 1.5)   # m/s
+VEHICLE_SPEED    = (5.0, 20.0)  # m/s
+
+#Mobility Model Base Class
+class MobilityModel:
+    def __init__(self, ues, bounds=DEFAULT_BOUNDS, min_move=1.0, seed=None):
+        self.bounds = bounds
+        self.min_move = min_move
+        self.rng = random.Random(seed)
+        self.ues = []
+        # Position each UE had when it was last flagged as moved
+        self.ref_x = array('d')
+        self.ref_y = array('d')
+        for ue in ues:
+            self.add_ue(ue)
+
+    def add_ue(self, ue):
+        self.ues.append(ue)
+        self.ref_x.append(ue.x_pos)
+        self.ref_y.append(ue.y_pos)
+        self._init_slot(ue)
+
+    def remove_ue(self, ue):
+        i = self.ues.index(ue)
+        del self.ues[i]
+        del self.ref_x[i]
+        del self.ref_y[i]
+        self._remove_slot(i)
+
+    # Sync with a new UE list (e.g. UEs added/deleted in the GUI) without
+    # resetting the motion state of the UEs that are still there
+    def set_ues(self, ues):
+        keep = set(ues)
+        for ue in [u for u in self.ues if u not in keep]:
+            self.remove_ue(ue)
+        current = set(self.ues)
+        for ue in ues:
+            if ue not in current:
+                self.add_ue(ue)
+
+    # Per-model state hooks
+    def _init_slot(self, ue):
+        pass
+
+    def _remove_slot(self, i):
+        pass
+
+    def _advance(self, t_delta):
+        raise NotImplementedError
+
+    # Move every UE by t_delta seconds. Returns the UEs that moved at
+    # least min_move meters since they were last returned. t_step is only
+    # used by trace-driven mobility.
+    def step(self, t_delta, t_step=None):
+        self._advance(t_delta)
+
+        moved = []
+        min_move2 = self.min_move * self.min_move
+        ref_x = self.ref_x
+        ref_y = self.ref_y
+        for i, ue in enumerate(self.ues):
+            dx = ue.x_pos - ref_x[i]
+            dy = ue.y_pos - ref_y[i]
+            if dx * dx + dy * dy >= min_move2:
+                ref_x[i] = ue.x_pos
+                ref_y[i] = ue.y_pos
+                moved.append(ue)
+        return moved
+
+    def _random_point(self):
+        x_min, y_min, x_max, y_max = self.bounds
+        return self.rng.uniform(x_min, x_max), self.rng.uniform(y_min, y_max)
+
+
+#Random Waypoint
+# Pick a random point in the bounds, walk there at a random speed, pause,
+# repeat.
+class RandomWaypoint(MobilityModel):
+    def __init__(self, ues, bounds=DEFAULT_BOUNDS, speed=PEDESTRIAN_SPEED, max_pause=10.0, min_move=1.0, seed=None):
+        self.speed = speed
+        self.max_pause = max_pause
+        self.wp_x  = array('d')
+        self.wp_y  = array('d')
+        self.vel   = array('d')
+        self.pause = array('d')
+        super().__init__(ues, bounds, min_move, seed)
+
+    def _init_slot(self, ue):
+        wx, wy = self._random_point()
+        self.wp_x.append(wx)
+        self.wp_y.append(wy)
+        self.vel.append(self.rng.uniform(*self.speed))
+        self.pause.append(0.0)
+
+    def _remove_slot(self, i):
+        del self.wp_x[i]
+        del self.wp_y[i]
+        del self.vel[i]
+        del self.pause[i]
+
+    def _advance(self, t_delta):
+        rng = self.rng
+        wp_x, wp_y, vel, pause = self.wp_x, self.wp_y, self.vel, self.pause
+        for i, ue in enumerate(self.ues):
+            if pause[i] > 0:
+                pause[i] -= t_delta
+                continue
+            dx = wp_x[i] - ue.x_pos
+            dy = wp_y[i] - ue.y_pos
+            dist = math.sqrt(dx * dx + dy * dy)
+            step = vel[i] * t_delta
+            if step >= dist:
+                # Arrived: pause, then head for a new waypoint
+                ue.x_pos = wp_x[i]
+                ue.y_pos = wp_y[i]
+                pause[i] = rng.uniform(0, self.max_pause)
+                wp_x[i], wp_y[i] = self._random_point()
+                vel[i] = rng.uniform(*self.speed)
+            else:
+                ue.x_pos += dx / dist * step
+                ue.y_pos += dy / dist * step
+
+
+#Gauss-Markov
+# Speed and heading are first-order autoregressive processes with memory
+# alpha. Near the edges the mean heading is pointed back at the center so
+# UEs don't pile up on the border.
+class GaussMarkov(MobilityModel):
+    def __init__(self, ues, bounds=DEFAULT_BOUNDS, mean_speed=1.0, speed_std=0.3, heading_std=0.4, alpha=0.85, edge_margin=100.0, min_move=1.0, seed=None):
+        self.mean_speed = mean_speed
+        self.speed_std = speed_std
+        self.heading_std = heading_std
+        self.alpha = alpha
+        self.edge_margin = edge_margin
+        self.vel     = array('d')
+        self.heading = array('d')
+        self.mean_heading = array('d')
+        super().__init__(ues, bounds, min_move, seed)
+
+    def _init_slot(self, ue):
+        h = self.rng.uniform(0, 2 * math.pi)
+        self.vel.append(self.mean_speed)
+        self.heading.append(h)
+        self.mean_heading.append(h)
+
+    def _remove_slot(self, i):
+        del self.vel[i]
+        del self.heading[i]
+        del self.mean_heading[i]
+
+    def _advance(self, t_delta):
+        gauss = self.rng.gauss
+        a = self.alpha
+        b = math.sqrt(1 - a * a)
+        x_min, y_min, x_max, y_max = self.bounds
+        cx = (x_min + x_max) / 2
+        cy = (y_min + y_max) / 2
+        m = self.edge_margin
+        vel, heading, mean_heading = self.vel, self.heading, self.mean_heading
+        for i, ue in enumerate(self.ues):
+            x = ue.x_pos
+            y = ue.y_pos
+            if x < x_min + m or x > x_max - m or y < y_min + m or y > y_max - m:
+                mean_heading[i] = math.atan2(cy - y, cx - x)
+
+            v = a * vel[i] + (1 - a) * self.mean_speed + b * self.speed_std * gauss(0, 1)
+            if v < 0:
+                v = 0.0
+            h = a * heading[i] + (1 - a) * mean_heading[i] + b * self.heading_std * gauss(0, 1)
+            vel[i] = v
+            heading[i] = h
+
+            x += v * math.cos(h) * t_delta
+            y += v * math.sin(h) * t_delta
+            ue.x_pos = min(max(x, x_min), x_max)
+            ue.y_pos = min(max(y, y_min), y_max)
+
+
+#Manhattan Grid
+# UEs drive along a grid of streets spaced block meters apart. At every
+# intersection they go straight with probability 0.5, otherwise turn left
+# or right. They turn around at the bounds.
+# Directions: 0 = +x, 1 = +y, 2 = -x, 3 = -y
+_DIR_X = (1, 0, -1, 0)
+_DIR_Y = (0, 1, 0, -1)
+
+class ManhattanGrid(MobilityModel):
+    def __init__(self, ues, bounds=DEFAULT_BOUNDS, block=200.0, speed=VEHICLE_SPEED, p_turn=0.5, min_move=1.0, seed=None):
+        self.block = block
+        self.speed = speed
+        self.p_turn = p_turn
+        self.vel = array('d')
+        self.dir = array('b')
+        super().__init__(ues, bounds, min_move, seed)
+
+    def _init_slot(self, ue):
+        # Snap the UE onto the nearest street
+        x_min, y_min, x_max, y_max = self.bounds
+        gx = x_min + round((ue.x_pos - x_min) / self.block) * self.block
+        gy = y_min + round((ue.y_pos - y_min) / self.block) * self.block
+        d = self.rng.randint(0, 3)
+        if d % 2 == 0:
+            ue.y_pos = min(max(gy, y_min), y_max)
+        else:
+            ue.x_pos = min(max(gx, x_min), x_max)
+        self.vel.append(self.rng.uniform(*self.speed))
+        self.dir.append(d)
+
+    def _remove_slot(self, i):
+        del self.vel[i]
+        del self.dir[i]
+
+    # Distance from pos to the next grid line when moving in sign direction
+    def _to_next_line(self, pos, origin, sign):
+        k = (pos - origin) / self.block
+        if sign > 0:
+            nxt = math.floor(k + 1e-9) + 1
+        else:
+            nxt = math.ceil(k - 1e-9) - 1
+        return abs(origin + nxt * self.block - pos)
+
+    def _advance(self, t_delta):
+        rng = self.rng
+        x_min, y_min, x_max, y_max = self.bounds
+        vel, dirs = self.vel, self.dir
+        for i, ue in enumerate(self.ues):
+            remaining = vel[i] * t_delta
+            d = dirs[i]
+            x = ue.x_pos
+            y = ue.y_pos
+            while remaining > 0:
+                sx = _DIR_X[d]
+                sy = _DIR_Y[d]
+                if sx != 0:
+                    gap = self._to_next_line(x, x_min, sx)
+                else:
+                    gap = self._to_next_line(y, y_min, sy)
+                if remaining < gap:
+                    x += sx * remaining
+                    y += sy * remaining
+                    break
+                # Reached an intersection
+                x += sx * gap
+                y += sy * gap
+                remaining -= gap
+                if rng.random() < self.p_turn:
+                    d = (d + (1 if rng.random() < 0.5 else 3)) % 4
+                # Turn around at the edge of the map
+                nx = x + _DIR_X[d] * 1e-6
+                ny = y + _DIR_Y[d] * 1e-6
+                if nx < x_min or nx > x_max or ny < y_min or ny > y_max:
+                    d = (d + 2) % 4
+            dirs[i] = d
+            ue.x_pos = x
+            ue.y_pos = y
+
+
+#Trace-driven mobility
+# Streams recorded positions from a trace file and applies them at the
+# matching t_step. The file is read chunk_rows rows at a time, so only one
+# chunk is ever in memory no matter how big the trace is.
+#
+# CSV traces have a header row and the columns t_step, ip, x, y, where ip
+# is either an integer or a dotted IPv4 string. Binary traces start with
+# TRACE_MAGIC followed by fixed TRACE_RECORD records. Both must be sorted
+# by t_step.
+TRACE_MAGIC  = b"UETRACE1"
+TRACE_RECORD = struct.Struct("<IIdd") # t_step, ip, x, y
+
+def ip_to_int(s):
+    a, b, c, d = (int(p) for p in s.split("."))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+def _parse_ip(s):
+    s = s.strip()
+    return ip_to_int(s) if "." in s else int(s)
+
+# Blank rows are skipped, a row that isn't t_step, ip, x, y raises a
+# ValueError naming its line
+def read_csv_trace(path, chunk_rows=65536):
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None) # header
+        chunk = []
+        for r in reader:
+            if not any(c.strip() for c in r):
+                continue
+            try:
+                if len(r) < 4:
+                    raise ValueError(f"{len(r)} columns")
+                chunk.append((int(r[0]), _parse_ip(r[1]), float(r[2]), float(r[3])))
+            except ValueError as e:
+                raise ValueError(f"{path} line {reader.line_num}: expected t_step, ip, x, y, got {r} ({e})") from None
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def read_binary_trace(path, chunk_rows=65536):
+    with open(path, "rb") as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a binary UE trace")
+        n_bytes = chunk_rows * TRACE_RECORD.size
+        while True:
+            buf = f.read(n_bytes)
+            if not buf:
+                return
+            # Ignore a truncated last record
+            buf = buf[:len(buf) - len(buf) % TRACE_RECORD.size]
+            yield list(TRACE_RECORD.iter_unpack(buf))
+
+# Convert a CSV trace to the binary format (streaming, constant memory)
+def csv_to_binary_trace(csv_path, bin_path, chunk_rows=65536):
+    with open(bin_path, "wb") as out:
+        out.write(TRACE_MAGIC)
+        for chunk in read_csv_trace(csv_path, chunk_rows):
+            out.write(b"".join(TRACE_RECORD.pack(*row) for row in chunk))
+
+def open_trace(path, chunk_rows=65536):
+    with open(path, "rb") as f:
+        is_binary = f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+    if is_binary:
+        return read_binary_trace(path, chunk_rows)
+    return read_csv_trace(path, chunk_rows)
+
+class TraceMobility:
+    def __init__(self, path, ues, chunk_rows=65536, min_move=1.0):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.min_move = min_move
+        self.t_step = 0        # internal step counter if step() isn't given one
+        self.n_rows = 0        # rows applied so far
+        self.n_unknown = 0     # rows for IPs that aren't in the simulation
+        self._chunks = open_trace(path, chunk_rows)
+        self._chunk = []
+        self._idx = 0
+        self.ues = []
+        self.by_ip = {}
+        self.ref_pos = {}      # ue -> position when last flagged as moved
+        self.set_ues(ues)
+
+    def set_ues(self, ues):
+        self.ues = list(ues)
+        self.by_ip = {ue.ip_addr: ue for ue in self.ues}
+        self.ref_pos = {ue: self.ref_pos.get(ue, (ue.x_pos, ue.y_pos)) for ue in self.ues}
+
+    # Checkpoints keep the read position (n_rows) instead of the open file.
+    # Restoring reopens the trace and skips the rows already applied.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_chunks"]
+        del state["_chunk"]
+        del state["_idx"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._chunks = open_trace(self.path, self.chunk_rows)
+        self._chunk = []
+        self._idx = 0
+        skip = self.n_rows
+        while skip > 0:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            if len(chunk) > skip:
+                self._chunk = chunk
+                self._idx = skip
+                break
+            skip -= len(chunk)
+
+    def add_ue(self, ue):
+        self.set_ues(self.ues + [ue])
+
+    def remove_ue(self, ue):
+        self.set_ues([u for u in self.ues if u is not ue])
+
+    # Apply every trace row with a t_step <= the current step
+    def step(self, t_delta, t_step=None):
+        if t_step is None:
+            t_step = self.t_step
+        self.t_step = t_step + 1
+
+        updated = {}
+        chunk = self._chunk
+        idx = self._idx
+        by_ip = self.by_ip
+        while True:
+            if idx >= len(chunk):
+                chunk = next(self._chunks, None)
+                idx = 0
+                if chunk is None:
+                    chunk = []
+                    break
+                continue
+            row = chunk[idx]
+            if row[0] > t_step:
+                break
+            idx += 1
+            self.n_rows += 1
+            ue = by_ip.get(row[1])
+            if ue is None:
+                self.n_unknown += 1
+                continue
+            ue.x_pos = row[2]
+            ue.y_pos = row[3]
+            updated[ue] = None
+        self._chunk = chunk
+        self._idx = idx
+
+        # Dirty flags: only UEs that really went somewhere
+        moved = []
+        min_move2 = self.min_move * self.min_move
+        for ue in updated:
+            rx, ry = self.ref_pos[ue]
+            dx = ue.x_pos - rx
+            dy = ue.y_pos - ry
+            if dx * dx + dy * dy >= min_move2:
+                self.ref_pos[ue] = (ue.x_pos, ue.y_pos)
+                moved.append(ue)
+        return moved
+
+
+MOBILITY_MODELS = {
+    "random_waypoint" : RandomWaypoint,
+    "gauss_markov"    : GaussMarkov,
+    "manhattan"       : ManhattanGrid,
+}
+
+# Build a mobility model by name (used by the GUI/CLI dropdowns).
+# "trace:<path>" streams a recorded trace instead.
+def make_mobility(name, ues, bounds=DEFAULT_BOUNDS, seed=None, **kwargs):
+    if name.startswith("trace:"):
+        return TraceMobility(name[len("trace:"):], ues, **kwargs)
+    if name not in MOBILITY_MODELS:
+        raise ValueError(f"Unknown mobility model {name!r}. Choose from {sorted(MOBILITY_MODELS)}")
+    return MOBILITY_MODELS[name](ues, bounds=bounds, seed=seed, **kwargs)
@@ -0,0 +1,135 @@
+import math
+import heapq
+import random
+from engine import PRIO_OUTAGE
+
+# Stochastic tower outages.
+#
+# A tower that is up fails with probability outage_prob every timestep and
+# then stays down for outage_duration seconds (the Tower's own parameters
+# unless the process overrides them). Instead of a Bernoulli draw per tower
+# per step, the process samples the time to the next failure directly
+# (geometric distribution) and the repair time (fixed, or exponential
+# around outage_duration), and keeps the upcoming status changes of all
+# towers in one heap. The engine only sees an event when the next change
+# is due, and all changes due in the same timestep go through one
+# set_tower_statuses() call, so the UEs get the new tower list once and
+# re-attach on their next step. Every tower draws from its own RNG
+# (seeded from seed and its IP), so the outages are the same whatever the
+# engine and however many other towers there are.
+#
+# The process assumes it is the only thing taking towers down: a repair
+# it has scheduled brings a tower back up either way.
+#
+# Example:
+#   python headless.py --steps 5000 --topology grid --towers 100 --ues 200 \
+#       --random-outages --outage-prob 0.001 --outage-duration 30 --outage-repair exponential
+
+#Parameters
+REPAIR_MODELS = ("fixed", "exponential")
+
+#Outage Process Class
+class OutageProcess:
+    def __init__(self, towers, t_delta, seed=None, prob=None, duration=None, repair="fixed"):
+        if repair not in REPAIR_MODELS:
+            raise ValueError(f"Unknown repair model {repair!r}, expected one of {', '.join(REPAIR_MODELS)}")
+        self.towers = list(towers)
+        self.t_delta = t_delta
+        self.repair = repair
+        # tower -> (failure probability per step, mean outage in seconds)
+        self.params = {t: (t.outage_prob if prob is None else prob,
+                           t.outage_duration if duration is None else duration) for t in self.towers}
+        self.rngs = {t: random.Random(f"{seed}:outage:{t.ip_addr}") for t in self.towers}
+        self.heap = []       # (t_step, seq, tower, operational)
+        self._seq = 0
+        self.engine = None
+        self.n_failures = 0
+        self.n_repairs = 0
+        self.down_steps = 0  # summed length of the outages started so far
+
+    # Timesteps a tower that is up now stays up (None = forever)
+    def time_to_failure(self, tower):
+        p = self.params[tower][0]
+        if p <= 0:
+            return None
+        if p >= 1:
+            return 1
+        u = 1.0 - self.rngs[tower].random() # (0, 1]
+        return 1 + int(math.log(u) / math.log1p(-p))
+
+    # Timesteps until a failed tower is back (at least one)
+    def time_to_repair(self, tower):
+        steps = self.params[tower][1] / self.t_delta
+        if self.repair == "exponential" and steps > 0:
+            steps = self.rngs[tower].expovariate(1.0 / steps)
+        return max(1, round(steps))
+
+    def _push(self, t_step, tower, operational):
+        heapq.heappush(self.heap, (t_step, self._seq, tower, operational))
+        self._seq += 1
+
+    # Draw the first failure of every tower that is up at t_step
+    def start(self, t_step):
+        for tower in self.towers:
+            if tower.operational:
+                ttf = self.time_to_failure(tower)
+                if ttf is not None:
+                    self._push(t_step + ttf - 1, tower, False)
+
+    # Timestep of the next status change (None if there is none)
+    def next_time(self):
+        return self.heap[0][0] if self.heap else None
+
+    # Apply every change due by t_step to sim and draw what follows them.
+    # Returns the number of changes.
+    def apply(self, sim, t_step):
+        heap = self.heap
+        changes = []
+        while heap and heap[0][0] <= t_step:
+            t, _, tower, operational = heapq.heappop(heap)
+            changes.append((tower, operational))
+            if operational:
+                self.n_repairs += 1
+                ttf = self.time_to_failure(tower)
+                if ttf is not None:
+                    self._push(t + ttf, tower, False)
+            else:
+                self.n_failures += 1
+                ttr = self.time_to_repair(tower)
+                self.down_steps += ttr
+                self._push(t + ttr, tower, True)
+        if changes:
+            sim.set_tower_statuses(changes)
+        return len(changes)
+
+    # Drive the process from an EventEngine: one pending event at a time,
+    # at the next change
+    def attach(self, engine):
+        self.engine = engine
+        self.start(engine.sim.t_step)
+        self._schedule()
+
+    def _schedule(self):
+        t = self.next_time()
+        if t is not None:
+            self.engine.schedule_external(t, self._fire, t, priority=PRIO_OUTAGE)
+
+    def _fire(self, t_step):
+        self.apply(self.engine.sim, t_step)
+        self._schedule()
+
+    # Count failures/repairs afresh (a run resumed from a checkpoint
+    # reports its own, like the other per run counters)
+    def reset_stats(self):
+        self.n_failures = 0
+        self.n_repairs = 0
+        self.down_steps = 0
+
+    def stats(self):
+        down = sum(1 for t in self.towers if not t.operational)
+        return {
+            "failures"   : self.n_failures,
+            "repairs"    : self.n_repairs,
+            "down_steps" : self.down_steps,
+            "towers_down": down,
+        }
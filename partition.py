@@ -0,0 +1,552 @@
+import io
+import heapq
+import pickle
+import traceback
+import multiprocessing
+from operator import itemgetter
+from engine import Simulation
+from checkpoint import snapshot, restore
+
+# Spatially partitioned simulation over several processes.
+#
+# The towers (and the UEs around them) are split into regions by recursive
+# coordinate bisection. Each region runs in its own worker process and
+# only steps the towers and UEs it owns.
+#
+# The run uses the deferred step of engine.Simulation, where backhaul
+# forwards are applied at the end of each tower round and handover
+# attaches at the end of the step. At those boundaries the workers
+# exchange, directly with each other:
+#   - packets a tower forwarded to a tower of another region
+#   - UEs that handed over to a tower of another region (the UE's state,
+#     its traffic source and its radio cache entry move with it)
+# and apply them in the same order a single process would. A partitioned
+# run is therefore identical to a single-process run of the same
+# simulation with deferred=True (and seed_noise() for noisy runs).
+# The coordinator only starts each step and gathers the results, one
+# round-trip per step.
+#
+# Limits:
+#   - Every worker (and the coordinator) keeps a full copy of the
+#     network: the UEs need the positions/status of every tower to pick
+#     one, and the mobility model is replicated so all workers move every
+#     UE the same way without shipping positions around. Memory therefore
+#     grows with regions x network size, and moving the UEs isn't split
+#     at all.
+#   - Every tower round is a barrier between all the regions (a packet
+#     forwarded across a border has to arrive before the next round), and
+#     flooding a packet over the backhaul takes about one round per hop:
+#     some 80 rounds a step on the 400 site / 4000 UE metro example of
+#     topology.py. Regions only pay off when each one has a CPU core of
+#     its own and its share of the UEs and towers takes well over those
+#     exchanges; starting the workers (each restores the whole network)
+#     and collecting the results cost a few seconds more.
+#
+# PartitionedSimulation has the interface EventEngine needs (step,
+# is_idle, set_tower_status, traffic.next_time), so outages and idle
+# skipping work as usual.
+
+#Parameters
+START_METHOD = None # multiprocessing start method (None = platform default)
+
+# How a worker fails when another worker is gone
+PEER_LOST = "Lost the worker of region"
+
+# ----------------------------------------------------------------------
+# Partitioning
+# ----------------------------------------------------------------------
+# Recursive coordinate bisection over towers and UEs together: cut the
+# longer side of the bounding box so that both halves get their share of
+# the points (every tower and every UE counts 1), with at least one tower
+# per region. Returns (tower_region, ue_region) lists of region numbers.
+def partition(towers, ues, n_regions):
+    n_regions = max(1, min(n_regions, len(towers)))
+    tower_region = [0] * len(towers)
+    ue_region = [0] * len(ues)
+    points = [(t.x_pos, t.y_pos, 0, i) for i, t in enumerate(towers)]
+    points += [(ue.x_pos, ue.y_pos, 1, i) for i, ue in enumerate(ues)]
+
+    def split(pts, k, first):
+        if k == 1:
+            for _, _, kind, i in pts:
+                if kind == 0:
+                    tower_region[i] = first
+                else:
+                    ue_region[i] = first
+            return
+        xs = [p[0] for p in pts]
+        ys = [p[1] for p in pts]
+        axis = 0 if max(xs) - min(xs) >= max(ys) - min(ys) else 1
+        pts.sort(key=lambda p: (p[axis], p[2], p[3]))
+        k_left = k // 2
+
+        # Towers left of each cut position
+        n_left_towers = [0]
+        for p in pts:
+            n_left_towers.append(n_left_towers[-1] + (p[2] == 0))
+        n_towers = n_left_towers[-1]
+
+        cut = (len(pts) * k_left + k // 2) // k
+        while cut < len(pts) and n_left_towers[cut] < k_left:
+            cut += 1
+        while cut > 0 and n_towers - n_left_towers[cut] < k - k_left:
+            cut -= 1
+        split(pts[:cut], k_left, first)
+        split(pts[cut:], k - k_left, first + k_left)
+
+    split(points, n_regions, 0)
+    return tower_region, ue_region
+
+# ----------------------------------------------------------------------
+# Moving state between processes
+# ----------------------------------------------------------------------
+# Towers and UEs exist in every process (the full copy), so references to
+# them are sent as indices and resolved to the local objects on arrival.
+# The same goes for the radio model and the active tower list. Forwards
+# are plain (tower index, tower index, packet) tuples and go through the
+# ordinary pickler.
+class _Pickler(pickle.Pickler):
+    def __init__(self, f, sim, refs):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.sim = sim
+        self.refs = refs
+
+    def persistent_id(self, obj):
+        if obj is self.sim.active_towers:
+            return ("a",)
+        return self.refs.get(id(obj))
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, f, sim, ues):
+        super().__init__(f)
+        self.sim = sim
+        self.ues = ues
+
+    def persistent_load(self, pid):
+        kind = pid[0]
+        if kind == "t":
+            return self.sim.towers[pid[1]]
+        if kind == "u":
+            return self.ues[pid[1]]
+        if kind == "r":
+            return self.sim.radio
+        return self.sim.active_towers
+
+def _entity_refs(sim, ues):
+    refs = {id(t): ("t", i) for i, t in enumerate(sim.towers)}
+    refs.update((id(ue), ("u", i)) for i, ue in enumerate(ues))
+    if sim.radio is not None:
+        refs[id(sim.radio)] = ("r",)
+    return refs
+
+def _dumps(obj, sim, refs):
+    f = io.BytesIO()
+    _Pickler(f, sim, refs).dump(obj)
+    return f.getvalue()
+
+def _loads(data, sim, ues):
+    return _Unpickler(io.BytesIO(data), sim, ues).load()
+
+# Entity state without the deferred-mode hooks (they point at the local
+# Simulation and are set again on the other side)
+def _state(entity, hook):
+    state = entity.__dict__.copy()
+    state.pop(hook, None)
+    return state
+
+#Region Simulation Class
+# The part of the network one worker steps. towers/active_towers are the
+# full (replicated) lists, ues/local_towers only what this region owns.
+# peers[r] is the connection to the worker of region r (None for this one).
+class RegionSimulation(Simulation):
+    def __init__(self, sim, region, tower_region, ue_region, peers):
+        self.region = region
+        self.n_regions = max(tower_region) + 1
+        self.peers = peers
+        self.tower_region = tower_region
+        self.all_ues = sim.ues
+        self.ue_index = {ue: i for i, ue in enumerate(sim.ues)}
+        owned = [ue for ue, r in zip(sim.ues, ue_region) if r == region]
+        super().__init__(sim.towers, owned, sim.t_delta, simulate_noise=sim.simulate_noise,
+                         radio=sim.radio, mobility=sim.mobility, traffic=sim.traffic, deferred=True)
+        self.t_step = sim.t_step
+        self.owned = set(owned)
+        self._update_local_towers()
+        self.refs = _entity_refs(self, self.all_ues)
+        self.n_migrated = 0
+        self.n_remote_forwards = 0
+
+        # Only keep traffic and radio state for the UEs we own
+        for ue in self.all_ues:
+            if ue not in self.owned:
+                if self.traffic is not None:
+                    self.traffic.remove(ue)
+                if self.radio is not None:
+                    self.radio.remove_ue(ue)
+
+    def _update_local_towers(self):
+        region = self.region
+        self.local_towers = [t for t in self.active_towers if self.tower_region[self.tower_index[t]] == region]
+
+    def set_tower_statuses(self, changes):
+        super().set_tower_statuses(changes)
+        self._update_local_towers()
+
+    def is_idle(self, towers=None):
+        return super().is_idle(self.local_towers if towers is None else towers)
+
+    def move(self):
+        super().move()
+        if self.moved is not None:
+            owned = self.owned
+            self.moved = [ue for ue in self.moved if ue in owned]
+
+    # One timestep of this region: the UE phase, tower rounds until no tower
+    # in any region can transmit (forwards are exchanged after every
+    # round), then the handovers
+    def run_step(self, t_step):
+        migrants, forwards, n = self.advance(t_step)
+        inbound = self._exchange([(n, m, f) for m, f in zip(migrants, forwards)])
+        migrants = [msg[1] for msg in inbound if msg is not None]
+        while n or any(msg[0] for msg in inbound if msg is not None):
+            forwards, n = self.tower_round_after([msg[2] for msg in inbound if msg is not None])
+            inbound = self._exchange([(n, None, f) for f in forwards])
+        self.complete(migrants)
+
+    # Swap one message with every other region. The pairs are served in
+    # the same order by every worker (the lower region sends first), so a
+    # send blocked on a full pipe always has its reader coming.
+    def _exchange(self, out):
+        region = self.region
+        inbound = [None] * self.n_regions
+        for r, conn in enumerate(self.peers):
+            try:
+                if r < region:
+                    inbound[r] = conn.recv()
+                    conn.send(out[r])
+                elif r > region:
+                    conn.send(out[r])
+                    inbound[r] = conn.recv()
+            except (EOFError, OSError):
+                raise RuntimeError(f"{PEER_LOST} {r}") from None
+        return inbound
+
+    # First part of a step: traffic, the UEs and the first tower round.
+    # Returns (migrants, forwards, n_transmitted) where migrants/forwards
+    # hold one message per region (empty if there is nothing for it).
+    def advance(self, t_step):
+        self.skip_to(t_step) # steps the coordinator jumped over
+        self.begin_step()
+        self.apply_traffic()
+        self.step_ues()
+
+        region = self.region
+        tower_index = self.tower_index
+        tower_region = self.tower_region
+        attaches = [[] for _ in range(self.n_regions)]
+        migrants = [[] for _ in range(self.n_regions)]
+        leaving = set()
+        for ue, tower, band, max_range in self.attaches:
+            i = self.ue_index[ue]
+            t = tower_index[tower]
+            r = tower_region[t]
+            attaches[r].append((i, t, band, max_range))
+            if r != region:
+                migrants[r].append(self._pack_ue(ue, i))
+                leaving.add(ue)
+        self.attaches = attaches[region]
+        if leaving:
+            self.n_migrated += len(leaving)
+            self.owned -= leaving
+            self.ues = [ue for ue in self.ues if ue not in leaving]
+        out = [_dumps((attaches[r], migrants[r]), self, self.refs) if attaches[r] and r != region else b""
+               for r in range(self.n_regions)]
+
+        self.tx_count = 0
+        return (out,) + self._round()
+
+    # One more tower round after delivering the forwards of the last one
+    def tower_round_after(self, inbound):
+        forwards = [self.forwards]
+        forwards.extend(f for f in inbound if f)
+        towers = self.towers
+        for _, dst, packet in heapq.merge(*forwards, key=itemgetter(0)):
+            towers[dst].receive(packet)
+        self.forwards = []
+        return self._round()
+
+    def _round(self):
+        n = self.tower_round(self.local_towers)
+        self.tx_count += n
+
+        region = self.region
+        tower_index = self.tower_index
+        tower_region = self.tower_region
+        forwards = [[] for _ in range(self.n_regions)]
+        for src, neighbor, packet in self.forwards:
+            dst = tower_index[neighbor]
+            forwards[tower_region[dst]].append((src, dst, packet))
+        self.forwards = forwards[region]
+        forwards[region] = []
+        self.n_remote_forwards += sum(map(len, forwards))
+        return forwards, n
+
+    def _pack_ue(self, ue, i):
+        source = pending = radio_entry = None
+        if self.traffic is not None:
+            source, pending = self.traffic.take(ue)
+        if self.radio is not None and ue in self.radio.rows:
+            radio = self.radio
+            radio_entry = (radio.rows[ue], radio.row_sum[ue], radio.ue_pos[ue])
+            radio.remove_ue(ue)
+        return (i, _state(ue, "defer_attach"), source, pending, radio_entry)
+
+    def _unpack_ue(self, migrant):
+        i, state, source, pending, radio_entry = migrant
+        ue = self.all_ues[i]
+        ue.__dict__.update(state)
+        ue.defer_attach = self._defer_attach
+        if self.traffic is not None:
+            self.traffic.put(ue, source, pending)
+        if radio_entry is not None:
+            radio = self.radio
+            radio.rows[ue], radio.row_sum[ue], radio.ue_pos[ue] = radio_entry
+        self.owned.add(ue)
+        return ue
+
+    # Last part of a step: take in the UEs that handed over to our towers,
+    # apply all attaches in UE order and finish the step
+    def complete(self, inbound):
+        attaches = [self.attaches]
+        arrived = []
+        for data in inbound:
+            if not data:
+                continue
+            a, migrants = _loads(data, self, self.all_ues)
+            attaches.append(a)
+            arrived.extend(self._unpack_ue(m) for m in migrants)
+        if arrived:
+            ue_index = self.ue_index
+            arrived.sort(key=ue_index.__getitem__)
+            self.ues = list(heapq.merge(self.ues, arrived, key=ue_index.__getitem__))
+            for ue in arrived:
+                ue.update_towers(self.active_towers)
+
+        towers = self.towers
+        for i, t, band, max_range in heapq.merge(*attaches, key=itemgetter(0)):
+            ue = self.all_ues[i]
+            ue.attach(towers[t], band, max_range)
+            ue.set_code_rate()
+        self.attaches = []
+
+        self.end_step()
+        self.move()
+        self.t_step += 1
+
+    # Final state of everything this region owns
+    def collect(self, observers):
+        towers = [(i, _state(t, "backhaul")) for i, t in enumerate(self.towers)
+                  if self.tower_region[i] == self.region]
+        ues = [(self.ue_index[ue], _state(ue, "defer_attach")) for ue in self.ues]
+        traffic = None
+        if self.traffic is not None:
+            traffic = (self.traffic.n_arrivals, self.traffic.n_bytes)
+        return _dumps((towers, ues, observers, traffic), self, self.refs)
+
+# links holds (i, j, end_i, end_j) for the pipe between every two regions.
+# A worker keeps its own ends and closes the rest, so a worker that dies
+# makes its peers fail too instead of hanging them.
+def _worker(conn, data, region, tower_region, ue_region, observer, links):
+    peers = [None] * (max(tower_region) + 1)
+    for i, j, end_i, end_j in links:
+        if i == region:
+            peers[j] = end_i
+            end_j.close()
+        elif j == region:
+            peers[i] = end_j
+            end_i.close()
+        else:
+            end_i.close()
+            end_j.close()
+    try:
+        sim = restore(data, restore_rng=False).sim
+        observers = []
+        if observer is not None:
+            observers.append(observer(sim)) # sees every tower and UE
+        rsim = RegionSimulation(sim, region, tower_region, ue_region, peers)
+        rsim.observers = observers
+        conn.send(("ok", len(rsim.ues)))
+        while True:
+            msg = conn.recv()
+            cmd = msg[0]
+            if cmd == "step":
+                rsim.run_step(msg[1])
+                next_time = rsim.traffic.next_time() if rsim.traffic is not None else None
+                conn.send(("ok", (rsim.is_idle(), next_time, rsim.tx_count)))
+            elif cmd == "status":
+                rsim.set_tower_statuses([(rsim.towers[i], operational) for i, operational in msg[1]])
+            elif cmd == "collect":
+                rsim.skip_to(msg[1])
+                conn.send(("ok", rsim.collect(observers)))
+            elif cmd == "stats":
+                conn.send(("ok", (len(rsim.ues), len(rsim.local_towers), rsim.n_migrated, rsim.n_remote_forwards)))
+            elif cmd == "close":
+                break
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+        for peer in peers:
+            if peer is not None:
+                peer.close()
+
+#Traffic View Class
+# What EventEngine reads from sim.traffic, summed over the regions
+class _TrafficView:
+    def __init__(self):
+        self.next = None
+        self.n_arrivals = 0
+        self.n_bytes = 0
+
+    def next_time(self):
+        return self.next
+
+#Partitioned Simulation Class
+# Coordinator side. sim must be a deferred-mode Simulation; it is copied to
+# the workers and gets the final state back from collect().
+# observer(sim) builds a per-region observer (e.g. a metrics collector);
+# collect() returns those observers with their tower/UE keys mapped back
+# to the objects of sim.
+class PartitionedSimulation:
+    def __init__(self, sim, n_regions, observer=None, start_method=START_METHOD):
+        if not sim.deferred:
+            raise ValueError("PartitionedSimulation needs a Simulation created with deferred=True")
+        if sim.forwards or sim.attaches:
+            raise ValueError("Simulation is in the middle of a step")
+        self.sim = sim
+        self.t_delta = sim.t_delta
+        self.t_step = sim.t_step
+        self.towers = sim.towers
+        self.tower_index = {t: i for i, t in enumerate(sim.towers)}
+        self.tower_region, self.ue_region = partition(sim.towers, sim.ues, n_regions)
+        self.n_regions = max(self.tower_region) + 1
+        self.traffic = _TrafficView() if sim.traffic is not None else None
+        self.tx_count = 0
+        self._idle = False
+
+        data = snapshot(sim, level=0)
+        ctx = multiprocessing.get_context(start_method)
+        links = [(i, j) + ctx.Pipe() for i in range(self.n_regions) for j in range(i + 1, self.n_regions)]
+        self.conns = []
+        self.procs = []
+        for region in range(self.n_regions):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, args=(child, data, region, self.tower_region, self.ue_region, observer, links), daemon=True)
+            proc.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(proc)
+        for _, _, end_i, end_j in links:
+            end_i.close()
+            end_j.close()
+        self._recv_all()
+
+    # One reply from every worker. When a worker fails its peers fail too
+    # (they lose it), so report the failure that isn't one of those.
+    def _recv_all(self):
+        replies = [conn.recv() for conn in self.conns]
+        errors = [value for status, value in replies if status == "error"]
+        if errors:
+            self.close()
+            errors.sort(key=lambda tb: PEER_LOST in tb)
+            raise RuntimeError("Region worker failed:\n" + errors[0])
+        return [value for _, value in replies]
+
+    @property
+    def now(self):
+        return self.t_step * self.t_delta
+
+    # One timestep (see RegionSimulation.run_step)
+    def step(self):
+        for conn in self.conns:
+            conn.send(("step", self.t_step))
+        replies = self._recv_all()
+        self.t_step += 1
+
+        self._idle = all(idle for idle, _, _ in replies)
+        self.tx_count = sum(n for _, _, n in replies)
+        if self.traffic is not None:
+            times = [t for _, t, _ in replies if t is not None]
+            self.traffic.next = min(times) if times else None
+
+    def is_idle(self):
+        return self._idle
+
+    # The regions catch up (and tell their observers) on the next advance
+    # or collect
+    def skip_to(self, t_step):
+        n = t_step - self.t_step
+        if n <= 0:
+            return 0
+        self.t_step = t_step
+        return n
+
+    def set_tower_status(self, tower, operational):
+        self.set_tower_statuses([(tower, operational)])
+
+    def set_tower_statuses(self, changes):
+        changes = [(tower, operational) for tower, operational in changes if tower.operational != operational]
+        if not changes:
+            return
+        self.sim.set_tower_statuses(changes)
+        msg = [(self.tower_index[tower], operational) for tower, operational in changes]
+        for conn in self.conns:
+            conn.send(("status", msg))
+        self._idle = False
+
+    # Per region (UEs owned, towers stepped, UEs migrated out, packets
+    # forwarded to other regions)
+    def stats(self):
+        for conn in self.conns:
+            conn.send(("stats",))
+        return self._recv_all()
+
+    # Pull the final tower/UE state back into sim and return the observers
+    def collect(self):
+        sim = self.sim
+        for conn in self.conns:
+            conn.send(("collect", self.t_step))
+        results = self._recv_all()
+        observers = []
+        n_arrivals = n_bytes = 0
+        for data in results:
+            towers, ues, region_observers, traffic = _loads(data, sim, sim.ues)
+            for i, state in towers:
+                sim.towers[i].__dict__.update(state)
+            for i, state in ues:
+                sim.ues[i].__dict__.update(state)
+            observers.extend(region_observers)
+            if traffic is not None:
+                n_arrivals += traffic[0]
+                n_bytes += traffic[1]
+        if self.traffic is not None:
+            self.traffic.n_arrivals = n_arrivals
+            self.traffic.n_bytes = n_bytes
+        sim.t_step = self.t_step
+        sim.tx_count = self.tx_count
+        return observers
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(("close",))
+            except (BrokenPipeError, OSError):
+                pass
+        for proc in self.procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        self.procs = []
@@ -0,0 +1,205 @@
+import math
+from array import array
+from bisect import bisect_right
+
+#Parameters
+# Carrier frequency per band (Hz)
+BAND_FREQ = {
+    "high" : 28e9,  # mmWave
+    "mid"  : 3.5e9, # sub-6 GHz
+    "low"  : 700e6  # sub-1 GHz
+}
+# Channel bandwidth per band (Hz)
+BAND_BANDWIDTH = {
+    "high" : 400e6,
+    "mid"  : 100e6,
+    "low"  : 20e6
+}
+# Tower transmit power per band (dBm)
+BAND_TX_POWER = {
+    "high" : 35,
+    "mid"  : 46,
+    "low"  : 46
+}
+# Combined antenna/beamforming gain per band (dB). mmWave only works
+# because of the big beamforming gain.
+BAND_ANT_GAIN = {
+    "high" : 30,
+    "mid"  : 15,
+    "low"  : 5
+}
+PATH_LOSS_EXP = 3.0 # log-distance path loss exponent (urban macro-ish)
+REF_DIST      = 1.0 # reference distance for the free-space part (meters)
+NOISE_FIGURE  = 7   # UE receiver noise figure (dB)
+THERMAL_NOISE = -174 # thermal noise density (dBm/Hz)
+
+# SINR (dB) thresholds -> LDPC code rate. A UE uses the highest code
+# rate whose threshold its SINR clears. Below the first entry the UE
+# falls back to the most robust code rate.
+MCS_TABLE = [
+    (-3.0, 0.2),
+    ( 0.0, 1/3),
+    ( 3.0, 0.5),
+    ( 6.0, 2/3),
+    ( 9.0, 0.75),
+    (12.0, 0.9),
+]
+MCS_THRESHOLDS = [s for s, _ in MCS_TABLE]
+MCS_CODE_RATES = [r for _, r in MCS_TABLE]
+
+def db_to_lin(x):
+    return 10 ** (x / 10)
+
+def lin_to_db(x):
+    if x <= 0:
+        return -math.inf
+    return 10 * math.log10(x)
+
+# Map an SINR in dB to a code rate using the MCS table
+def sinr_to_code_rate(sinr_db):
+    idx = bisect_right(MCS_THRESHOLDS, sinr_db) - 1
+    if idx < 0:
+        idx = 0
+    return MCS_CODE_RATES[idx]
+
+# Received power at REF_DIST (linear mW) for each band, i.e. everything
+# in the link budget except the d^-n term. Because this constant is shared
+# by every tower on a band we only have to cache d^-n per UE/tower pair and
+# can reuse the same gain matrix for all bands.
+def _band_constants():
+    consts = {}
+    for band, freq in BAND_FREQ.items():
+        fspl_ref = 20 * math.log10(4 * math.pi * REF_DIST * freq / 299792458.0)
+        rx_ref = BAND_TX_POWER[band] + BAND_ANT_GAIN[band] - fspl_ref
+        noise  = THERMAL_NOISE + 10 * math.log10(BAND_BANDWIDTH[band]) + NOISE_FIGURE
+        consts[band] = (db_to_lin(rx_ref), db_to_lin(noise))
+    return consts
+
+#Radio Model Class
+# Keeps a cached UE x tower gain matrix (one array per UE row) and the sum
+# of each row over the operational towers. Rows are only recomputed for UEs
+# that moved more than min_move meters, and tower status changes are applied
+# to the row sums incrementally, so a step costs O(moved UEs * towers) for
+# the gains plus O(UEs) for the SINR lookups.
+class RadioModel:
+    def __init__(self, towers, path_loss_exp=PATH_LOSS_EXP, min_move=1.0):
+        self.path_loss_exp = path_loss_exp
+        self.min_move = min_move
+        self.band_consts = _band_constants()
+        self.rows = {}     # ue -> array('d') of d^-n gains (one per tower)
+        self.row_sum = {}  # ue -> sum of gains over operational towers
+        self.ue_pos = {}   # ue -> (x, y) used to compute the cached row
+        self.n_row_updates = 0 # Number of rows recomputed (for profiling)
+        self.rebuild(towers)
+
+    # (Re)build the tower columns. Call this when towers are added/deleted
+    # or moved (e.g. the GUI changing its meters per pixel). Drops every
+    # cached row.
+    def rebuild(self, towers):
+        self.towers = list(towers)
+        self.col = {t: j for j, t in enumerate(self.towers)}
+        self.tower_x = array('d', (t.x_pos for t in self.towers))
+        self.tower_y = array('d', (t.y_pos for t in self.towers))
+        self.active = array('b', (1 if t.operational else 0 for t in self.towers))
+        self.rows.clear()
+        self.row_sum.clear()
+        self.ue_pos.clear()
+
+    # Add a single tower column without throwing away the cache
+    def add_tower(self, tower):
+        if tower in self.col:
+            return
+        j = len(self.towers)
+        self.towers.append(tower)
+        self.col[tower] = j
+        self.tower_x.append(tower.x_pos)
+        self.tower_y.append(tower.y_pos)
+        self.active.append(1 if tower.operational else 0)
+        for ue, row in self.rows.items():
+            g = self._gain(ue.x_pos - tower.x_pos, ue.y_pos - tower.y_pos)
+            row.append(g)
+            if tower.operational:
+                self.row_sum[ue] += g
+
+    def _gain(self, dx, dy):
+        d2 = dx * dx + dy * dy
+        if d2 < REF_DIST * REF_DIST:
+            d2 = REF_DIST * REF_DIST
+        return d2 ** (-0.5 * self.path_loss_exp)
+
+    def _compute_row(self, ue):
+        x = ue.x_pos
+        y = ue.y_pos
+        ref2 = REF_DIST * REF_DIST
+        e = -0.5 * self.path_loss_exp
+        row = array('d', [
+            (d2 if d2 > ref2 else ref2) ** e
+            for d2 in [(tx - x) * (tx - x) + (ty - y) * (ty - y)
+                       for tx, ty in zip(self.tower_x, self.tower_y)]
+        ])
+        active = self.active
+        self.rows[ue] = row
+        self.row_sum[ue] = sum([g for g, a in zip(row, active) if a])
+        self.ue_pos[ue] = (x, y)
+        self.n_row_updates += 1
+
+    # Apply tower operational changes to the cached row sums
+    def _sync_tower_status(self):
+        for j, t in enumerate(self.towers):
+            up = 1 if t.operational else 0
+            if up != self.active[j]:
+                self.active[j] = up
+                sign = 1.0 if up else -1.0
+                for ue, row in self.rows.items():
+                    self.row_sum[ue] += sign * row[j]
+
+    # Refresh the cache for this step. If moved is given (e.g. the dirty
+    # list from a mobility model) only those UEs are recomputed, otherwise
+    # every UE is checked against its cached position.
+    def update(self, ues, moved=None):
+        self._sync_tower_status()
+        rows = self.rows
+        if moved is None:
+            min_move2 = self.min_move * self.min_move
+            for ue in ues:
+                pos = self.ue_pos.get(ue)
+                if pos is None:
+                    self._compute_row(ue)
+                    continue
+                dx = ue.x_pos - pos[0]
+                dy = ue.y_pos - pos[1]
+                if dx * dx + dy * dy >= min_move2:
+                    self._compute_row(ue)
+        else:
+            for ue in moved:
+                self._compute_row(ue)
+            for ue in ues:
+                if ue not in rows:
+                    self._compute_row(ue)
+
+    # Forget a UE (e.g. deleted in the GUI)
+    def remove_ue(self, ue):
+        self.rows.pop(ue, None)
+        self.row_sum.pop(ue, None)
+        self.ue_pos.pop(ue, None)
+
+    # SINR (dB) of a UE on its current tower and band. Everything other
+    # than the serving tower that is operational counts as interference.
+    def sinr_db(self, ue):
+        tower = ue.current_tower
+        if tower is None or ue.freq_band is None:
+            return None
+        j = self.col.get(tower)
+        row = self.rows.get(ue)
+        if j is None or row is None:
+            return None
+        k, noise = self.band_consts[ue.freq_band]
+        g_serv = row[j]
+        interference = self.row_sum[ue] - g_serv if self.active[j] else self.row_sum[ue]
+        if interference < 0:
+            interference = 0.0 # float round-off from the incremental sums
+        return lin_to_db(k * g_serv / (k * interference + noise))
+
+    # Batch SINR for a list of UEs (None for unattached UEs)
+    def sinr_all(self, ues):
+        return [self.sinr_db(ue) for ue in ues]
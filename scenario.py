@@ -0,0 +1,339 @@
+import sys
+import json
+import struct
+from array import array
+from tower import Tower
+from ue import UE
+from traffic import TrafficSource, TrafficScheduler, AllExcept
+from mobility import ip_to_int
+
+# Declarative scenario files: towers, backhaul links, UEs, traffic sources
+# and outage schedules. Two formats:
+#
+# JSON (hand-written / small cases). Rows are arrays, IPs are ints or
+# dotted strings:
+#   {
+#     "t_delta"  : 0.5,
+#     "towers"   : [[ip, x, y, operational], ...],
+#     "links"    : [[tower_ip_a, tower_ip_b], ...],
+#     "ues"      : [[ip, x, y], ...],
+#     "traffic"  : [{"ue": ip or null (every UE), "kind": "poisson",
+#                    "dest": ip, [ips] or "all", "seed": 1, "start": 0,
+#                    "params": {"rate": 0.5}}, ...],
+#     "outages"  : [[tower_ip, start_step, duration_steps], ...],
+#     "tx_attempts" : n (optional, defaults to the number of towers)
+#   }
+#
+# Binary (big cases). A fixed header followed by one packed array per
+# column, so loading is a handful of array.frombytes calls:
+#   magic, t_delta, n_towers, n_links, n_ues, extra_len
+#   tower ip[n] x[n] y[n] up[n] | link a[n] b[n] | ue ip[n] x[n] y[n]
+#   extra: JSON with traffic, outages, tx_attempts and meta
+#
+# Internally a Scenario keeps the entities as columns and only creates the
+# Tower/UE objects in build().
+
+#Parameters
+SCENARIO_MAGIC  = b"NETSCN01"
+SCENARIO_HEADER = struct.Struct("<8sdIIII")
+T_DELTA = 0.5
+# "dest": "all" gives every UE its own list without its own IP. Above this
+# many UEs that is O(n^2), so they share one list instead and each UE
+# draws from it past its own index (traffic.AllExcept).
+ALL_DEST_COPY_LIMIT = 1000
+
+# 4 byte unsigned ints for IPs ('I' is 4 bytes on every platform we run on,
+# fall back to 'L' otherwise)
+IP_CODE = 'I' if array('I').itemsize == 4 else 'L'
+
+def _ip(x):
+    return ip_to_int(x) if isinstance(x, str) else int(x)
+
+# Read n items of typecode from f as an array (little-endian on disk)
+def _read_array(f, typecode, n):
+    a = array(typecode)
+    a.frombytes(f.read(n * a.itemsize))
+    if len(a) != n:
+        raise ValueError("Truncated scenario file")
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+def _write_array(f, typecode, values):
+    a = array(typecode, values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    f.write(a.tobytes())
+
+#Scenario Class
+class Scenario:
+    def __init__(self, t_delta=T_DELTA):
+        self.t_delta = t_delta
+        # Tower columns
+        self.tower_ip = array(IP_CODE)
+        self.tower_x  = array('d')
+        self.tower_y  = array('d')
+        self.tower_up = array('B')
+        # Backhaul links (tower IP pairs)
+        self.link_a = array(IP_CODE)
+        self.link_b = array(IP_CODE)
+        # UE columns
+        self.ue_ip = array(IP_CODE)
+        self.ue_x  = array('d')
+        self.ue_y  = array('d')
+        self.traffic = []      # traffic spec dicts (see the format above)
+        self.outages = []      # [tower_ip, start, duration]
+        self.tx_attempts = None
+        self.meta = {}
+
+    @property
+    def n_towers(self):
+        return len(self.tower_ip)
+
+    @property
+    def n_ues(self):
+        return len(self.ue_ip)
+
+    def add_tower(self, ip, x, y, operational=True):
+        self.tower_ip.append(_ip(ip))
+        self.tower_x.append(x)
+        self.tower_y.append(y)
+        self.tower_up.append(1 if operational else 0)
+
+    def add_link(self, a, b):
+        self.link_a.append(_ip(a))
+        self.link_b.append(_ip(b))
+
+    def add_ue(self, ip, x, y):
+        self.ue_ip.append(_ip(ip))
+        self.ue_x.append(x)
+        self.ue_y.append(y)
+
+    def add_traffic(self, kind, dest="all", ue=None, seed=None, start=0, **params):
+        self.traffic.append({"ue": ue, "kind": kind, "dest": dest, "seed": seed, "start": start, "params": params})
+
+    def add_outage(self, tower_ip, start, duration):
+        self.outages.append([_ip(tower_ip), start, duration])
+
+    # Snapshot an existing network (e.g. built in code or in the GUI)
+    @classmethod
+    def from_network(cls, towers, ues, t_delta=T_DELTA, traffic=None):
+        scn = cls(t_delta)
+        for tower in towers:
+            scn.add_tower(tower.ip_addr, tower.x_pos, tower.y_pos, tower.operational)
+        seen = set()
+        for tower in towers:
+            for other in tower.connected_towers:
+                key = (min(tower.ip_addr, other.ip_addr), max(tower.ip_addr, other.ip_addr))
+                if key not in seen:
+                    seen.add(key)
+                    scn.add_link(*key)
+        for ue in ues:
+            scn.add_ue(ue.ip_addr, ue.x_pos, ue.y_pos)
+        if traffic is not None:
+            for ue, source in traffic.sources.items():
+                dest = "all" if isinstance(source.dest, AllExcept) else source.dest
+                scn.add_traffic(source.kind, dest, ue=ue.ip_addr, seed=source.seed, start=source.start, **source.params)
+        return scn
+
+    # ------------------------------------------------------------------
+    # Building the simulation objects
+    # ------------------------------------------------------------------
+    # Create all Tower and UE objects and the backhaul. Returns
+    # (towers, ues) in file order.
+    def build(self, t_delta=None, verbose=False):
+        if t_delta is None:
+            t_delta = self.t_delta
+        towers = [Tower(ip, x, y, t_delta=t_delta, ip_addr=ip, verbose=verbose)
+                  for ip, x, y in zip(self.tower_ip, self.tower_x, self.tower_y)]
+        for tower, up in zip(towers, self.tower_up):
+            if not up:
+                tower.operational = False
+
+        by_ip = {t.ip_addr: t for t in towers}
+        if len(by_ip) != len(towers):
+            raise ValueError("Duplicate tower IPs in scenario")
+        for a, b in zip(self.link_a, self.link_b):
+            ta = by_ip.get(a)
+            tb = by_ip.get(b)
+            if ta is None or tb is None:
+                raise ValueError(f"Link {a}-{b} refers to an unknown tower")
+            # connect_tower appends to both sides, do the same without the
+            # per-call assert overhead
+            ta.connected_towers.append(tb)
+            tb.connected_towers.append(ta)
+
+        # Same flood control as run_env_main (we broadcast every message)
+        tx_attempts = self.tx_attempts if self.tx_attempts is not None else len(towers)
+        for tower in towers:
+            tower.tx_attempts = tx_attempts
+
+        # Every UE shares one list of the operational towers
+        active = [t for t in towers if t.operational]
+        ues = [UE(ip, x, y, active, t_delta=t_delta, ip_addr=ip, verbose=verbose)
+               for ip, x, y in zip(self.ue_ip, self.ue_x, self.ue_y)]
+        return towers, ues
+
+    # TrafficScheduler for the traffic specs (None if there are none)
+    def make_traffic(self, ues):
+        if not self.traffic:
+            return None
+        scheduler = TrafficScheduler()
+        by_ip = {ue.ip_addr: ue for ue in ues}
+        all_ips = [ue.ip_addr for ue in ues]
+        ip_index = {ip: i for i, ip in enumerate(all_ips)}
+        for spec in self.traffic:
+            if spec.get("ue") is None:
+                targets = ues
+            else:
+                ue = by_ip.get(_ip(spec["ue"]))
+                if ue is None:
+                    raise ValueError(f"Traffic for unknown UE {spec['ue']}")
+                targets = [ue]
+            seed = spec.get("seed")
+            dest = spec.get("dest", "all")
+            for ue in targets:
+                if dest == "all":
+                    if len(all_ips) > ALL_DEST_COPY_LIMIT:
+                        ue_dest = AllExcept(all_ips, ip_index[ue.ip_addr])
+                    else:
+                        ue_dest = [ip for ip in all_ips if ip != ue.ip_addr] or all_ips
+                elif isinstance(dest, list):
+                    ue_dest = [_ip(d) for d in dest]
+                else:
+                    ue_dest = _ip(dest)
+                # One spec for many UEs: give each UE its own stream
+                ue_seed = seed
+                if seed is not None and len(targets) > 1:
+                    ue_seed = seed * 1000003 + ue.ip_addr
+                scheduler.set_source(ue, TrafficSource(spec["kind"], ue_dest, seed=ue_seed, start=spec.get("start", 0), **spec.get("params", {})))
+        return scheduler
+
+    # [(tower, start, duration)] for the outage schedule
+    def outage_schedule(self, towers):
+        by_ip = {t.ip_addr: t for t in towers}
+        schedule = []
+        for tower_ip, start, duration in self.outages:
+            tower = by_ip.get(tower_ip)
+            if tower is None:
+                raise ValueError(f"Outage for unknown tower {tower_ip}")
+            schedule.append((tower, start, duration))
+        return schedule
+
+    # ------------------------------------------------------------------
+    # JSON
+    # ------------------------------------------------------------------
+    def _extra(self):
+        return {
+            "traffic"     : self.traffic,
+            "outages"     : self.outages,
+            "tx_attempts" : self.tx_attempts,
+            "meta"        : self.meta,
+        }
+
+    def _set_extra(self, d):
+        self.traffic = list(d.get("traffic") or [])
+        self.outages = [[_ip(o[0]), o[1], o[2]] for o in d.get("outages") or []]
+        self.tx_attempts = d.get("tx_attempts")
+        self.meta = d.get("meta") or {}
+
+    def to_json(self):
+        d = {
+            "t_delta" : self.t_delta,
+            "towers"  : [[ip, x, y, bool(up)] for ip, x, y, up in zip(self.tower_ip, self.tower_x, self.tower_y, self.tower_up)],
+            "links"   : [[a, b] for a, b in zip(self.link_a, self.link_b)],
+            "ues"     : [[ip, x, y] for ip, x, y in zip(self.ue_ip, self.ue_x, self.ue_y)],
+        }
+        d.update(self._extra())
+        return d
+
+    @classmethod
+    def from_json(cls, d):
+        scn = cls(d.get("t_delta", T_DELTA))
+        towers = d.get("towers") or []
+        if towers:
+            # Column-wise conversion (zip(*rows) runs in C)
+            cols = list(zip(*towers))
+            scn.tower_ip = array(IP_CODE, map(_ip, cols[0]))
+            scn.tower_x  = array('d', cols[1])
+            scn.tower_y  = array('d', cols[2])
+            scn.tower_up = array('B', (1 if up else 0 for up in cols[3])) if len(cols) > 3 else array('B', [1]) * len(towers)
+        links = d.get("links") or []
+        if links:
+            a, b = zip(*links)
+            scn.link_a = array(IP_CODE, map(_ip, a))
+            scn.link_b = array(IP_CODE, map(_ip, b))
+        ues = d.get("ues") or []
+        if ues:
+            cols = list(zip(*ues))
+            scn.ue_ip = array(IP_CODE, map(_ip, cols[0]))
+            scn.ue_x  = array('d', cols[1])
+            scn.ue_y  = array('d', cols[2])
+        scn._set_extra(d)
+        return scn
+
+    # ------------------------------------------------------------------
+    # Binary
+    # ------------------------------------------------------------------
+    def write_binary(self, f):
+        extra = json.dumps(self._extra()).encode()
+        f.write(SCENARIO_HEADER.pack(SCENARIO_MAGIC, self.t_delta, self.n_towers, len(self.link_a), self.n_ues, len(extra)))
+        _write_array(f, IP_CODE, self.tower_ip)
+        _write_array(f, 'd', self.tower_x)
+        _write_array(f, 'd', self.tower_y)
+        _write_array(f, 'B', self.tower_up)
+        _write_array(f, IP_CODE, self.link_a)
+        _write_array(f, IP_CODE, self.link_b)
+        _write_array(f, IP_CODE, self.ue_ip)
+        _write_array(f, 'd', self.ue_x)
+        _write_array(f, 'd', self.ue_y)
+        f.write(extra)
+
+    @classmethod
+    def read_binary(cls, f):
+        header = f.read(SCENARIO_HEADER.size)
+        if len(header) != SCENARIO_HEADER.size:
+            raise ValueError("Not a binary scenario file")
+        magic, t_delta, n_towers, n_links, n_ues, extra_len = SCENARIO_HEADER.unpack(header)
+        if magic != SCENARIO_MAGIC:
+            raise ValueError("Not a binary scenario file")
+        scn = cls(t_delta)
+        scn.tower_ip = _read_array(f, IP_CODE, n_towers)
+        scn.tower_x  = _read_array(f, 'd', n_towers)
+        scn.tower_y  = _read_array(f, 'd', n_towers)
+        scn.tower_up = _read_array(f, 'B', n_towers)
+        scn.link_a   = _read_array(f, IP_CODE, n_links)
+        scn.link_b   = _read_array(f, IP_CODE, n_links)
+        scn.ue_ip    = _read_array(f, IP_CODE, n_ues)
+        scn.ue_x     = _read_array(f, 'd', n_ues)
+        scn.ue_y     = _read_array(f, 'd', n_ues)
+        scn._set_extra(json.loads(f.read(extra_len).decode() or "{}"))
+        return scn
+
+# Load a scenario file, detecting the format from its first bytes
+def load_scenario(path):
+    with open(path, "rb") as f:
+        if f.read(len(SCENARIO_MAGIC)) == SCENARIO_MAGIC:
+            f.seek(0)
+            return Scenario.read_binary(f)
+    with open(path) as f:
+        return Scenario.from_json(json.load(f))
+
+# Save a scenario. binary=None picks the format from the extension
+# (.json is JSON, anything else is binary).
+def save_scenario(scenario, path, binary=None):
+    if binary is None:
+        binary = not path.lower().endswith(".json")
+    if binary:
+        with open(path, "wb") as f:
+            scenario.write_binary(f)
+    else:
+        with open(path, "w") as f:
+            json.dump(scenario.to_json(), f)
+
+if __name__ == "__main__":
+    # Convert between the formats: python scenario.py in.json out.bin
+    if len(sys.argv) != 3:
+        print("usage: python scenario.py <in> <out(.json|.bin)>")
+        sys.exit(1)
+    save_scenario(load_scenario(sys.argv[1]), sys.argv[2])
@@ -0,0 +1,332 @@
+import os
+import sys
+import json
+import math
+import time
+import shlex
+import argparse
+import itertools
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import headless
+
+# Parameter sweeps over headless runs. Every grid point (one combination
+# of the --grid values) is run with one seed after another on a process
+# pool. Each run's metrics are streamed back (and to a JSON lines file)
+# as soon as it finishes, and per grid point we keep a running mean and
+# confidence interval of the chosen metrics. A grid point stops getting new
+# seeds once all of its intervals are tight enough. A run that raises is
+# recorded as failed ({"failed": reason} as its metrics) and the sweep
+# goes on with the other runs.
+#
+# Example:
+#   python sweep.py --steps 2000 --seeds 1-50 --base "--topology grid --towers 9 --ues 20 --noise" \
+#       --grid arq_timeout=3,5,8 --grid arq_retx=1,3 \
+#       --metric summary.delivery_ratio --metric summary.tower_rate_mbps \
+#       --ci-rel 0.02 --min-runs 5 --workers 8 --out sweep.jsonl
+
+#Parameters
+CONFIDENCE = 0.95
+MIN_RUNS   = 3
+# Two-sided 95% Student t critical values for 1..30 degrees of freedom
+T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+       2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+       2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+# Critical value for a two-sided interval with n - 1 degrees of freedom.
+# Exact t for 95%, normal approximation otherwise (and for n > 31).
+def critical_value(n, confidence=CONFIDENCE):
+    df = n - 1
+    if confidence == 0.95 and 1 <= df <= len(T95):
+        return T95[df - 1]
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+#Running Statistic Class
+# Welford's online mean/variance
+class RunningStat:
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    # Half width of the confidence interval (inf until there are 2 samples)
+    def ci(self, confidence=CONFIDENCE):
+        if self.n < 2:
+            return math.inf
+        return critical_value(self.n, confidence) * self.std / math.sqrt(self.n)
+
+    def to_dict(self, confidence=CONFIDENCE):
+        ci = self.ci(confidence)
+        if self.n == 0:
+            return {"n": 0, "mean": None, "std": None, "ci": None}
+        return {"n": self.n, "mean": self.mean, "std": self.std, "ci": ci if math.isfinite(ci) else None}
+
+# "summary.delivery_ratio" -> metrics["summary"]["delivery_ratio"]
+def get_metric(metrics, path):
+    value = metrics
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+# "1-5,8" -> [1, 2, 3, 4, 5, 8]
+def parse_seeds(text):
+    seeds = []
+    for part in text.split(","):
+        lo, sep, hi = part.partition("-")
+        if sep:
+            seeds.extend(range(int(lo), int(hi) + 1))
+        else:
+            seeds.append(int(part))
+    return seeds
+
+# ["arq_timeout=3,5", "noise=0,1"] -> {"arq_timeout": [3, 5], "noise": [0, 1]}
+def parse_grid(items):
+    grid = {}
+    for item in items or []:
+        key, sep, values = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected name=v1,v2,..., got {item!r}")
+        parsed = []
+        for v in values.split(","):
+            try:
+                parsed.append(json.loads(v))
+            except ValueError:
+                parsed.append(v)
+        grid[key] = parsed
+    return grid
+
+# Every combination of the grid values as a list of dicts
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+# The headless options that take no value (--noise, --deferred, ...) by
+# their grid name
+def headless_flags():
+    return {action.dest: max(action.option_strings, key=len)
+            for action in headless.make_parser()._actions if action.option_strings and action.nargs == 0}
+
+# Headless command line for one run. Grid names are headless option names
+# (arq_timeout -> --arq-timeout). Flags take true/false or 1/0
+# (noise=0,1 runs with and without --noise).
+def run_argv(base_argv, point, seed, steps):
+    flags = headless_flags()
+    argv = list(base_argv) + ["--steps", str(steps), "--seed", str(seed)]
+    for name, value in point.items():
+        if name in flags:
+            if value not in (0, 1):
+                raise ValueError(f"{name} is a flag, expected true/false or 1/0, got {value!r}")
+            if value:
+                argv.append(flags[name])
+        else:
+            argv += ["--" + name.replace("_", "-"), str(value)]
+    return argv
+
+# Worker: one headless run
+def _run_one(argv):
+    try:
+        args = headless.make_parser().parse_args(argv)
+    except SystemExit:
+        raise ValueError(f"invalid headless arguments: {shlex.join(argv)}") from None
+    args.out = None
+    start = time.perf_counter()
+    metrics = headless.run_args(args)
+    metrics["config"].pop("out", None)
+    metrics["worker_time"] = time.perf_counter() - start
+    return metrics
+
+#Grid Point Class
+# Seeds still to run and the running statistics of one grid point
+class GridPoint:
+    def __init__(self, index, point, seeds, metric_names):
+        self.index = index
+        self.point = point
+        self.seeds = list(seeds)
+        self.next_seed = 0
+        self.running = 0
+        self.done = False
+        self.stopped_early = False
+        self.runs = 0     # finished runs that didn't fail
+        self.failed = []  # {"seed": seed, "error": reason} of the failed runs
+        self.stats = {m: RunningStat() for m in metric_names}
+
+    # Metrics that no run had a value for after min_runs runs (a wrong
+    # name, or a metric the scenario never produces)
+    def unavailable(self, min_runs):
+        if self.runs < max(min_runs, 1):
+            return []
+        return [m for m, stat in self.stats.items() if stat.n == 0]
+
+    # The intervals of all metrics that have values are tight enough.
+    # Unavailable metrics are left out, a point where none has values
+    # never converges.
+    def converged(self, min_runs, ci_width, ci_rel, confidence):
+        if ci_width is None and ci_rel is None:
+            return False
+        unavailable = self.unavailable(min_runs)
+        if len(unavailable) == len(self.stats):
+            return False
+        for m, stat in self.stats.items():
+            if m in unavailable:
+                continue
+            if stat.n < min_runs:
+                return False
+            ci = stat.ci(confidence)
+            if ci_width is not None and ci > ci_width:
+                return False
+            if ci_rel is not None and ci > ci_rel * abs(stat.mean):
+                return False
+        return True
+
+    def summary(self, min_runs, confidence):
+        unavailable = self.unavailable(min_runs)
+        return {
+            "point"         : self.point,
+            "runs"          : self.runs,
+            "failed"        : self.failed,
+            "stopped_early" : self.stopped_early,
+            "metrics"       : {m: None if m in unavailable else s.to_dict(confidence) for m, s in self.stats.items()},
+            "unavailable"   : unavailable,
+        }
+
+# Run the sweep. on_result(point, seed, metrics) is called for every
+# finished run in completion order (metrics is {"failed": reason} if the
+# run raised). Returns the per grid point summaries.
+def run_sweep(base_argv, grid, seeds, metric_names, steps=1000, workers=None,
+              min_runs=MIN_RUNS, ci_width=None, ci_rel=None, confidence=CONFIDENCE, on_result=None):
+    points = [GridPoint(i, p, seeds, metric_names) for i, p in enumerate(expand_grid(grid))]
+
+    workers = workers or os.cpu_count() or 1
+    pools = [ProcessPoolExecutor(max_workers=workers)] # the last one takes new runs
+    try:
+        max_inflight = 2 * workers
+        inflight = {}  # future -> (grid point, seed, pool)
+        rr = itertools.cycle(points)
+
+        # Round robin over the grid points that still need seeds
+        def submit_more():
+            while len(inflight) < max_inflight:
+                for _ in range(len(points)):
+                    gp = next(rr)
+                    if not gp.done and gp.next_seed < len(gp.seeds):
+                        break
+                else:
+                    return
+                seed = gp.seeds[gp.next_seed]
+                gp.next_seed += 1
+                gp.running += 1
+                fut = pools[-1].submit(_run_one, run_argv(base_argv, gp.point, seed, steps))
+                inflight[fut] = (gp, seed, pools[-1])
+
+        submit_more()
+        while inflight:
+            finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                gp, seed, pool = inflight.pop(fut)
+                gp.running -= 1
+                if fut.cancelled():
+                    continue
+                try:
+                    metrics = fut.result()
+                except Exception as e:
+                    # A worker that died takes its pool down: the other runs
+                    # on it fail too, new runs go to a fresh pool
+                    if isinstance(e, BrokenProcessPool) and pool is pools[-1]:
+                        pools.append(ProcessPoolExecutor(max_workers=workers))
+                    reason = f"{type(e).__name__}: {e}"
+                    gp.failed.append({"seed": seed, "error": reason})
+                    if on_result is not None:
+                        on_result(gp.point, seed, {"failed": reason})
+                    continue
+                gp.runs += 1
+                for m, stat in gp.stats.items():
+                    value = get_metric(metrics, m)
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        stat.add(float(value))
+                if on_result is not None:
+                    on_result(gp.point, seed, metrics)
+
+                if not gp.done and gp.converged(min_runs, ci_width, ci_rel, confidence):
+                    gp.done = True
+                    gp.stopped_early = gp.next_seed < len(gp.seeds)
+                    # Drop queued runs of this point that haven't started
+                    for f, (other, _, _) in list(inflight.items()):
+                        if other is gp:
+                            f.cancel()
+            submit_more()
+    finally:
+        for pool in pools:
+            pool.shutdown(cancel_futures=True)
+
+    return [gp.summary(min_runs, confidence) for gp in points]
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Parameter sweep over headless simulator runs.")
+    parser.add_argument("--steps", type=int, default=1000, help="timesteps per run")
+    parser.add_argument("--seeds", default="1-10", help="seeds to run per grid point, e.g. 1-30 or 1,2,5")
+    parser.add_argument("--base", default="", help="extra headless.py arguments shared by every run")
+    parser.add_argument("--grid", action="append", metavar="NAME=V1,V2", help="headless option to sweep (repeatable)")
+    parser.add_argument("--metric", action="append", help="metric path to aggregate (default: summary.delivery_ratio and summary.tower_rate_mbps)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--min-runs", type=int, default=MIN_RUNS, help="runs per grid point before early stopping is considered")
+    parser.add_argument("--ci-width", type=float, default=None, help="stop a grid point when every CI half width is below this")
+    parser.add_argument("--ci-rel", type=float, default=None, help="stop a grid point when every CI half width is below this fraction of the mean")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    parser.add_argument("--out", default=None, help="JSON lines file for the per-run results (streamed)")
+    parser.add_argument("--summary", default="-", help="summary JSON file (default: stdout)")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    metric_names = args.metric or ["summary.delivery_ratio", "summary.tower_rate_mbps"]
+    grid = parse_grid(args.grid)
+    seeds = parse_seeds(args.seeds)
+
+    out = open(args.out, "w") if args.out else None
+    count = [0]
+
+    def on_result(point, seed, metrics):
+        count[0] += 1
+        if "failed" in metrics:
+            shown = f"FAILED ({metrics['failed']})"
+        else:
+            shown = ", ".join(f"{m}={get_metric(metrics, m)}" for m in metric_names)
+        print(f"[{count[0]}] {point} seed={seed}: {shown}", file=sys.stderr)
+        if out is not None:
+            out.write(json.dumps({"point": point, "seed": seed, "metrics": metrics}) + "\n")
+            out.flush()
+
+    try:
+        summary = run_sweep(shlex.split(args.base), grid, seeds, metric_names, steps=args.steps,
+                            workers=args.workers, min_runs=args.min_runs, ci_width=args.ci_width,
+                            ci_rel=args.ci_rel, confidence=args.confidence, on_result=on_result)
+    finally:
+        if out is not None:
+            out.close()
+
+    for point in summary:
+        for m in point["unavailable"]:
+            print(f"{point['point']}: no run reported {m}, metric unavailable", file=sys.stderr)
+    text = json.dumps(summary, indent=2)
+    if args.summary == "-":
+        print(text)
+    else:
+        with open(args.summary, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
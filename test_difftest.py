@@ -0,0 +1,146 @@
+import os
+import math
+import random
+import contextlib
+import pytest
+import headless
+import difftest
+from eventlog import replay_metrics
+from latency import LatencyHistogram
+
+# Checks that the optimized engines, the event log and checkpoints give
+# the same results as a plain run. Every scenario is tiny and seeded, so
+# the whole file runs in a few seconds:
+#
+#   python -m pytest -q test_difftest.py
+
+#Parameters
+STEPS = 60
+BASE  = "--topology grid --towers 4 --ues 12 --traffic poisson --rate 0.5 --noise --seed 5"
+MOBILE = BASE + " --mobility random_waypoint"
+OUTAGE = BASE + " --random-outages --outage-prob 0.02 --outage-repair exponential"
+SPARSE = "--topology grid --towers 9 --ues 10 --rate 0.02 --noise --random-outages --outage-prob 0.01 --seed 3"
+SINR   = "--topology grid --towers 9 --ues 40 --link-model sinr --mobility manhattan --noise --seed 2"
+
+def scenario(base=BASE, *extra):
+    return headless.make_parser().parse_args(base.split() + list(extra))
+
+# run_engine without the attach prints of the towers/UEs
+def run_engine(engine, args, n_steps=STEPS, regions=2, **options):
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        return difftest.run_engine(engine, args, n_steps, regions=regions, **options)
+
+def assert_same(reference, engine, base, ref_options={}, options={}):
+    ref, sim = run_engine(reference, scenario(base), **ref_options)
+    test, _ = run_engine(engine, scenario(base), **options)
+    assert len(ref.steps) == STEPS
+    div = difftest.first_divergence(ref, test, sim)
+    assert div is None, difftest.format_divergence(div)
+
+# ----------------------------------------------------------------------
+# Engines (deferred mode is the reference, see difftest.py for why the
+# reference step itself differs)
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize("base", [BASE, MOBILE, OUTAGE])
+def test_async_matches_deferred(base):
+    assert_same("deferred", "async", base)
+
+@pytest.mark.parametrize("base", [MOBILE, OUTAGE])
+def test_partition_matches_deferred(base):
+    assert_same("deferred", "partition", base)
+
+# ----------------------------------------------------------------------
+# Optimizations against plain runs
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize("engine", ["deferred", "async"])
+def test_idle_skipping_matches_every_step(engine):
+    assert_same("deferred", engine, SPARSE, options={"skip_idle": True})
+
+def test_cached_radio_matches_rebuilt():
+    assert_same("deferred", "deferred", SINR, ref_options={"uncached_radio": True})
+
+def test_divergence_is_reported():
+    ref, sim = run_engine("deferred", scenario())
+    test, _ = run_engine("deferred", scenario(BASE.replace("--seed 5", "--seed 6")))
+    div = difftest.first_divergence(ref, test, sim)
+    assert div is not None and div["diffs"]
+
+# ----------------------------------------------------------------------
+# Event log and checkpoints
+# ----------------------------------------------------------------------
+def test_event_log_replay_matches_live_summary(tmp_path):
+    path = str(tmp_path / "run.evl")
+    live = headless.run_args(scenario(BASE, "--steps", str(STEPS), "--event-log", path))
+    replay = replay_metrics(path)
+    assert replay["summary"] == pytest.approx(live["summary"])
+    assert {t["ip"]: t["tx_bytes"] for t in replay["towers"]} == {t["ip"]: t["tx_bytes"] for t in live["towers"]}
+
+def test_checkpoint_resume_matches_uninterrupted_run(tmp_path):
+    path = str(tmp_path / "half.ckpt")
+    full = headless.run_args(scenario(BASE, "--steps", str(STEPS)))
+    first = headless.run_args(scenario(BASE, "--steps", str(STEPS // 2), "--checkpoint-out", path))
+    second = headless.run_args(scenario(BASE, "--steps", str(STEPS - STEPS // 2), "--resume", path))
+
+    assert second["run"]["steps"] == full["run"]["steps"]
+    # per run counters add up, the UE state carries over
+    for name in ("tower_tx_bytes", "ue_tx_bytes", "tower_transmissions"):
+        assert first["summary"][name] + second["summary"][name] == full["summary"][name]
+    for name in ("acked_packets", "dropped_packets", "buffered_packets"):
+        assert second["summary"][name] == full["summary"][name]
+    state = ("ip", "tower", "acked_packets", "dropped_packets", "buffered_packets", "ber")
+    assert [[ue[k] for k in state] for ue in second["ues"]] == [[ue[k] for k in state] for ue in full["ues"]]
+
+def test_checkpoint_resume_keeps_outage_stats(tmp_path):
+    path = str(tmp_path / "half.ckpt")
+    full = headless.run_args(scenario(OUTAGE, "--steps", str(STEPS)))
+    first = headless.run_args(scenario(OUTAGE, "--steps", str(STEPS // 2), "--checkpoint-out", path))
+    second = headless.run_args(scenario(OUTAGE, "--steps", str(STEPS - STEPS // 2), "--resume", path))
+
+    assert full["outages"]["failures"] > 0
+    for name in ("failures", "repairs", "down_steps"):
+        assert first["outages"][name] + second["outages"][name] == full["outages"][name]
+    assert second["outages"]["towers_down"] == full["outages"]["towers_down"]
+
+# ----------------------------------------------------------------------
+# Latency histogram
+# ----------------------------------------------------------------------
+# Exact percentile (same definition as LatencyHistogram.percentile)
+def exact_percentile(values, q):
+    values = sorted(values)
+    return values[max(1, math.ceil(q / 100 * len(values))) - 1]
+
+def test_histogram_exact_for_small_values():
+    hist = LatencyHistogram()
+    values = list(range(1, 101))
+    for v in values:
+        hist.record(v)
+    for q in (1, 50, 90, 99, 100):
+        assert hist.percentile(q) == exact_percentile(values, q)
+    assert hist.mean == pytest.approx(50.5)
+    assert (hist.min, hist.max) == (1, 100)
+
+def test_histogram_relative_error():
+    rng = random.Random(1)
+    values = [int(rng.lognormvariate(8, 2)) for _ in range(5000)]
+    hist = LatencyHistogram()
+    for v in values:
+        hist.record(v)
+    # the reported value is the top of the bucket: never below the exact
+    # percentile, and at most 2 ** (1 - bits) above it
+    for q in (50, 90, 99, 99.9):
+        exact = exact_percentile(values, q)
+        got = hist.percentile(q)
+        assert exact <= got <= exact * (1 + 2 ** (1 - hist.bits))
+
+def test_histogram_merge():
+    a, b, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for v in range(0, 3000, 7):
+        a.record(v)
+        both.record(v)
+    for v in range(5, 90000, 311):
+        b.record(v, count=2)
+        both.record(v, count=2)
+    a.merge(b)
+    assert (a.n, a.total, a.min, a.max) == (both.n, both.total, both.min, both.max)
+    assert [a.percentile(q) for q in (50, 90, 99)] == [both.percentile(q) for q in (50, 90, 99)]
+    assert LatencyHistogram().percentile(50) is None
@@ -0,0 +1,519 @@
+import sys
+import math
+import time
+import heapq
+import random
+from collections import deque
+import argparse
+from bisect import bisect_right
+from itertools import accumulate
+from mobility import ip_to_int
+from scenario import Scenario, save_scenario, T_DELTA
+
+# Generator for large synthetic networks, written as scenario files (so
+# headless.py --scenario, async_engine.py and the GUI's "Load Scenario" all
+# take them).
+#
+#   sites     hex       hexagonal grid, every site spacing from its six neighbors
+#             poisson   uniform random (Poisson) sites at the same density
+#   backhaul  mesh      every site linked to its k nearest neighbors
+#             mst       shortest spanning tree over the k nearest neighbor
+#                       candidates, plus --redundancy * (n - 1) of the
+#                       shortest remaining candidate links
+#             hierarchical  aggregation tree: sites link to a hub per
+#                       cluster of about fanout sites, the hubs to hubs one
+#                       level up, and so on; the top hubs form a spanning tree
+#   UEs       uniform   uniform over the area
+#             hotspots  most UEs in gaussian clusters around random centers
+#             sites     gaussian around randomly picked sites
+#             map:PATH  density map, a text grid of weights (whitespace or
+#                       comma separated, first row at the smallest y, i.e.
+#                       the top of the GUI canvas) stretched over the area
+#
+# Neighbor queries go through a uniform grid of buckets, so generating
+# 10k sites with 100k UEs takes seconds. Towers flood packets they can't
+# deliver over every backhaul link except the one they came in on. On a
+# tree every tower sees a packet once, but around every cycle the copies
+# keep multiplying until tx_attempts hops, so the scenario gets a hop limit
+# of the backhaul diameter (just enough to reach every tower). The copies
+# of one packet grow exponentially with the cycles it can go around within
+# that limit: a mesh of 16 sites already makes thousands, and mst with
+# --redundancy on a few hundred sites far more. main() counts the
+# copies and refuses a backhaul where one packet makes more than
+# FLOOD_FACTOR copies per site (only a warning with --tx-attempts); use
+# plain mst or hierarchical for big networks. Even on a tree every packet
+# reaches every tower, so a step costs about sites * packets sent: a few
+# hundred sites with a few thousand light UEs is already about a second
+# per step.
+#
+# Example:
+#   python topology.py --sites 400 --layout poisson --backhaul hierarchical \
+#       --ues 4000 --density hotspots --traffic poisson --rate 0.01 --out metro.bin
+#   python headless.py --steps 600 --scenario metro.bin
+
+#Parameters
+SPACING     = 1000.0 # meters between neighboring sites
+NEIGHBORS   = 6      # k of the nearest neighbor mesh / spanning tree candidates
+FANOUT      = 7      # sites per hub of the hierarchical backhaul
+HOTSPOTS    = 20     # clusters of the hotspots UE density
+HOTSPOT_SHARE = 0.7  # share of the UEs in the hotspots (the rest is uniform)
+TOWER_NET   = "10.0.0.0"  # tower i gets TOWER_NET + i
+UE_NET      = "10.64.0.0" # UE i gets UE_NET + i (clear of the broadcast IP 65535)
+FLOOD_FACTOR  = 10   # max backhaul copies of one flooded packet per site
+FLOOD_SOURCES = 8    # towers the flood is counted from
+
+# ----------------------------------------------------------------------
+# Sites
+# ----------------------------------------------------------------------
+# Hex grid in a roughly square block (odd rows shifted by half a spacing)
+def hex_sites(n, spacing, rng=None):
+    side = int(math.ceil(math.sqrt(n)))
+    row_spacing = spacing * math.sqrt(3) / 2
+    xs = []
+    ys = []
+    for i in range(n):
+        row, col = divmod(i, side)
+        xs.append((col + 0.5 * (row % 2)) * spacing)
+        ys.append(row * row_spacing)
+    return xs, ys
+
+# n uniform random sites in a square with the hex grid's site density
+def poisson_sites(n, spacing, rng):
+    side = math.sqrt(n * spacing * spacing * math.sqrt(3) / 2)
+    xs = [rng.uniform(0, side) for _ in range(n)]
+    ys = [rng.uniform(0, side) for _ in range(n)]
+    return xs, ys
+
+LAYOUTS = {
+    "hex"     : hex_sites,
+    "poisson" : poisson_sites,
+}
+
+#Site Index Class
+# Points bucketed into square cells for nearest neighbor queries
+class SiteIndex:
+    def __init__(self, xs, ys, cell):
+        self.xs = xs
+        self.ys = ys
+        self.cell = cell
+        self.x0 = min(xs)
+        self.y0 = min(ys)
+        self.cells = {}
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            self.cells.setdefault(self._key(x, y), []).append(i)
+        keys = self.cells.keys()
+        self.max_ring = max(max(abs(cx) for cx, _ in keys), max(abs(cy) for _, cy in keys)) + 1
+
+    def _key(self, x, y):
+        return int((x - self.x0) // self.cell), int((y - self.y0) // self.cell)
+
+    # The k points nearest to (x, y) as [(distance^2, index)], nearest
+    # first, only counting points accept(index) is true for. Searches rings
+    # of cells outwards until nothing closer can be left.
+    def nearest(self, x, y, k, accept=None):
+        cx, cy = self._key(x, y)
+        cells = self.cells
+        xs = self.xs
+        ys = self.ys
+        best = [] # max heap of (-d2, index)
+        for ring in range(self.max_ring + 1):
+            if ring == 0:
+                keys = [(cx, cy)]
+            else:
+                keys = [(cx + dx, cy + ring) for dx in range(-ring, ring + 1)]
+                keys += [(cx + dx, cy - ring) for dx in range(-ring, ring + 1)]
+                keys += [(cx + ring, cy + dy) for dy in range(-ring + 1, ring)]
+                keys += [(cx - ring, cy + dy) for dy in range(-ring + 1, ring)]
+            for key in keys:
+                for j in cells.get(key, ()):
+                    if accept is not None and not accept(j):
+                        continue
+                    d2 = (xs[j] - x) ** 2 + (ys[j] - y) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, j))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, j))
+            # everything outside the rings seen so far is > ring * cell away
+            if len(best) == k and -best[0][0] <= (ring * self.cell) ** 2:
+                break
+        return sorted((-d2, j) for d2, j in best)
+
+# Candidate links: every site with its k nearest neighbors, as a sorted
+# list of unique (distance^2, a, b) with a < b
+def knn_links(index, k):
+    seen = set()
+    links = []
+    xs = index.xs
+    ys = index.ys
+    for i in range(len(xs)):
+        for d2, j in index.nearest(xs[i], ys[i], k + 1, accept=lambda j, i=i: j != i):
+            key = (i, j) if i < j else (j, i)
+            if key not in seen:
+                seen.add(key)
+                links.append((d2,) + key)
+    links.sort()
+    return links
+
+# Union-find with path halving
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+# ----------------------------------------------------------------------
+# Backhaul
+# ----------------------------------------------------------------------
+def mesh_links(index, k=NEIGHBORS, redundancy=0.0, fanout=FANOUT):
+    return [(a, b) for _, a, b in knn_links(index, k)]
+
+# Kruskal over the nearest neighbor candidates. If those leave several
+# components, each smaller one is joined to its nearest foreign site
+# (Boruvka steps) until one is left.
+def mst_links(index, k=NEIGHBORS, redundancy=0.0, fanout=FANOUT):
+    n = len(index.xs)
+    parent = list(range(n))
+    candidates = knn_links(index, k)
+    tree = []
+    spare = []
+    for d2, a, b in candidates:
+        ra = _find(parent, a)
+        rb = _find(parent, b)
+        if ra == rb:
+            spare.append((a, b))
+            continue
+        parent[ra] = rb
+        tree.append((a, b))
+
+    xs = index.xs
+    ys = index.ys
+    while len(tree) < n - 1:
+        components = {}
+        for i in range(n):
+            components.setdefault(_find(parent, i), []).append(i)
+        largest = max(components, key=lambda r: len(components[r]))
+        joins = []
+        for root, members in components.items():
+            if root == largest:
+                continue
+            best = None
+            for i in members:
+                found = index.nearest(xs[i], ys[i], 1, accept=lambda j, root=root: _find(parent, j) != root)
+                if found and (best is None or found[0][0] < best[0]):
+                    best = (found[0][0], i, found[0][1])
+            joins.append(best)
+        for _, a, b in sorted(joins):
+            ra = _find(parent, a)
+            rb = _find(parent, b)
+            if ra != rb:
+                parent[ra] = rb
+                tree.append((a, b))
+
+    extra = spare[:int(redundancy * (n - 1))]
+    return tree + extra
+
+# Sites are grouped by square cells holding about fanout sites each, the
+# site nearest the middle of a cell becomes its hub and the others link
+# to it. The hubs are grouped again with cells sqrt(fanout) times larger
+# until at most fanout are left, which get a spanning tree of their own.
+def hierarchical_links(index, k=NEIGHBORS, redundancy=0.0, fanout=FANOUT):
+    xs = index.xs
+    ys = index.ys
+    links = []
+    level = list(range(len(xs)))
+    cell = index.cell * math.sqrt(fanout)
+    while len(level) > fanout:
+        groups = {}
+        for i in level:
+            groups.setdefault((int(xs[i] // cell), int(ys[i] // cell)), []).append(i)
+        if len(groups) == len(level):
+            cell *= 2 # too sparse for this cell size
+            continue
+        hubs = []
+        for members in groups.values():
+            mx = sum(xs[i] for i in members) / len(members)
+            my = sum(ys[i] for i in members) / len(members)
+            hub = min(members, key=lambda i: (xs[i] - mx) ** 2 + (ys[i] - my) ** 2)
+            links.extend((i, hub) for i in members if i != hub)
+            hubs.append(hub)
+        level = hubs
+        cell *= math.sqrt(fanout)
+
+    # Prim over the few top hubs
+    if len(level) > 1:
+        dist = {i: ((xs[i] - xs[level[0]]) ** 2 + (ys[i] - ys[level[0]]) ** 2, level[0]) for i in level[1:]}
+        while dist:
+            i = min(dist, key=lambda i: dist[i][0])
+            links.append((dist.pop(i)[1], i))
+            for j in dist:
+                d2 = (xs[j] - xs[i]) ** 2 + (ys[j] - ys[i]) ** 2
+                if d2 < dist[j][0]:
+                    dist[j] = (d2, i)
+    return links
+
+BACKHAULS = {
+    "mesh"         : mesh_links,
+    "mst"          : mst_links,
+    "hierarchical" : hierarchical_links,
+}
+
+# ----------------------------------------------------------------------
+# UE placement
+# ----------------------------------------------------------------------
+def _clip(v, lo, hi):
+    return lo if v < lo else hi if v > hi else v
+
+def uniform_ues(n, bounds, rng, **kwargs):
+    x0, y0, x1, y1 = bounds
+    return [rng.uniform(x0, x1) for _ in range(n)], [rng.uniform(y0, y1) for _ in range(n)]
+
+def hotspot_ues(n, bounds, rng, hotspots=HOTSPOTS, share=HOTSPOT_SHARE, spacing=SPACING, **kwargs):
+    x0, y0, x1, y1 = bounds
+    centers = [(rng.uniform(x0, x1), rng.uniform(y0, y1), rng.uniform(0.2, 1.0) * spacing) for _ in range(hotspots)]
+    xs = []
+    ys = []
+    for _ in range(n):
+        if centers and rng.random() < share:
+            cx, cy, sigma = rng.choice(centers)
+            xs.append(_clip(rng.gauss(cx, sigma), x0, x1))
+            ys.append(_clip(rng.gauss(cy, sigma), y0, y1))
+        else:
+            xs.append(rng.uniform(x0, x1))
+            ys.append(rng.uniform(y0, y1))
+    return xs, ys
+
+def site_ues(n, bounds, rng, sites=None, spacing=SPACING, **kwargs):
+    x0, y0, x1, y1 = bounds
+    sx, sy = sites
+    sigma = spacing / 3
+    xs = []
+    ys = []
+    for _ in range(n):
+        i = rng.randrange(len(sx))
+        xs.append(_clip(rng.gauss(sx[i], sigma), x0, x1))
+        ys.append(_clip(rng.gauss(sy[i], sigma), y0, y1))
+    return xs, ys
+
+#Density Map Class
+# Grid of non-negative weights stretched over the area. A UE lands in a
+# cell with probability proportional to its weight, uniformly inside it.
+class DensityMap:
+    def __init__(self, rows):
+        self.rows = [list(map(float, row)) for row in rows if row]
+        self.n_cols = max(len(row) for row in self.rows)
+        flat = []
+        for row in self.rows:
+            flat.extend(row + [0.0] * (self.n_cols - len(row)))
+        if min(flat) < 0 or sum(flat) <= 0:
+            raise ValueError("Density map needs non-negative weights with a positive sum")
+        self.cumulative = list(accumulate(flat))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls([line.replace(",", " ").split() for line in f if line.strip() and not line.startswith("#")])
+
+    def sample(self, n, bounds, rng):
+        x0, y0, x1, y1 = bounds
+        w = (x1 - x0) / self.n_cols
+        h = (y1 - y0) / len(self.rows)
+        total = self.cumulative[-1]
+        xs = []
+        ys = []
+        for _ in range(n):
+            c = bisect_right(self.cumulative, rng.random() * total)
+            row, col = divmod(min(c, len(self.cumulative) - 1), self.n_cols)
+            xs.append(x0 + (col + rng.random()) * w)
+            ys.append(y0 + (row + rng.random()) * h)
+        return xs, ys
+
+DENSITIES = {
+    "uniform"  : uniform_ues,
+    "hotspots" : hotspot_ues,
+    "sites"    : site_ues,
+}
+
+def place_ues(density, n, bounds, rng, **kwargs):
+    if density.startswith("map:"):
+        return DensityMap.load(density[len("map:"):]).sample(n, bounds, rng)
+    if density not in DENSITIES:
+        raise ValueError(f"Unknown UE density {density!r}. Choose from {sorted(DENSITIES)} or map:<path>")
+    return DENSITIES[density](n, bounds, rng, **kwargs)
+
+# ----------------------------------------------------------------------
+# Scenario
+# ----------------------------------------------------------------------
+# Build a Scenario. Towers get TOWER_NET + i, UEs UE_NET + i.
+def generate(n_sites, layout="hex", backhaul="mst", n_ues=0, density="uniform", spacing=SPACING,
+             neighbors=NEIGHBORS, redundancy=0.0, fanout=FANOUT, hotspots=HOTSPOTS, seed=0, t_delta=T_DELTA):
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}. Choose from {sorted(LAYOUTS)}")
+    if backhaul not in BACKHAULS:
+        raise ValueError(f"Unknown backhaul {backhaul!r}. Choose from {sorted(BACKHAULS)}")
+    rng = random.Random(seed)
+    xs, ys = LAYOUTS[layout](n_sites, spacing, rng)
+    links = []
+    if n_sites > 1:
+        index = SiteIndex(xs, ys, spacing)
+        links = BACKHAULS[backhaul](index, k=min(neighbors, n_sites - 1), redundancy=redundancy, fanout=fanout)
+
+    margin = spacing / 2
+    bounds = (min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin)
+    ue_x, ue_y = place_ues(density, n_ues, bounds, rng, hotspots=hotspots, spacing=spacing, sites=(xs, ys))
+
+    scn = Scenario(t_delta)
+    tower_base = ip_to_int(TOWER_NET)
+    ue_base = ip_to_int(UE_NET)
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        scn.add_tower(tower_base + i, x, y)
+    for a, b in links:
+        scn.add_link(tower_base + a, tower_base + b)
+    for i, (x, y) in enumerate(zip(ue_x, ue_y)):
+        scn.add_ue(ue_base + i, x, y)
+    scn.meta = {"generator": {
+        "layout": layout, "backhaul": backhaul, "density": density, "spacing": spacing, "neighbors": neighbors,
+        "redundancy": redundancy, "fanout": fanout, "seed": seed, "bounds": list(bounds),
+    }}
+    return scn
+
+# Links per site and whether the backhaul connects every site
+def backhaul_stats(scn):
+    n = scn.n_towers
+    index = {ip: i for i, ip in enumerate(scn.tower_ip)}
+    parent = list(range(n))
+    for a, b in zip(scn.link_a, scn.link_b):
+        ra = _find(parent, index[a])
+        rb = _find(parent, index[b])
+        if ra != rb:
+            parent[ra] = rb
+    components = len({_find(parent, i) for i in range(n)})
+    return {"sites": n, "links": len(scn.link_a), "mean_degree": 2 * len(scn.link_a) / n if n else 0.0,
+            "components": components, "cycles": len(scn.link_a) - n + components}
+
+# Hops from tower i to every tower it reaches (-1 if it doesn't)
+def _bfs(adj, i):
+    dist = [-1] * len(adj)
+    dist[i] = 0
+    queue = deque([i])
+    while queue:
+        j = queue.popleft()
+        for k in adj[j]:
+            if dist[k] < 0:
+                dist[k] = dist[j] + 1
+                queue.append(k)
+    return dist
+
+# Neighbor lists of the backhaul by tower index
+def _adjacency(scn):
+    index = {ip: i for i, ip in enumerate(scn.tower_ip)}
+    adj = [[] for _ in range(scn.n_towers)]
+    for a, b in zip(scn.link_a, scn.link_b):
+        adj[index[a]].append(index[b])
+        adj[index[b]].append(index[a])
+    return adj
+
+# Longest shortest path of the backhaul in hops, by repeated BFS sweeps
+# from the farthest tower found so far in each component: exact on trees,
+# and on the near planar meshes generated here as good as exact
+def backhaul_diameter(scn):
+    n = scn.n_towers
+    adj = _adjacency(scn)
+    diameter = 0
+    seen = [False] * n
+    for i in range(n):
+        if seen[i]:
+            continue
+        best, far = -1, i
+        while True:
+            dist = _bfs(adj, far)
+            ecc = max(dist)
+            if ecc <= best:
+                break
+            best, far = ecc, dist.index(ecc)
+        for j, d in enumerate(dist):
+            if d >= 0:
+                seen[j] = True
+        diameter = max(diameter, best)
+    return diameter
+
+# Hop limit that still reaches every tower: the first tower counts as
+# hop 1 and a tower only sends on what arrived below the limit
+def hop_limit(scn):
+    return backhaul_diameter(scn) + 2
+
+# Backhaul transmissions of one packet flooded from tower i with the hop
+# limit tx_attempts: every tower forwards on all links but the one the
+# packet came in on. Copies are counted per directed link and hop, so a
+# hop costs O(links) however many copies there are. Stops at limit.
+def _flood_copies(adj, i, tx_attempts, limit):
+    frontier = {(i, k): 1 for k in adj[i]} # directed link -> copies on it
+    total = len(frontier)
+    for _ in range(tx_attempts - 2):
+        if not frontier or total >= limit:
+            break
+        ahead = {}
+        for (a, b), copies in frontier.items():
+            for k in adj[b]:
+                if k != a:
+                    ahead[(b, k)] = ahead.get((b, k), 0) + copies
+        frontier = ahead
+        total += sum(frontier.values())
+    return min(total, limit)
+
+# Most backhaul copies one flooded packet makes, over a few sample towers
+# (n - 1 on a tree). Counting stops at limit.
+def flood_copies(scn, tx_attempts, limit, sources=FLOOD_SOURCES):
+    adj = _adjacency(scn)
+    n = scn.n_towers
+    picks = random.Random(0).sample(range(n), min(sources, n))
+    return max((_flood_copies(adj, i, tx_attempts, limit) for i in picks), default=0)
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Generate a large tower/UE layout as a scenario file.")
+    parser.add_argument("--sites", type=int, default=100, help="number of towers")
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="hex")
+    parser.add_argument("--spacing", type=float, default=SPACING, help="meters between neighboring sites")
+    parser.add_argument("--backhaul", choices=sorted(BACKHAULS), default="mst")
+    parser.add_argument("--neighbors", type=int, default=NEIGHBORS, help="nearest neighbors per site for mesh/mst")
+    parser.add_argument("--redundancy", type=float, default=0.0, help="extra mst links as a fraction of the tree")
+    parser.add_argument("--fanout", type=int, default=FANOUT, help="sites per hub for the hierarchical backhaul")
+    parser.add_argument("--ues", type=int, default=0, help="number of UEs")
+    parser.add_argument("--density", default="uniform", help=f"UE placement: {', '.join(DENSITIES)} or map:<path>")
+    parser.add_argument("--hotspots", type=int, default=HOTSPOTS, help="clusters for --density hotspots")
+    parser.add_argument("--traffic", default=None, help="traffic kind for every UE (e.g. poisson), none by default")
+    parser.add_argument("--rate", type=float, default=None, help="packets per timestep for poisson/on_off traffic")
+    parser.add_argument("--tx-attempts", type=int, default=None, help="hop limit for flooded packets (default: backhaul diameter + 2)")
+    parser.add_argument("--t-delta", type=float, default=T_DELTA)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="scenario file (.json, anything else is binary)")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    start = time.perf_counter()
+    scn = generate(args.sites, layout=args.layout, backhaul=args.backhaul, n_ues=args.ues, density=args.density,
+                   spacing=args.spacing, neighbors=args.neighbors, redundancy=args.redundancy, fanout=args.fanout,
+                   hotspots=args.hotspots, seed=args.seed, t_delta=args.t_delta)
+    if args.traffic is not None:
+        params = {"rate": args.rate} if args.rate is not None else {}
+        scn.add_traffic(args.traffic, seed=args.seed, **params)
+    scn.tx_attempts = args.tx_attempts if args.tx_attempts is not None else hop_limit(scn)
+    stats = backhaul_stats(scn)
+    if stats["cycles"]:
+        limit = FLOOD_FACTOR * scn.n_towers
+        copies = flood_copies(scn, scn.tx_attempts, limit)
+        if copies >= limit:
+            msg = (f"one flooded packet makes over {limit} backhaul copies ({stats['cycles']} cycles, hop limit "
+                   f"{scn.tx_attempts}), too many to simulate. Drop --redundancy, use --backhaul mst/hierarchical")
+            if args.tx_attempts is None:
+                print(f"error: {msg}, or force a hop limit with --tx-attempts.", file=sys.stderr)
+                return 1
+            print(f"warning: {msg}.", file=sys.stderr)
+    save_scenario(scn, args.out)
+    print(f"{args.out}: {stats['sites']} sites, {stats['links']} links (mean degree {stats['mean_degree']:.2f}, "
+          f"{stats['components']} component(s), {stats['cycles']} cycles, hop limit {scn.tx_attempts}), {scn.n_ues} UEs "
+          f"in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
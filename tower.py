@@ -1,6 +1,7 @@
 import random
 import math
 from collections import deque
+from events import EV_DROP_NOISE, EV_DROP_BUFFER, EV_DROP_TTL, EV_DROP_RATE, FLAG_RX, NO_PEER
 
 #Parameters
 # High band (mmWave)
@@ -34,7 +35,9 @@ class Tower:
         self.t_delta = t_delta
         self.max_data_rate = 10e9 # in bits-per-second per connected device (10G)
         self.n_tx_bytes = 0
+        self.n_tx_packets = 0 # packets taken from the buffer this step
         self.n_rx_bytes = 0
+        self.link_tx_bytes = {} # cumulative bytes forwarded to each neighbor (by IP)
         assert ip_addr is not None
         self.ip_addr     = ip_addr # can also take tower_id
         self.buffer      = deque([]) # Deque of how many bytes and where they are going to.
@@ -61,6 +64,18 @@ class Tower:
 
         self.verbose = verbose
         self.broadcast_ip = 65535
+        self.rng = None # own random.Random for the noise model (None = global RNG)
+        # If set, backhaul(self, tower, packet) is called instead of
+        # tower.receive(packet) when forwarding (Simulation deferred mode)
+        self.backhaul = None
+        # If set, capture(peer, packet, rx) sees every packet this tower
+        # sends (rx False) or accepts (rx True), see capture.py. peer is
+        # None when the packet comes in (it's in the packet).
+        self.capture = None
+        # If set, trace(event, packet, peer_ip) records the packets this
+        # tower drops. What it relays is logged per step from the counters
+        # (n_tx_packets, n_tx_bytes, buffer), see eventlog.py
+        self.trace = None
 
     # Determines the data rate for a given UE based on its distance from the tower
     def set_data_rate(self):
@@ -88,19 +103,25 @@ class Tower:
             if self.verbose:
                 print(f"IP_ADDR {int_to_ip(ue.ip_addr)}: Data rate == {ue.max_data_rate}")
 
-            # Update the data rate dictionaries
-            # ** I KNOW I AM SHARING A LOT OF VARIABLES 
-            # BETWEEN CLASSES! Its just easier to do it this way **
+        # Update the data rate dictionaries
+        # ** I KNOW I AM SHARING A LOT OF VARIABLES 
+        # BETWEEN CLASSES! Its just easier to do it this way **
 
-            # Keep track of the data rates of each UE
-            # if we have too much data to send to it, 
-            # dump it and rely on ARQ for RETX
-            self.ue_rates = {}
-            self.ue_tx_bits = {}
-            for ue in self.connected_ues:
-                ue_max_rate = ue.max_data_rate*self.t_delta*ue.code_rate
-                self.ue_rates[ue.ip_addr] = ue_max_rate
-                self.ue_tx_bits[ue.ip_addr] = 0
+        # Keep track of the data rates of each UE
+        # if we have too much data to send to it, 
+        # dump it and rely on ARQ for RETX
+        self.ue_rates = {}
+        self.ue_tx_bits = {}
+        for ue in self.connected_ues:
+            ue_max_rate = ue.max_data_rate*self.t_delta*ue.code_rate
+            self.ue_rates[ue.ip_addr] = ue_max_rate
+            self.ue_tx_bits[ue.ip_addr] = 0
+
+    # Cheaper version of set_data_rate for when only one UE's code rate
+    # changed (the shared rates of the others stay the same)
+    def update_ue_rate(self, ue):
+        if ue.ip_addr in self.ue_rates:
+            self.ue_rates[ue.ip_addr] = ue.max_data_rate*self.t_delta*ue.code_rate
 
     # Noisy dropout function that uses the code rate
     # set by the UE. The UE class has the same function
@@ -114,7 +135,7 @@ class Tower:
             base_loss = min(1.0, x * x)  # quadratic loss curve
             drop_prob = base_loss * ue.code_rate * 7e-2
             # End ChadGPT
-            return random.random() < drop_prob
+            return (self.rng or random).random() < drop_prob
 
     # Need src and dest IP addr here since we need to know where
     # the bytes come from and where they are going (the tower acts
@@ -127,14 +148,18 @@ class Tower:
     #       A return of False means the tower buffer was full
     def receive(self, packet):
         """
-        Packet BEFORE tower: 8 fields.
-        Tower adds field 8 = thru_ip.
+        Packet BEFORE tower: 9 fields from a UE, 10 from a tower.
+        Field 9 = thru_ip, the previous-hop tower (set by forward()).
+        A packet straight from a UE gets this tower's own IP, so it
+        goes out to every neighbor.
         """
 
         pkt_att = packet[7]
 
         # DROP packet if too many hops (TTL behavior)
         if pkt_att >= self.tx_attempts:
+            if self.trace is not None:
+                self.trace(EV_DROP_TTL | FLAG_RX, packet, packet[9] if len(packet) > 9 else packet[4])
             return False
 
         pkt_bytes = packet[3]
@@ -142,6 +167,8 @@ class Tower:
 
         # tower buffer overflow?
         if (self.n_rx_bytes * 8) + n_bits > self.buff_thresh:
+            if self.trace is not None:
+                self.trace(EV_DROP_BUFFER | FLAG_RX, packet, packet[9] if len(packet) > 9 else packet[4])
             return False
 
         self.n_rx_bytes += len(pkt_bytes)
@@ -152,13 +179,13 @@ class Tower:
         # increment tx_att (hop count)
         packet_copy[7] += 1
 
-        # add/update thru_ip
-        if len(packet_copy) == 8:
+        # add thru_ip (a forwarded packet already names the tower it came from)
+        if len(packet_copy) == 9:
             packet_copy.append(self.ip_addr)
-        else:
-            packet_copy[8] = self.ip_addr
 
         self.buffer.appendleft(packet_copy)
+        if self.capture is not None:
+            self.capture(None, packet, True)
         return True
 
 
@@ -166,7 +193,7 @@ class Tower:
     # to re-transmitting (routing) them.
     # Check if bytes need to be sent. Also check the data buffer to see 
     # where the bytes need to go.
-    # Packet format is: [t_step, packet_num, packet_type, n_bytes, src_ip, dest_ip, thru_ip, retx, tx_att]
+    # Packet format is: [t_step, packet_num, packet_type, n_bytes, src_ip, dest_ip, retx, tx_att, t_origin, thru_ip]
     def transmit(self, simulate_noise=False):
         """
         Take one packet from the tower buffer and either:
@@ -183,6 +210,7 @@ class Tower:
 
         # Get the oldest packet (right side of deque)
         packet = self.buffer.pop()
+        self.n_tx_packets += 1
 
         t_step     = packet[0]
         packet_num = packet[1]
@@ -192,13 +220,15 @@ class Tower:
         dest_ip    = packet[5]
         retx       = packet[6]
         tx_att     = packet[7]
-        thru_ip    = packet[8]   # previous-hop tower
+        thru_ip    = packet[9]   # previous-hop tower
 
         pkt_len  = len(pkt_bytes)
         pkt_bits = pkt_len * 8
 
         # Drop if hop-count / TTL exceeded
         if tx_att >= self.tx_attempts:
+            if self.trace is not None:
+                self.trace(EV_DROP_TTL, packet, NO_PEER)
             return
 
         # Remove these bytes from RX buffer
@@ -216,7 +246,9 @@ class Tower:
             for ue in self.connected_ues:
                 if ue.ip_addr == dest_ip:
                     # Strip tower-only fields before passing to UE
-                    clean = packet[:8]
+                    clean = packet[:9]
+                    if self.capture is not None:
+                        self.capture(ue, clean, False)
                     ue.receive(clean)
 
                     delivered = True
@@ -232,7 +264,7 @@ class Tower:
                     if tower.ip_addr == thru_ip:
                         continue
 
-                    tower.receive(packet)
+                    self.forward(tower, packet)
                     self.n_tx_bytes   += pkt_len
                     self.total_bit_tx += pkt_bits
 
@@ -257,12 +289,19 @@ class Tower:
                 if not self.noisy_dropout(ue, simulate_noise):
 
                     # Enforce per-UE throughput budget
-                    if self.ue_tx_bits[ue.ip_addr] + pkt_bits <= self.ue_rates[ue.ip_addr]:
-                        clean = packet[:8]
+                    if self.ue_tx_bits[ue.ip_addr] + pkt_bits > self.ue_rates[ue.ip_addr]:
+                        if self.trace is not None:
+                            self.trace(EV_DROP_RATE, packet, ue.ip_addr)
+                    else:
+                        clean = packet[:9]
+                        if self.capture is not None:
+                            self.capture(ue, clean, False)
                         ue.receive(clean)
                         self.ue_tx_bits[ue.ip_addr] += pkt_bits
 
                 else:
+                    if self.trace is not None:
+                        self.trace(EV_DROP_NOISE, packet, ue.ip_addr)
                     # Count bit errors if dropped by noise
                     self.bit_errors += pkt_bits * (ue.current_dist / ue.max_range) * 1e-2
 
@@ -281,12 +320,25 @@ class Tower:
                 if tower.ip_addr == thru_ip:
                     continue
 
-                tower.receive(packet)
+                self.forward(tower, packet)
                 self.n_tx_bytes   += pkt_len
                 self.total_bit_tx += pkt_bits
 
 
 
+    # Hand a packet to a neighbor tower over the backhaul. The packet
+    # leaves with this tower as its thru_ip, so the neighbor doesn't send
+    # it straight back (capture.py reads it as the peer of the receive).
+    def forward(self, tower, packet):
+        packet[9] = self.ip_addr
+        self.link_tx_bytes[tower.ip_addr] = self.link_tx_bytes.get(tower.ip_addr, 0) + len(packet[3])
+        if self.capture is not None:
+            self.capture(tower, packet, False)
+        if self.backhaul is not None:
+            self.backhaul(self, tower, packet)
+        else:
+            tower.receive(packet)
+
     # Continuously transmit data that is buffered until the 
     # data-rate limit has been reached
     def can_transmit(self):
@@ -308,9 +360,12 @@ class Tower:
 
     # Clear the tx byte counter after each step. This counter
     # is used to indicate whether or not the tower can transmit
-    # at its full capacity
+    # at its full capacity. The per-UE budgets restart every step too.
     def clear_tx_count(self):
         self.n_tx_bytes = 0
+        self.n_tx_packets = 0
+        for ip in self.ue_tx_bits:
+            self.ue_tx_bits[ip] = 0
 
     # Function to set a connection between two towers
     def connect_tower(self, tower):
@@ -0,0 +1,357 @@
+import random
+import math
+import heapq
+from collections.abc import Sequence
+
+# Per-UE traffic sources built from lazy iterator pipelines.
+#
+# An arrival process yields packet arrival times (in timesteps, floats).
+# Sized attaches a packet size to each arrival, PerStep merges all
+# arrivals that fall in the same timestep into one (t_step, n_bytes) item
+# and WithDest picks the destination IP. Nothing is generated until the
+# scheduler asks for the next arrival, so an idle source costs nothing.
+#
+# The stages are small iterator classes rather than generators: all of
+# their state (including the RNG) is plain attributes, so a checkpoint
+# pickles a source where it stands.
+#
+# TrafficScheduler keeps one heap entry per UE keyed by its next arrival,
+# so each step only touches the UEs that actually have data arriving.
+
+#Stage Class
+# Base of the pipeline stages: an iterator over its own items
+class Stage:
+    def __iter__(self):
+        return self
+
+# ----------------------------------------------------------------------
+# Arrival processes (yield arrival times in timesteps)
+# ----------------------------------------------------------------------
+# Poisson arrivals, rate packets per timestep
+class PoissonArrivals(Stage):
+    def __init__(self, rng, rate, t0=0.0):
+        self.rng = rng
+        self.rate = rate
+        self.t = t0
+
+    def __next__(self):
+        self.t += self.rng.expovariate(self.rate)
+        return self.t
+
+# Constant bit rate: one packet every interval timesteps
+class CbrArrivals(Stage):
+    def __init__(self, rng, interval, t0=0.0):
+        self.interval = interval
+        self.t = t0
+
+    def __next__(self):
+        self.t += self.interval
+        return self.t
+
+# On/off (bursty) source. ON and OFF periods are exponential with the given
+# means (timesteps); during ON packets arrive as a Poisson process.
+class OnOffArrivals(Stage):
+    def __init__(self, rng, rate, on_mean, off_mean, t0=0.0):
+        self.rng = rng
+        self.rate = rate
+        self.on_mean = on_mean
+        self.off_mean = off_mean
+        self.t = t0
+        self.on_end = None # end of the current ON period (None: in an OFF period)
+
+    def __next__(self):
+        rng = self.rng
+        while True:
+            if self.on_end is None:
+                self.on_end = self.t + rng.expovariate(1 / self.on_mean)
+            self.t += rng.expovariate(self.rate)
+            if self.t <= self.on_end:
+                return self.t
+            self.t = self.on_end + rng.expovariate(1 / self.off_mean)
+            self.on_end = None
+
+# ----------------------------------------------------------------------
+# Pipeline stages
+# ----------------------------------------------------------------------
+# Attach a packet size to each arrival. size is a fixed number of bytes or
+# a [lo, hi] pair for uniformly random sizes.
+class Sized(Stage):
+    def __init__(self, arrivals, rng, size):
+        self.arrivals = arrivals
+        self.rng = rng
+        self.size = size
+
+    def __next__(self):
+        t = next(self.arrivals)
+        if isinstance(self.size, (list, tuple)):
+            return t, self.rng.randint(*self.size)
+        return t, self.size
+
+# Merge everything that arrives in the same timestep (one set_tx_bytes call
+# per UE per step instead of one per packet)
+class PerStep(Stage):
+    def __init__(self, items):
+        self.items = items
+        self.cur_step = None
+        self.total = 0
+
+    def __next__(self):
+        for t, n_bytes in self.items:
+            step = int(math.floor(t))
+            if step != self.cur_step:
+                done = (self.cur_step, self.total)
+                self.cur_step = step
+                self.total = n_bytes
+                if done[0] is not None and done[1] > 0:
+                    return done
+            else:
+                self.total += n_bytes
+        done = (self.cur_step, self.total)
+        self.cur_step = None
+        if done[0] is not None and done[1] > 0:
+            return done
+        raise StopIteration
+
+# All IPs of a shared list except the one at index own, without copying
+# the list: index i maps to i, or i + 1 from own on. rng.choice() on it
+# draws from the n - 1 other IPs.
+class AllExcept(Sequence):
+    def __init__(self, ips, own):
+        self.ips = ips
+        self.own = own
+
+    def __len__(self):
+        return len(self.ips) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self.ips) - 1:
+            raise IndexError(i)
+        return self.ips[i + 1] if i >= self.own else self.ips[i]
+
+# Pick a destination IP for every item. dest is an IP or a list of IPs
+# (any sequence, e.g. AllExcept).
+class WithDest(Stage):
+    def __init__(self, items, rng, dest):
+        self.items = items
+        self.rng = rng
+        self.dest = dest
+
+    def __next__(self):
+        t, n_bytes = next(self.items)
+        if isinstance(self.dest, Sequence):
+            return t, n_bytes, self.rng.choice(self.dest)
+        return t, n_bytes, self.dest
+
+# Video frames: a big I-frame every gop frames and smaller P-frames in
+# between, all with lognormal size jitter
+class VideoFrames(Stage):
+    def __init__(self, arrivals, rng, gop, i_frame, p_frame, jitter):
+        self.arrivals = arrivals
+        self.rng = rng
+        self.gop = gop
+        self.i_frame = i_frame
+        self.p_frame = p_frame
+        self.jitter = jitter
+        self.n = 0
+
+    def __next__(self):
+        t = next(self.arrivals)
+        base = self.i_frame if self.n % self.gop == 0 else self.p_frame
+        self.n += 1
+        return t, max(1, int(base * self.rng.lognormvariate(0, self.jitter)))
+
+# Rows of a traffic trace CSV (t_step, src_ip, dest_ip, n_bytes) sent by
+# src_ip, as (t_step, n_bytes, dest_ip), or (t_step, n_bytes) without
+# with_dest. The file is streamed from a byte offset, so a checkpoint
+# only keeps the offset, not the open file.
+class TraceRows(Stage):
+    def __init__(self, path, src_ip, with_dest=True):
+        self.path = path
+        self.src_ip = src_ip
+        self.with_dest = with_dest
+        self.offset = None # None: header not read yet
+        self._file = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_file"] = None
+        return state
+
+    def __next__(self):
+        if self._file is None:
+            self._file = open(self.path, "rb")
+            if self.offset is None:
+                self._file.readline() # header
+            else:
+                self._file.seek(self.offset)
+        f = self._file
+        while True:
+            line = f.readline()
+            if not line:
+                f.close()
+                self._file = None
+                raise StopIteration
+            self.offset = f.tell()
+            r = line.split(b",")
+            if len(r) < 4 or int(r[1]) != self.src_ip:
+                continue
+            if self.with_dest:
+                return int(r[0]), int(r[3]), int(r[2])
+            return int(r[0]), int(r[3])
+
+# Merge trace rows in the same step that go to the same destination
+class MergedRows(Stage):
+    def __init__(self, rows):
+        self.rows = rows
+        self.cur = None
+
+    def __next__(self):
+        for t_step, n_bytes, dest_ip in self.rows:
+            cur = self.cur
+            if cur is not None and cur[0] == t_step and cur[2] == dest_ip:
+                cur[1] += n_bytes
+                continue
+            self.cur = [t_step, n_bytes, dest_ip]
+            if cur is not None:
+                return tuple(cur)
+        if self.cur is None:
+            raise StopIteration
+        cur, self.cur = self.cur, None
+        return tuple(cur)
+
+# ----------------------------------------------------------------------
+# Complete sources (yield (t_step, n_bytes, dest_ip))
+# ----------------------------------------------------------------------
+def poisson_source(rng, dest, rate=1.0, size=1500):
+    return WithDest(PerStep(Sized(PoissonArrivals(rng, rate), rng, size)), rng, dest)
+
+def cbr_source(rng, dest, interval=1.0, size=1500):
+    return WithDest(PerStep(Sized(CbrArrivals(rng, interval), rng, size)), rng, dest)
+
+def on_off_source(rng, dest, rate=5.0, on_mean=5.0, off_mean=10.0, size=1500):
+    return WithDest(PerStep(Sized(OnOffArrivals(rng, rate, on_mean, off_mean), rng, size)), rng, dest)
+
+# Video-like source: frames every frame_interval timesteps (see VideoFrames)
+def video_source(rng, dest, frame_interval=0.1, gop=12, i_frame=60000, p_frame=8000, jitter=0.3):
+    frames = VideoFrames(CbrArrivals(rng, frame_interval), rng, gop, i_frame, p_frame, jitter)
+    return WithDest(PerStep(frames), rng, dest)
+
+# Replay a recorded traffic trace. CSV columns: t_step, src_ip, dest_ip,
+# n_bytes (sorted by t_step). Only rows for src_ip are yielded. The file is
+# streamed, never loaded whole. With dest the packets go there (or to a
+# random IP of a dest list) instead of the recorded destination.
+def trace_source(rng, dest, path=None, src_ip=None):
+    if path is None:
+        raise ValueError("trace traffic needs a path (CSV of t_step, src_ip, dest_ip, n_bytes)")
+    if src_ip is None:
+        raise ValueError("trace traffic needs the src_ip of the UE to replay")
+    if dest is None:
+        return MergedRows(TraceRows(path, src_ip))
+    return WithDest(PerStep(TraceRows(path, src_ip, with_dest=False)), rng, dest)
+
+TRAFFIC_KINDS = {
+    "poisson" : poisson_source,
+    "cbr"     : cbr_source,
+    "on_off"  : on_off_source,
+    "video"   : video_source,
+    "trace"   : trace_source,
+}
+
+#Traffic Source Class
+# A source is described by (kind, dest, seed, params) so it can be
+# rebuilt from a scenario file. Each source has its own RNG, which keeps
+# runs reproducible no matter what order the UEs are stepped in. A source
+# without a seed draws one from the global RNG when it is created, so it
+# follows the simulation seed (random.seed()). start shifts the whole
+# source to begin at that timestep.
+class TrafficSource:
+    def __init__(self, kind, dest, seed=None, start=0, **params):
+        if kind not in TRAFFIC_KINDS:
+            raise ValueError(f"Unknown traffic kind {kind!r}. Choose from {sorted(TRAFFIC_KINDS)}")
+        self.kind = kind
+        self.dest = dest
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.start = start
+        self.params = params
+        self._gen = None # pipeline, built on the first arrival
+
+    def _make(self):
+        rng = random.Random(self.seed)
+        return TRAFFIC_KINDS[self.kind](rng, self.dest, **self.params)
+
+    # Next (t_step, n_bytes, dest_ip) or None when the source is exhausted
+    def next_arrival(self):
+        if self._gen is None:
+            self._gen = self._make()
+        item = next(self._gen, None)
+        if item is None:
+            return None
+        if self.start:
+            return item[0] + self.start, item[1], item[2]
+        return item
+
+#Traffic Scheduler Class
+class TrafficScheduler:
+    def __init__(self):
+        self.heap = []      # (t_step, seq, ue, source, n_bytes, dest_ip)
+        self.sources = {}   # ue -> current source (older heap entries are stale)
+        self.pending = {}   # ue -> (t_step, n_bytes, dest_ip) of its queued arrival
+        self._seq = 0       # tie breaker so the heap never compares UEs
+        self.n_arrivals = 0
+        self.n_bytes = 0
+
+    def _push(self, ue, source):
+        item = source.next_arrival()
+        if item is None:
+            return
+        self._queue(ue, source, item)
+
+    def _queue(self, ue, source, item):
+        t_step, n_bytes, dest_ip = item
+        heapq.heappush(self.heap, (t_step, self._seq, ue, source, n_bytes, dest_ip))
+        self._seq += 1
+        self.pending[ue] = item
+
+    # Attach (or replace) the traffic source of a UE
+    def set_source(self, ue, source):
+        self.sources[ue] = source
+        self._push(ue, source)
+
+    def remove(self, ue):
+        self.sources.pop(ue, None)
+        self.pending.pop(ue, None)
+
+    # Detach a UE's source together with its already drawn next arrival
+    # (to move the UE to another scheduler, see put())
+    def take(self, ue):
+        return self.sources.pop(ue, None), self.pending.pop(ue, None)
+
+    def put(self, ue, source, item):
+        if source is None:
+            return
+        self.sources[ue] = source
+        if item is not None:
+            self._queue(ue, source, item)
+
+    # Time of the next arrival of any UE (None if nothing is scheduled)
+    def next_time(self):
+        while self.heap:
+            t_step, _, ue, source = self.heap[0][:4]
+            if self.sources.get(ue) is source:
+                return t_step
+            heapq.heappop(self.heap) # stale entry
+        return None
+
+    # Hand every arrival due at or before t_step to its UE
+    def step(self, t_step):
+        heap = self.heap
+        sources = self.sources
+        while heap and heap[0][0] <= t_step:
+            _, _, ue, source, n_bytes, dest_ip = heapq.heappop(heap)
+            if sources.get(ue) is not source:
+                continue # source was replaced/removed
+            del self.pending[ue]
+            ue.set_tx_bytes(n_bytes, dest_ip)
+            self.n_arrivals += 1
+            self.n_bytes += n_bytes
+            self._push(ue, source)
@@ -1,15 +1,19 @@
 import random
 import math
-import time
 from collections import deque
 from tower import Tower
 from ue import UE
+from radio import RadioModel
+from mobility import make_mobility
+from traffic import TrafficSource, TrafficScheduler
+from engine import Simulation, EventEngine
+from metrics import default_registry, ConsoleReport
 
 # Notes:
 #       - We need to define how large an ethernet frame is in bytes (1518 bytes max?)
 
 
-def run_env_main(t_delta, verbose=False):
+def run_env_main(t_delta, verbose=False, link_model="distance", mobility=None, traffic=None, realtime=False, n_steps=None, console=True, metrics_out=None):
     # Need some dynamic allocation of IP addresses. For now just use the for loop iterator.
     # We can say that the first 50 IP addresses are for towers and the rest are for UEs.
     towers = [Tower(i, random.uniform(0, 1500), random.uniform(-100, 100), t_delta=t_delta, ip_addr=i, verbose=verbose) for i in range(3)]  # 3 towers in a line
@@ -34,7 +38,6 @@ def run_env_main(t_delta, verbose=False):
         tower.tx_attempts = n_towers
 
     t_count = 0
-    t_step  = 0
     src_ue  = random.randint(0, 4)
     dest_ip = random.randint(50, 54)
 
@@ -44,90 +47,90 @@ def run_env_main(t_delta, verbose=False):
     towers[2].connect_tower(towers[1])
     # towers[2].connect_tower(towers[0])
 
-    while 1:
-        # Make sure all timesteps are the same
+    # Optional SINR link model (path loss + inter-cell interference).
+    # With "distance" the UEs keep the band/distance code rate table.
+    radio = None
+    if link_model == "sinr":
+        radio = RadioModel(towers)
+
+    # Optional batched mobility model ("random_waypoint", "gauss_markov",
+    # "manhattan") or a recorded trace ("trace:<path to csv/bin>")
+    mobility_model = None
+    if mobility is not None:
+        mobility_model = make_mobility(mobility, ues, seed=random.random())
+
+    # if t_count % 10 == 0: # wait to tx data every 10 timeouts (5 seconds in our case)
+        # while (random.random() < 0.25): # 75% chance of sending more data
+    # Example 0: Test transmitting only a single UE at a time
+    # ues[src_ue].set_tx_bytes(n_bytes=random.randint(1, 1518), dest_ip=dest_ip)
+    # src_ue  = random.randint(0, 4)
+    # Example 1: Test transmitting from all UEs at once
+    if traffic is None:
+        scheduler = RandomTraffic(ues, dest_ip)
+    # Example 6: Pluggable traffic generators ("poisson", "cbr", "on_off", "video").
+    # Every UE sends to random UEs; the scheduler only calls into UEs that
+    # have an arrival this step. "trace:<path to csv>" replays the rows of
+    # each UE's IP to their recorded destinations.
+    elif traffic.startswith("trace:"):
+        scheduler = TrafficScheduler()
+        path = traffic[len("trace:"):]
         for ue in ues:
-            ue.t_step = t_step
-
-        # if t_count % 10 == 0: # wait to tx data every 10 timeouts (5 seconds in our case)
-            # while (random.random() < 0.25): # 75% chance of sending more data
-        # Example 0: Test transmitting only a single UE at a time
-        # ues[src_ue].set_tx_bytes(n_bytes=random.randint(1, 1518), dest_ip=dest_ip)
-        # src_ue  = random.randint(0, 4)
-        # Example 1: Test transmitting from all UEs at once
+            scheduler.set_source(ue, TrafficSource("trace", None, path=path, src_ip=ue.ip_addr))
+    else:
+        scheduler = TrafficScheduler()
+        ue_ips = [ue.ip_addr for ue in ues]
         for ue in ues:
-            ue.set_tx_bytes(n_bytes=random.randint(1, 1518), dest_ip=dest_ip)
+            scheduler.set_source(ue, TrafficSource(traffic, ue_ips, seed=random.random()))
+
+    sim = Simulation(towers, ues, t_delta, radio=radio, mobility=mobility_model, traffic=scheduler)
+
+    # Example 2: Data rates
+    # Every step goes into the metrics registry (see metrics.py). Printing
+    # the actual and max data rate of each device is one consumer of it,
+    # metrics_out (.csv or .npz) gets all of the kept samples at the end.
+    registry = default_registry(towers, ues)
+    sim.observers.append(registry)
+    if console:
+        registry.consumers.append(ConsoleReport())
+
+    # Steps, outages and mobility are events. The engine runs as fast as it
+    # can unless realtime=True (the demo below) paces it to t_delta per step.
+    engine = EventEngine(sim, realtime=realtime)
+
+    # Test tower shut-downs
+    # EXAMPLE 3: Disable the first tower for steps 10-19
+    # engine.schedule_outage(towers[0], start=10, duration=10)
+
+    # EXAMPLE 4: Disable all towers temporarily and see if UEs can buffer data
+    #           without dropping any packets
+    # for tower in towers:
+        # engine.schedule_outage(tower, start=7, duration=2)
+
+    # Example 5: Move UEs (see the mobility argument)
+
+    engine.run(n_steps)
+    if metrics_out is not None:
+        registry.export(metrics_out)
+
+
+# Example 1 traffic: every UE sends a random sized packet to a random UE
+# every timestep
+class RandomTraffic:
+    def __init__(self, ues, dest_ip):
+        self.ues = ues
+        self.dest_ip = dest_ip
+        self.next_step = 0
+
+    def step(self, t_step):
+        for ue in self.ues:
+            ue.set_tx_bytes(n_bytes=random.randint(1, 1518), dest_ip=self.dest_ip)
             # ue.set_tx_bytes(n_bytes=int(ue.max_data_rate - 1), dest_ip=dest_ip)
-            dest_ip = random.randint(50, 54)
+            self.dest_ip = random.randint(50, 54)
+        self.next_step = t_step + 1
 
-        # Step through the calculations
-        for ue in ues:
-            ue.step()
-
-        can_tx = True 
-        tx_count = 0
-        while can_tx:
-            can_tx = False
-            for tower in towers:
-                if tower.can_transmit():
-                    can_tx = True
-                    tower.step()
-                    tx_count += 1
-
-        # Example 2: Printing data rates
-        # Print actual data rate and max data rate of each device
-        for tower in towers:
-            print(f"Tower IP_ADDR {tower.ip_addr}: Data rate = {tower.n_tx_bytes * 8 * 1e-6} Mbps, Max data rate = {tower.max_data_rate * 1e-6} Mbps")
-
-        for ue in ues:
-            if ue.current_tower is not None:
-                print(f"UE IP_ADDR {ue.ip_addr}: Tower IP_ADDR = {ue.current_tower.ip_addr} Band = {ue.freq_band}, Code rate = {ue.code_rate}, Data rate = {ue.n_tx_bytes * 8 * 1e-6} Mbps, Max data rate = {ue.max_data_rate * 1e-6} Mbps")
-
-        # Clear the transmission counter per timestep
-        # Clearning for towers is NECESSARY!
-        # this is so that we can run the while can_tx loop 
-        # until the towers reach the max data rate
-        for tower in towers:
-            tower.clear_tx_count()
-        for ue in ues:
-            ue.clear_tx_count()
-
-        # Test tower shut-downs
-        # EXAMPLE 3: Start by disabling the first UEs tower
-        # if t_step % 20 == 10:
-            # print(f"Tower IP_ADDR {ues[0].current_tower.ip_addr}: Simulating Outage")
-            # disabled_twr = ues[0].current_tower
-            # if disabled_twr is not None:
-                # towers.remove(disabled_twr)
-                # for ue in ues:
-                    # ue.update_towers(towers)
-        # elif t_step % 20 == 19:
-            # print(f"Tower IP_ADDR {ues[0].current_tower.ip_addr}: Recovered Functionality")
-            # towers.append(disabled_twr)
-            # for ue in ues:
-                # ue.update_towers(towers)
-
-        # EXAMPLE 4: Disable all towers temporarily and see if UEs can buffer data
-        #           without dropping any packets
-        # if t_step % 10 == 7:
-            # print(f"ALL Towers: Simulating Outage")
-            # if towers is not None:
-                # for ue in ues:
-                    # ue.update_towers([])
-        # elif t_step % 10 == 9:
-            # for ue in ues:
-                # ue.update_towers(towers)
-            # print(f"ALL Towers: Recovered Functionality")
-
-
-        # Example 5: Move UE 0
-        # for ue in ues:
-            # ue.move()
-            # print(f"UE IP_ADDR {ue.ip_addr} Position: x = {ue.x_pos}, y = {ue.y_pos}")
-
-        time.sleep(t_delta)
-        print(f"Timestep {t_step}: Completed.")
-        t_step += 1
+    # Always something to send next step
+    def next_time(self):
+        return self.next_step
 
 if __name__ == "__main__":
     # Create the simpy environment
@@ -137,4 +140,4 @@ if __name__ == "__main__":
     
     # Was running simpy before, but system sleeps is better
 
-    run_env_main(t_delta)
+    run_env_main(t_delta, realtime=True)
@@ -1,6 +1,9 @@
 import random
 import math
 from collections import deque
+from events import (EV_ENQUEUE, EV_TRANSMIT, EV_DELIVER, EV_ACK, EV_DROP_NOISE,
+                    EV_DROP_BUFFER, EV_DROP_RETX, FLAG_RX, NO_PEER)
+from radio import sinr_to_code_rate
 
 def int_to_ip(x):
     return f"{(x >> 24) & 0xFF}.{(x >> 16) & 0xFF}.{(x >> 8) & 0xFF}.{x & 0xFF}"
@@ -29,6 +32,13 @@ MID_BAND_RANGE = 1500 #meters
 # Low band (sub-1 GHz)
 LOW_BAND_RANGE = 5000 #meters
 
+# HANDOVER Parameters (A3 event)
+HO_OFFSET         = 3.0  # dB the neighbor must beat the serving tower by
+HO_TTT            = 2    # time-to-trigger in timesteps
+HO_INTERRUPTION   = 0.05 # seconds without user data after a handover
+HO_PING_PONG_WIN  = 10   # handing back within this many timesteps is a ping-pong
+HO_PATH_LOSS_EXP  = 3.0  # path loss exponent used to compare towers
+
 #Distance helper function
 def distance(a, b):
     return math.sqrt((a.x_pos - b.x_pos)**2 + (a.y_pos - b.y_pos)**2)
@@ -96,6 +106,37 @@ class UE:
                      # this gets incremented if there is a simulated dropout from noise
         self.total_bit_tx = 1 # Cumulative transmitted bits
         self.bit_errors = 0 # Cumulative bit-error count per timestep
+        self.n_acked   = 0 # Cumulative data packets ACKed by the receiver
+        self.n_dropped = 0 # Cumulative data packets dropped after MAX RETX
+        self.radio = None # Optional radio.RadioModel. If set, the code rate comes from SINR
+        self.rng   = None # own random.Random for the noise model (None = global RNG)
+        # If set, defer_attach(self, tower, band, max_range) is called instead
+        # of attaching right away after a handover decision (Simulation deferred mode)
+        self.defer_attach = None
+        # If set, capture(peer, packet, rx) sees every packet this UE sends
+        # (rx False) or receives (rx True), see capture.py
+        self.capture = None
+        # If set, trace(event, packet, peer_ip) records every packet event
+        # of this UE, see eventlog.py
+        self.trace = None
+        # If set, latency(self, packet, acked) is called for every data
+        # packet delivered to this UE (acked False) and for every packet of
+        # this UE that got ACKed (acked True), see latency.py
+        self.latency = None
+        self.sinr  = None # Last SINR (dB) on the current tower (only with a radio model)
+        # Handover (A3 + time-to-trigger) state and counters
+        self.ho_offset         = HO_OFFSET
+        self.ho_ttt            = HO_TTT
+        self.ho_interruption   = HO_INTERRUPTION
+        self.ping_pong_window  = HO_PING_PONG_WIN
+        self.ho_candidate      = None # neighbor currently satisfying A3
+        self.ho_ttt_count      = 0    # consecutive steps the candidate satisfied A3
+        self.ho_prev_tower     = None # tower we handed over from last time
+        self.ho_last_step      = 0    # t_step of the last handover
+        self.ho_interrupt_left = 0    # seconds of handover interruption left
+        self.n_handovers       = 0
+        self.n_ping_pongs      = 0
+        self.ho_interrupt_time = 0    # cumulative seconds lost to handover interruption
 
     # Function to calculate the distances between the UE and all towers.
     # Run this function every timestep
@@ -109,35 +150,92 @@ class UE:
         self.towers   = towers
         self.n_towers = len(towers)
         if self.n_towers == 0:
-            if self.current_tower is not None:
-                # remove the ue from the band
-                self.current_tower.n_bands[self.freq_band] -= 1
-                self.current_tower.connected_ues.remove(self)
-            self.freq_band = None
-            self.current_tower = None
-            self.max_data_rate = 0
+            # remove the ue from the band
+            self._detach()
+
+    # Detach from the current tower (if any) and give the tower a chance to
+    # re-share its rate between the UEs that are left
+    def _detach(self):
+        tower = self.current_tower
+        if tower is not None and self.freq_band is not None:
+            if self in tower.connected_ues:
+                tower.connected_ues.remove(self)
+            if self.freq_band in tower.n_bands:
+                tower.n_bands[self.freq_band] = max(
+                    0, tower.n_bands[self.freq_band] - 1
+                )
+            tower.set_data_rate()
+        self.current_tower = None
+        self.freq_band = None
+        self.max_range = 0
+        self.max_data_rate = 0
+        self.ho_candidate = None
+        self.ho_ttt_count = 0
+
+    # A3 event check: is the best neighbor better than the serving tower by
+    # more than ho_offset (dB) for ho_ttt consecutive steps? Signal strength
+    # is compared through the log-distance path loss, so the difference
+    # is 10*n*log10(d_serving / d_neighbor).
+    def _a3_triggered(self, best_tower, best_dist, serv_dist):
+        serv_dist = max(serv_dist, 1.0)
+        best_dist = max(best_dist, 1.0)
+        delta_db = 10 * HO_PATH_LOSS_EXP * math.log10(serv_dist / best_dist)
+        if delta_db <= self.ho_offset:
+            self.ho_candidate = None
+            self.ho_ttt_count = 0
+            return False
+
+        if self.ho_candidate is best_tower:
+            self.ho_ttt_count += 1
+        else:
+            self.ho_candidate = best_tower
+            self.ho_ttt_count = 1
+        return self.ho_ttt_count >= self.ho_ttt
+
+    # Attach to a tower on the given band
+    def attach(self, tower, band, max_range):
+        self.current_tower = tower
+        self.freq_band = band
+        self.max_range = max_range
+
+        if self.freq_band in self.current_tower.n_bands:
+            self.current_tower.n_bands[self.freq_band] += 1
+        else:
+            self.current_tower.n_bands[self.freq_band] = 1
+
+        if self not in self.current_tower.connected_ues:
+            self.current_tower.connected_ues.append(self)
+
+        self.current_tower.set_data_rate()
 
     def connect_to_best_tower(self):
         # No towers available at all
         if self.n_towers == 0 or len(self.towers) == 0:
-            if self.current_tower is not None and self.freq_band is not None:
-                # Safely detach from current tower
-                if self in self.current_tower.connected_ues:
-                    self.current_tower.connected_ues.remove(self)
-                if self.freq_band in self.current_tower.n_bands:
-                    self.current_tower.n_bands[self.freq_band] = max(
-                        0, self.current_tower.n_bands[self.freq_band] - 1
-                    )
-            self.current_tower = None
-            self.freq_band = None
-            self.max_range = 0
-            self.max_data_rate = 0
+            self._detach()
             return
 
         # Distance from best tower
         min_dist = min(self.distances)
         best_tower_idx = self.distances.index(min_dist)
         best_tower = self.towers[best_tower_idx]
+
+        # Handover hysteresis: only leave a serving tower that is still
+        # available and in range once the A3 condition has held for the
+        # time-to-trigger. Otherwise stay put.
+        if self.current_tower is not None and self.current_tower is not best_tower:
+            try:
+                serv_idx = self.towers.index(self.current_tower)
+            except ValueError:
+                serv_idx = None # serving tower went away -> attach to best now
+            if serv_idx is not None and self.distances[serv_idx] <= LOW_BAND_RANGE:
+                serv_dist = self.distances[serv_idx]
+                if not self._a3_triggered(best_tower, min_dist, serv_dist):
+                    best_tower = self.current_tower
+                    min_dist = serv_dist
+        else:
+            self.ho_candidate = None
+            self.ho_ttt_count = 0
+
         self.current_dist = min_dist
 
         # Helper to choose band + max_range
@@ -151,48 +249,39 @@ class UE:
             else:
                 return None, 0
 
-        # If the current tower is not the best tower → possible handover
+        # If the current tower is not the best tower → handover
         if self.current_tower != best_tower:
-            # Detach from current tower if any
-            if self.current_tower is not None and self.freq_band is not None:
-                if self in self.current_tower.connected_ues:
-                    self.current_tower.connected_ues.remove(self)
-                if self.freq_band in self.current_tower.n_bands:
-                    self.current_tower.n_bands[self.freq_band] = max(
-                        0, self.current_tower.n_bands[self.freq_band] - 1
-                    )
+            prev_tower = self.current_tower
 
             new_band, new_range = select_band(min_dist)
 
             if new_band is None:
                 # Out of range of all bands
-                if self.current_tower is not None:
-                    print(f"UE {int_to_ip(self.ip_addr)}: Lost connection to Tower {int_to_ip(self.current_tower.ip_addr)}")
-                self.current_tower = None
-                self.freq_band = None
-                self.max_range = 0
-                self.max_data_rate = 0
+                if prev_tower is not None:
+                    print(f"UE {int_to_ip(self.ip_addr)}: Lost connection to Tower {int_to_ip(prev_tower.ip_addr)}")
+                self._detach()
                 return
 
+            # Detach from current tower if any
+            self._detach()
+
             # Attach to new/best tower
-            if self.current_tower is not None:
-                print(f"UE {self.ue_id} handover from Tower {self.current_tower.tower_id} to {best_tower.tower_id}")
+            if prev_tower is not None:
+                print(f"UE {self.ue_id} handover from Tower {prev_tower.tower_id} to {best_tower.tower_id}")
+                # Handover accounting
+                self.n_handovers += 1
+                if best_tower is self.ho_prev_tower and self.t_step - self.ho_last_step <= self.ping_pong_window:
+                    self.n_ping_pongs += 1
+                self.ho_prev_tower = prev_tower
+                self.ho_last_step = self.t_step
+                self.ho_interrupt_left = self.ho_interruption
             else:
                 print(f"UE {self.ue_id} initially connecting to Tower {best_tower.tower_id}")
 
-            self.current_tower = best_tower
-            self.freq_band = new_band
-            self.max_range = new_range
-
-            if self.freq_band in self.current_tower.n_bands:
-                self.current_tower.n_bands[self.freq_band] += 1
+            if self.defer_attach is not None:
+                self.defer_attach(self, best_tower, new_band, new_range)
             else:
-                self.current_tower.n_bands[self.freq_band] = 1
-
-            if self not in self.current_tower.connected_ues:
-                self.current_tower.connected_ues.append(self)
-
-            self.current_tower.set_data_rate()
+                self.attach(best_tower, new_band, new_range)
             return
 
         # If the current tower is already the best tower
@@ -210,22 +299,13 @@ class UE:
             self.max_range = LOW_BAND_RANGE
         else:
             # Out of range → detach
-            if self.current_tower is not None and self.freq_band is not None:
-                if self in self.current_tower.connected_ues:
-                    self.current_tower.connected_ues.remove(self)
-                if self.freq_band in self.current_tower.n_bands:
-                    self.current_tower.n_bands[self.freq_band] = max(
-                        0, self.current_tower.n_bands[self.freq_band] - 1
-                    )
-                print(f"UE {int_to_ip(self.ip_addr)}: Lost connection to Tower {int_to_ip(self.current_tower.ip_addr)}")
-            self.current_tower = None
-            self.freq_band = None
-            self.max_range = 0
-            self.max_data_rate = 0
+            print(f"UE {int_to_ip(self.ip_addr)}: Lost connection to Tower {int_to_ip(self.current_tower.ip_addr)}")
+            self._detach()
             return
 
-        # Still on same tower, but band may have changed
-        if self.current_tower is not None and prev_freq != self.freq_band:
+        # Still on same tower, but band may have changed. Only then do the
+        # tower's shared rates need to be rebuilt.
+        if prev_freq != self.freq_band:
             if prev_freq in self.current_tower.n_bands:
                 self.current_tower.n_bands[prev_freq] = max(
                     0, self.current_tower.n_bands[prev_freq] - 1
@@ -234,20 +314,37 @@ class UE:
                 self.current_tower.n_bands[self.freq_band] += 1
             else:
                 self.current_tower.n_bands[self.freq_band] = 1
-
-        if self.current_tower is not None:
             self.current_tower.set_data_rate()
-        else:
-            self.max_data_rate = 0
 
 
-    # Test moving the UEs in and out of coverage
-    def move(self):
-        self.x_pos = random.uniform(-3000, 3000)
-        self.y_pos = random.uniform(-3000, 3000)
+    # Random walk: keep heading in the same direction (dx, dy per step) for
+    # a random number of steps, then pick a new heading. For moving many UEs
+    # at once use the batched models in mobility.py instead.
+    def move(self, speed=10.0, max_steps=20):
+        if self.steps_in_current_direction <= 0:
+            heading = random.uniform(0, 2 * math.pi)
+            self.dx = speed * self.t_delta * math.cos(heading)
+            self.dy = speed * self.t_delta * math.sin(heading)
+            self.steps_in_current_direction = random.randint(1, max_steps)
+        self.x_pos += self.dx
+        self.y_pos += self.dy
+        self.steps_in_current_direction -= 1
         # print(f"Distance from (0,0): {math.sqrt((self.x_pos)**2 + (self.y_pos)**2)}")
 
     def set_code_rate(self):
+        prev_rate = self.code_rate
+        self._select_code_rate()
+        # Only this UE's budget on the tower depends on its code rate
+        if self.current_tower is not None and self.code_rate != prev_rate:
+            self.current_tower.update_ue_rate(self)
+
+    def _select_code_rate(self):
+        if self.current_tower is not None and self.radio is not None:
+            # SINR-based MCS selection (includes inter-cell interference)
+            self.sinr = self.radio.sinr_db(self)
+            if self.sinr is not None:
+                self.code_rate = sinr_to_code_rate(self.sinr)
+                return
         if self.current_tower is not None:
             # This ratio will be used to set the different LDPC code rates
             ratio = self.current_dist / self.max_range
@@ -260,6 +357,7 @@ class UE:
                 self.code_rate = 0.5
         else:
             self.code_rate = 0.9
+            self.sinr = None
 
     def noisy_dropout(self, simulate_noise=False):
         if not simulate_noise:
@@ -271,7 +369,7 @@ class UE:
                 base_loss = min(1.0, x * x)  # quadratic loss curve
                 drop_prob = base_loss * self.code_rate * 7e-2
                 # End ChadGPT
-                return random.random() < drop_prob
+                return (self.rng or random).random() < drop_prob
             # Don't really need this here but
             # include for sake of completion
             else:
@@ -442,19 +540,24 @@ class UE:
                     self.ip_addr,          # src
                     dest_ip,               # dest
                     0,                     # retx counter
-                    0                      # tx_att
+                    0,                     # tx_att
+                    self.t_step,           # origin timestep (never changes)
                 ]
 
                 # --------------------------------------------------
                 # FIFO QUEUE FIX ← append to END, not appendleft
                 # --------------------------------------------------
                 self.buffer.append(pkt)
+                if self.trace is not None:
+                    self.trace(EV_ENQUEUE, pkt, NO_PEER)
 
                 self.n_tx_bits += packet_bits
                 self.packet_num += 1
 
             else:
                 print(f"UE {int_to_ip(self.ip_addr)}: BUFFER FULL while adding fragments")
+                if self.trace is not None:
+                    self.trace(EV_DROP_BUFFER, [self.t_step, self.packet_num, 1, packet_bytes, self.ip_addr, dest_ip, 0, 0, self.t_step], NO_PEER)
                 break
 
             offset += frag_size
@@ -472,10 +575,18 @@ class UE:
         - Sends ONLY the oldest packet once per timestep.
         - Packet stays in buffer until ACK or MAX RETX.
         - ARQ timeout and MAX RETX work again.
+        Returns True if a packet went on the air (even if noise lost it).
         """
 
         self.tx_bytes_step = 0
 
+        # Handover interruption: no user data for part of this step
+        blocked = 0
+        if self.ho_interrupt_left > 0:
+            blocked = min(self.ho_interrupt_left, self.t_delta)
+            self.ho_interrupt_left -= blocked
+            self.ho_interrupt_time += blocked
+
         # No packets → nothing to do
         if len(self.buffer) == 0:
             return
@@ -507,6 +618,9 @@ class UE:
                 if oldest[6] > self.arq_retx:
                     dropped = self.buffer.popleft()
                     self.n_tx_bits -= len(dropped[3]) * 8
+                    self.n_dropped += 1
+                    if self.trace is not None:
+                        self.trace(EV_DROP_RETX, dropped, NO_PEER)
 
                     if self.verbose:
                         print(f"UE IP_ADDR {int_to_ip(self.ip_addr)}: MAX RETX REACHED. Dropped packet {packet_num}.")
@@ -522,14 +636,22 @@ class UE:
         # 3) SEND ONLY THE OLDEST PACKET ONCE (NO DUPLICATES)
         # --------------------------------------------------------
         bit_budget = self.max_data_rate * self.t_delta * self.code_rate
+        if blocked > 0:
+            bit_budget *= 1 - blocked / self.t_delta
 
         # Enough throughput to send it?
         if pkt_bits <= bit_budget:
 
             # Try sending it
             if not self.noisy_dropout(simulate_noise):
+                if self.trace is not None:
+                    self.trace(EV_TRANSMIT, oldest, self.current_tower.ip_addr)
+                if self.capture is not None:
+                    self.capture(self.current_tower, oldest, False)
                 self.current_tower.receive(oldest)  # oldest stays in buffer
             else:
+                if self.trace is not None:
+                    self.trace(EV_DROP_NOISE, oldest, self.current_tower.ip_addr)
                 if self.max_range > 0:
                     self.bit_errors += pkt_bits * (self.current_dist/self.max_range) * 1e-2
 
@@ -537,15 +659,16 @@ class UE:
             self.tx_bytes_step += pkt_len
             self.n_tx_bytes    += pkt_len
             self.total_bit_tx  += pkt_bits
+            return True
 
 
     # Need to check for received bytes
     # If ARQ is enabled, we need to handle ACKs
-    # Packet format is: [t_step, packet_num, packet_type, n_bytes, src_ip, dest_ip, retx]
+    # Packet format is: [t_step, packet_num, packet_type, n_bytes, src_ip, dest_ip, retx, tx_att, t_origin]
     def receive(self, packet):
         """
         Clean, correct ACK + DATA processing for the NEW packet format:
-        [t_step, packet_num, packet_type, pkt_bytes, src_ip, dest_ip, retx, tx_att]
+        [t_step, packet_num, packet_type, pkt_bytes, src_ip, dest_ip, retx, tx_att, t_origin]
 
         Fixes:
         - Repeated ACK storms
@@ -563,6 +686,11 @@ class UE:
 
         n_bytes = len(pkt_bytes)
 
+        if self.trace is not None:
+            self.trace(EV_DELIVER | FLAG_RX, packet, self.current_tower.ip_addr if self.current_tower is not None else NO_PEER)
+        if self.capture is not None:
+            self.capture(self.current_tower, packet, True)
+
         # ----------------------------
         # PRINT (unchanged)
         # ----------------------------
@@ -575,6 +703,8 @@ class UE:
         # DATA PACKET RECEIVED → SEND ACK
         # ----------------------------
         if packet_type == 1:  # DATA
+            if self.latency is not None:
+                self.latency(self, packet, False)
 
             # Build 1-byte ack payload
             ack_payload = b'\x00'
@@ -605,11 +735,16 @@ class UE:
                 self.ip_addr,     # src
                 src_ip,           # dest
                 retx,             # carry-through retx (legacy behavior)
-                0                 # tx_att
+                0,                # tx_att
+                self.t_step,      # origin timestep
             ]
 
             # ACK must be sent even if tower not connected (old behavior)
             if self.current_tower is not None:
+                if self.trace is not None:
+                    self.trace(EV_TRANSMIT, ack_packet, self.current_tower.ip_addr)
+                if self.capture is not None:
+                    self.capture(self.current_tower, ack_packet, False)
                 self.current_tower.receive(ack_packet)
                 self.tx_bytes_step += len(ack_bytes)
 
@@ -629,6 +764,11 @@ class UE:
                     removed = self.buffer[i]
                     del self.buffer[i]          # <-- SAFE: deque supports indexed delete
                     self.n_tx_bits -= len(removed[3]) * 8
+                    self.n_acked += 1
+                    if self.trace is not None:
+                        self.trace(EV_ACK | FLAG_RX, removed, NO_PEER)
+                    if self.latency is not None:
+                        self.latency(self, removed, True)
 
                     if self.verbose:
                         print(f"UE IP_ADDR {int_to_ip(self.ip_addr)}: Received ACK. Dropped packet {pkt_num}.")
@@ -649,12 +789,13 @@ class UE:
 
     # Step through each function you want to be performed
     # at each and every timestep
+    # Returns True if a packet was transmitted (see transmit())
     def step(self, simulate_noise=False):
         # ALWAYS advance ARQ time
         self.t_step += 1
 
         # ALWAYS run ARQ + transmit logic
-        self.transmit(simulate_noise)
+        sent = self.transmit(simulate_noise)
 
         # Only run tower logic if towers exist
         if self.n_towers > 0:
@@ -665,4 +806,22 @@ class UE:
         # BER update
         if self.total_bit_tx > 0:
             self.ber = self.bit_errors / self.total_bit_tx
-
+        return sent
+
+
+# Handover KPIs over a set of UEs. sim_time is the simulated time in
+# seconds the counters were accumulated over.
+def handover_metrics(ues, sim_time):
+    n_ues = len(ues)
+    n_ho = sum(ue.n_handovers for ue in ues)
+    n_pp = sum(ue.n_ping_pongs for ue in ues)
+    interrupt = sum(ue.ho_interrupt_time for ue in ues)
+    ue_time = n_ues * sim_time
+    return {
+        "handovers"          : n_ho,
+        "ping_pongs"         : n_pp,
+        "handover_rate"      : n_ho / ue_time if ue_time > 0 else 0.0, # per UE per second
+        "ping_pong_rate"     : n_pp / n_ho if n_ho > 0 else 0.0,       # fraction of handovers
+        "interruption_time"  : interrupt,
+        "interruption_ratio" : interrupt / ue_time if ue_time > 0 else 0.0,
+    }